@@ -134,11 +134,39 @@ def bytecode(value):
 	value = ('0' * (len(value) % 2)) + value
 	return value
 
-class Program():
+class Label():
+	""" Symbolic reference to a position in a Program, resolved when the program is assembled """
+	__slots__ = ("name",)
+
+	def __init__(self, name):
+		self.name = name
+
+	def __repr__(self):
+		return "Label(%r)" % self.name
+
 
-	def __init__(self):
-		self.compiled = []
-		self.ops = []
+def _bytes(value):
+	return bytes.fromhex(bytecode(value))
+
+
+class Program():
+	"""
+	Assembles bytecode into a bytearray. Pushes of a Label are emitted with label_width bytes of
+	zeros and patched once the program is assembled, so labels may be referenced before they are defined.
+
+		p = Program()
+		p.jump(Label("end"))
+		...
+		p.jumpdest("end")
+		p.bytecode()
+	"""
+
+	def __init__(self, label_width=2):
+		self.code = bytearray()
+		self.labels = {}
+		# (offset of the push data, label name, push data width)
+		self.fixups = []
+		self.label_width = label_width
 		self.mstore= lambda index,value: self.push(value).push(index).op(MSTORE)
 		self.mstore8= lambda index,value: self.push(value).push(index).op(MSTORE8)
 		self.add =   lambda x,y: self.push(y).push(x).op(ADD)
@@ -170,20 +198,48 @@ class Program():
 		self.jumpi        = lambda label,cond : self.push(cond).push(label).op(JUMPI)
 		self.revert      = lambda  memStart, memSize: self.push(memSize).push(memStart).op(REVERT)
 
-		
 	def _add(self, x):
-		if x == None:
+		if x is None:
 			return self
 
-		if type(x) == str:
-			self.compiled.append(x)
+		if type(x) is int and 0 <= x <= 0xff:
+			self.code.append(x)
 		else:
-			self.compiled.append(bytecode(x))
+			self.code += _bytes(x)
 
 		return self
 
-	def extend(self,program):
-		self.compiled.extend(program.compiled)
+	def extend(self, program):
+		""" appends the code of program, with its labels and references """
+		offset = len(self.code)
+		for name, pc in program.labels.items():
+			self._bind(name, pc + offset)
+		self.fixups.extend((pc + offset, name, width) for (pc, name, width) in program.fixups)
+		self.code += program.code
+		return self
+
+	def repeat(self, program, count):
+		"""
+		appends count copies of program, a Program or raw code (bytes or hex). The copies are
+		emitted at once, programs may reference labels but must not define any
+		"""
+		if not isinstance(program, Program):
+			self.code += (program if isinstance(program, (bytes, bytearray)) else _bytes(program)) * count
+			return self
+		if program.labels:
+			raise ValueError("repeated programs can not define labels: %s" % ", ".join(program.labels))
+		offset = len(self.code)
+		size = len(program.code)
+		if program.fixups:
+			self.fixups.extend((pc + offset + i * size, name, width)
+			                   for i in range(count) for (pc, name, width) in program.fixups)
+		self.code += program.code * count
+		return self
+
+	def raw(self, data):
+		""" appends raw code, bytes or hex """
+		self.code += data if isinstance(data, (bytes, bytearray)) else _bytes(data)
+		return self
 
 	def _addOp(self,op,v = None):
 		self._add(op)
@@ -194,17 +250,29 @@ class Program():
 		self._add(x)
 		return self
 
+	def ops(self, *ops):
+		self.code.extend(ops)
+		return self
+
 	def push(self,value):
-		value = bytecode(value)
-		length = len(value) / 2
+		if isinstance(value, Label):
+			self.code.append(PUSH1 + self.label_width - 1)
+			self.fixups.append((len(self.code), value.name, self.label_width))
+			self.code += bytes(self.label_width)
+			return self
+
+		if type(value) is int:
+			data = value.to_bytes(max(1, (value.bit_length() + 7) // 8), "big")
+		else:
+			data = _bytes(value)
+		length = len(data)
 
 		assert length <=32
 
-		self._addOp(PUSH1+(length-1), bytecode(value));
+		self.code.append(PUSH1 + length - 1)
+		self.code += data
 		return self
 
-
-
 	def call(self,gas ,address,value = 0,instart = 0, insize = 0, out = 0, outsize = 0):
 		self.push(outsize)
 		self.push(out)
@@ -271,19 +339,42 @@ class Program():
 		return self
 
 
+	def _bind(self, name, pc):
+		if name in self.labels:
+			raise ValueError("label %r is defined twice" % name)
+		self.labels[name] = pc
+
+	def assemble(self):
+		""" the code as bytes, with all label references resolved """
+		code = bytearray(self.code)
+		for (pc, name, width) in self.fixups:
+			if name not in self.labels:
+				raise ValueError("undefined label %r" % name)
+			try:
+				code[pc:pc + width] = self.labels[name].to_bytes(width, "big")
+			except OverflowError:
+				raise ValueError("label %r at %d does not fit into %d bytes, raise label_width"
+				                 % (name, self.labels[name], width))
+		return bytes(code)
+
 	def bytecode(self):
-		return "".join(self.compiled)
+		return self.assemble().hex()
+
+	def __len__(self):
+		return len(self.code)
 
-	def label(self):
-		return len(self.bytecode()) / 2
+	def label(self, name=None):
+		""" the current position, which is bound to name if given """
+		here = len(self.code)
+		if name is not None:
+			self._bind(name, here)
+		return here
 
-	def jumpdest(self):
-		here = self.label()
+	def jumpdest(self, name=None):
+		here = self.label(name)
 		self.op(JUMPDEST)
 		return here
 	
 
 	def __str__(self):
-		return ",".join(self.compiled)
-
-
+		return self.bytecode()
@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 import re
 
-from evmlab.opcodes import parseCode
+from evmlab.opcodes import disassembly
 
 """
 Solidity source code mappings, as 
@@ -172,12 +172,7 @@ class Contract():
 
     def _getMappingIndex(self, pc):
         ins = self.ins if self.create else self.insRuntime
-        pcs = list(ins.keys())
-
-        if pc in pcs:
-            return pcs.index(pc)
-
-        raise KeyError
+        return ins.instructionAt(pc)
 
     def _loadContract(self, contract):
         if not contract:
@@ -193,12 +188,12 @@ class Contract():
         bytecode = load('bin-runtime')
         if bytecode:
             self.binRuntime = bytecode
-            self.insRuntime = parseCode(bytecode)
+            self.insRuntime = disassembly(bytecode)
 
         bytecode = load('bin')
         if bytecode:
             self.bin = bytecode
-            self.ins = parseCode(bytecode)
+            self.ins = disassembly(bytecode)
 
         self.mappingRuntime = parseSourceMap(load('srcmap-runtime'))
         self.mapping = parseSourceMap(load('srcmap'))
@@ -1,5 +1,8 @@
 import os
 import json
+import itertools
+from html import escape
+import collections.abc
 from .opcodes import opcodes
 from . import compiler
 
@@ -33,30 +36,120 @@ OPCODE_FORMATS = {
     "CREATE":       "CREATE(val={0}, offset={1}, size={2})"
 }
 
+INVALID = ("INVALID", 0, 0, 0)
+
+
 def opinfo(opcode):
-    if opcode in opcodes.keys():
-        return opcodes[opcode]
-    return "INVALID",0,0,0
+    return opcodes.get(opcode, INVALID)
+
+
+class ReachingDefinitions(list):
+    """Encapsulates a list of the sources of each argument to an operation."""
+    __slots__ = ()
+
+
+class ReachesDefinitions(list):
+    """Encapsulates a list of the consumers of an operation's output."""
+    __slots__ = ()
+
+
+class VariableName(str):
+    """Annotation for variable name assignments."""
+    __slots__ = ()
+
+
+class Annotations(collections.abc.MutableMapping):
+    """
+    The annotations of a node, by type. A view on the node: the annotations set on every node of
+    an AST (see findReachings and composeOperations) live in slots of the node, other types in a dict
+    which is only created when needed.
+    """
+    __slots__ = ("_owner",)
+
+    def __init__(self, owner):
+        self._owner = owner
+
+    def __getitem__(self, key):
+        slot = Annotable.SLOTS.get(key)
+        value = getattr(self._owner, slot) if slot else (self._owner._annotations or {}).get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        if type(value) is not key:
+            raise TypeError("%s annotation expected" % key.__name__)
+        self._owner.setAnnotation(value)
+
+    def __delitem__(self, key):
+        self[key]  # KeyError if not set
+        slot = Annotable.SLOTS.get(key)
+        if slot:
+            setattr(self._owner, slot, None)
+        else:
+            del self._owner._annotations[key]
+
+    def __iter__(self):
+        for key, slot in Annotable.SLOTS.items():
+            if getattr(self._owner, slot) is not None:
+                yield key
+        yield from (self._owner._annotations or ())
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
 
 class Annotable(object):
+    __slots__ = ("_reaching", "_reaches", "_varname", "_annotations")
+
+    # annotation type -> slot
+    SLOTS = {ReachingDefinitions: "_reaching", ReachesDefinitions: "_reaches", VariableName: "_varname"}
+
     def __init__(self):
-        self.annotations = {}
-        super(Annotable, self).__init__()
+        self._reaching = self._reaches = self._varname = self._annotations = None
+
+    @property
+    def annotations(self):
+        return Annotations(self)
 
     def setAnnotation(self, obj):
-        self.annotations[type(obj)] = obj
+        slot = Annotable.SLOTS.get(type(obj))
+        if slot:
+            setattr(self, slot, obj)
+        else:
+            if self._annotations is None:
+                self._annotations = {}
+            self._annotations[type(obj)] = obj
 
 
 class OpcodeNode(Annotable):
+    # opname, ins, outs and gas are looked up from the opcode, they are not stored per node
+    __slots__ = ("pc", "opcode", "depth", "args", "result")
+
     def __init__(self, pc, depth, opcode, args, result):
         super(OpcodeNode, self).__init__()
         self.pc = pc
         self.opcode = opcode
         self.depth = depth
-        self.opname, self.ins, self.outs, self.gas = opinfo(opcode)
         self.args = args
         self.result = result
 
+    @property
+    def opname(self):
+        return opcodes.get(self.opcode, INVALID)[0]
+
+    @property
+    def ins(self):
+        return opcodes.get(self.opcode, INVALID)[1]
+
+    @property
+    def outs(self):
+        return opcodes.get(self.opcode, INVALID)[2]
+
+    @property
+    def gas(self):
+        return opcodes.get(self.opcode, INVALID)[3]
+
     def __str__(self):
         if self.opname in OPCODE_FORMATS:
             fmt = OPCODE_FORMATS[self.opname].format(*self.args)
@@ -68,22 +161,19 @@ class OpcodeNode(Annotable):
             return fmt
 
     def toHtml(self):
-        if self.opname in OPCODE_FORMATS:
-            fmt = OPCODE_FORMATS[self.opname].format(*self.args)
-        else:
-            fmt = "{0}({1})".format(self.opname, ', '.join(self.args))
-        if self.result:
-            return "{0:40} -> {1}".format(fmt, ', '.join(self.result))
-        else:
-            return fmt
+        return escape(str(self))
 
 class CallNode(OpcodeNode):
+    __slots__ = ("ops",)
+
     def __init__(self, pc, depth, opcode, args, result, ops):
         super(CallNode, self).__init__(pc, depth, opcode, args, result)
         self.ops = ops
 
 
 class PushNode(OpcodeNode):
+    __slots__ = ()
+
     def __init__(self, pc, depth, opcode, args, result):
         super(PushNode, self).__init__(pc, depth, opcode, args, result)
 
@@ -91,38 +181,58 @@ class PushNode(OpcodeNode):
         return self.result[0]
 
     def toHtml(self):
-        return str(self)
+        return escape(str(self))
 
 
 def buildAST(trace):
-    ops = []
-    stack = []
-    pc = 0
-
-    for step in trace:
-        pc = step.get('pc', pc)
-        if step['op'] in opcodes.keys():
-            opname, ins, outs, gas = opcodes[step['op']]
-        else:
-            opname, ins, outs,gas = "INVALID",0,0,0
+    """
+    Builds the nodes of a trace, an iterable of steps. Steps of calls carry the steps of the
+    call frame in 'ops', which are built with an explicit stack of frames instead of recursing.
+    The simulated stack is modified in place, so this is linear in the length of the trace.
+    """
+    root = []
+    # the frame being built: remaining steps, nodes, simulated stack and pc
+    steps, ops, stack, pc = iter(trace), root, [], 0
+    parents = []
 
-        if ins > 0:
-            args = stack[-ins:][::-1]
-            stack = stack[:-ins]
-        else:
-            args = []
-        if 'ops' in step:
-            ops.append(CallNode(pc, step['depth'], step['op'], args, step['result'], buildAST(step['ops'])))
-        elif opname.startswith('PUSH'):
-            ops.append(PushNode(pc, step['depth'], step['op'], args, step['result']))
+    while True:
+        for step in steps:
+            pc = step.get('pc', pc)
+            opname, ins, outs, gas = opcodes.get(step['op'], ("INVALID", 0, 0, 0))
+
+            if ins > 0:
+                args = stack[-ins:]
+                del stack[-ins:]
+                args.reverse()
+            else:
+                args = []
+            if 'ops' in step:
+                node = CallNode(pc, step['depth'], step['op'], args, step['result'], [])
+            elif opname.startswith('PUSH'):
+                node = PushNode(pc, step['depth'], step['op'], args, step['result'])
+            else:
+                node = OpcodeNode(pc, step['depth'], step['op'], args, step['result'])
+            ops.append(node)
+            pc += step.get('len', 1)
+
+            if 'ops' in step:
+                # continue with the steps of the call, and with this frame once they are done. the result of
+                # a streamed call is only known then
+                parents.append((steps, ops, stack, pc, step))
+                steps, ops, stack, pc = iter(step['ops']), node.ops, [], 0
+                break
+            stack.extend(reversed(step['result']))
         else:
-            ops.append(OpcodeNode(pc, step['depth'], step['op'], args, step['result']))
-        pc += step.get('len', 1)
-        stack.extend(step['result'][::-1])
-    return ops
+            if not parents:
+                return root
+            steps, ops, stack, pc, step = parents.pop()
+            ops[-1].result = step['result']
+            stack.extend(reversed(step['result']))
 
 
 class TransactionTrace(Annotable):
+    __slots__ = ("ops",)
+
     def __init__(self, ops):
         super(TransactionTrace, self).__init__()
         self.ops = ops
@@ -131,33 +241,22 @@ class TransactionTrace(Annotable):
     def build(cls, trace):
         return TransactionTrace(buildAST(trace))
 
+    # lines written to a file object at once
+    WRITE_CHUNK = 1024
+
     def __str__(self):
-        lines = []
-        stack = [(self, 0)]
-        while stack:
-            call, startidx = stack.pop()
-            for i in range(startidx, len(call.ops)):
-                op = call.ops[i]
-                lines.append("{0:>4} 0x{1:0>4x} {2}{3}".format(op.depth,op.pc, '  '*len(stack), str(op)))
-                if hasattr(op, 'ops'):
-                    stack.append((call, i + 1))
-                    stack.append((op, 0))
-                    break
-                elif hasattr(op, 'expression') and hasattr(op.expression, 'ops'):
-                    stack.append((call, i + 1))
-                    stack.append((op.expression, 0))
-                    break
-        return '\n'.join(lines)
+        return '\n'.join(self.lines())
 
-    def iterator(self):
-        #lines = []
+    def iterator(self, maxdepth=None):
+        """ yields (level, op) of all ops, calls are followed up to maxdepth levels deep """
         stack = [(self, 0)]
         while stack:
             call, startidx = stack.pop()
             for i in range(startidx, len(call.ops)):
                 op = call.ops[i]
                 yield (len(stack), op)
-                #lines.append("0x{0:0>4x} {1}{2}".format(op.pc, '  '*len(stack), str(op)))
+                if maxdepth is not None and len(stack) >= maxdepth:
+                    continue
                 if hasattr(op, 'ops'):
                     stack.append((call, i + 1))
                     stack.append((op, 0))
@@ -166,22 +265,43 @@ class TransactionTrace(Annotable):
                     stack.append((call, i + 1))
                     stack.append((op.expression, 0))
                     break
-        #return '\n'.join(lines)
-
-
-class ReachingDefinitions(list):
-    """Encapsulates a list of the sources of each argument to an operation."""
-
 
-class ReachesDefinitions(list):
-    """Encapsulates a list of the consumers of an operation's output."""
-
-
-class VariableName(str):
-    """Annotation for variable name assignments."""
+    def lines(self, html=False, maxdepth=None, start=0, end=None):
+        """ yields the lines of the annotated trace, the lines start..end-1 of it if given """
+        for level, op in itertools.islice(self.iterator(maxdepth), start, end):
+            if html:
+                text = op.toHtml() if hasattr(op, 'toHtml') else escape(str(op))
+                yield '<span class="depth">{0:>4}</span> <span class="pc">0x{1:0>4x}</span> {2}{3}'.format(
+                    op.depth, op.pc, '  ' * level, text)
+            else:
+                yield "{0:>4} 0x{1:0>4x} {2}{3}".format(op.depth, op.pc, '  ' * level, str(op))
+
+    def write(self, f, html=False, maxdepth=None, start=0, end=None):
+        """
+        Writes the annotated trace to the file object f, in chunks of lines. With html the lines are written
+        in a <pre> block, ops as toHtml() renders them. Returns the number of lines written
+        """
+        count = 0
+        chunk = []
+        if html:
+            f.write('<pre class="evmtrace">\n')
+        for line in self.lines(html=html, maxdepth=maxdepth, start=start, end=end):
+            chunk.append(line)
+            if len(chunk) >= TransactionTrace.WRITE_CHUNK:
+                f.write('\n'.join(chunk) + '\n')
+                count += len(chunk)
+                chunk = []
+        if chunk:
+            f.write('\n'.join(chunk) + '\n')
+            count += len(chunk)
+        if html:
+            f.write('</pre>\n')
+        return count
 
 
 class AssignmentStatement(object):
+    __slots__ = ("pc", "depth", "varname", "expression")
+
     def __init__(self, depth, pc, varname, expression):
         self.pc = pc
         self.depth = depth
@@ -193,6 +313,8 @@ class AssignmentStatement(object):
 
 
 class ExpressionStatement(object):
+    __slots__ = ("pc", "depth", "expression")
+
     def __init__(self, depth, pc, expression):
         self.pc = pc
         self.depth = depth
@@ -203,6 +325,8 @@ class ExpressionStatement(object):
 
 
 class VariableExpression(object):
+    __slots__ = ("varname", "depth")
+
     def __init__(self, depth, varname):
         self.varname = varname
         self.depth = depth
@@ -212,6 +336,8 @@ class VariableExpression(object):
 
 
 class OperationExpression(object):
+    __slots__ = ("op", "depth", "args")
+
     def __init__(self, depth, op, args):
         self.op = op
         self.depth = depth
@@ -225,20 +351,28 @@ class OperationExpression(object):
     def pc(self):
         return self.op.pc
 
-    def __str__(self):
+    def format(self, args):
+        """ the text of the expression, given the texts of its args """
         if self.op.opname in OPCODE_FORMATS:
-            return OPCODE_FORMATS[self.op.opname].format(*self.args)
+            return OPCODE_FORMATS[self.op.opname].format(*args)
         else:
-            return "{0}({1})".format(self.opname, ', '.join(map(str, self.args)))
+            return "{0}({1})".format(self.opname, ', '.join(args))
+
+    def __str__(self):
+        return formatExpression(self)
 
 
 class CallExpression(OperationExpression):
+    __slots__ = ("ops",)
+
     def __init__(self, depth,op, args, ops):
         super(CallExpression, self).__init__(depth, op, args)
         self.ops = ops
 
 
 class LiteralExpression(OperationExpression):
+    __slots__ = ("value",)
+
     def __init__(self, depth, value):
         self.value = value
         self.depth = depth
@@ -247,29 +381,72 @@ class LiteralExpression(OperationExpression):
         return self.value
 
 
-def findReachings(ast):
-    stack = []
-    for op in ast.ops:
-        if op.ins > 0:
-            args = stack[-op.ins:]
-            stack = stack[:-op.ins]
+def _isOperation(expression):
+    # literals are operation expressions as well, but they have no args
+    return isinstance(expression, OperationExpression) and not isinstance(expression, LiteralExpression)
+
+
+def formatExpression(expression):
+    """
+    Returns the text of expression. The expression tree is walked post-order with an explicit stack,
+    so there is no limit on its nesting.
+    """
+    result = []
+    work = [(expression, iter(expression.args if _isOperation(expression) else ()), [])]
+    while work:
+        (node, args, texts) = work[-1]
+        for arg in args:
+            work.append((arg, iter(arg.args if _isOperation(arg) else ()), []))
+            break
         else:
-            args = []
-        if op.opname.startswith('DUP'):
-            stack.extend(args)
-            stack.append(args[0])
-        elif op.opname.startswith('SWAP'):
-            stack.append(args[-1])
-            stack.extend(args[1:-1])
-            stack.append(args[0])
+            work.pop()
+            text = node.format(texts) if _isOperation(node) else str(node)
+            (work[-1][2] if work else result).append(text)
+    return result[0]
+
+
+def findReachings(ast):
+    """
+    Annotates every operation of ast, and of the calls in it, with the operations defining its arguments
+    (ReachingDefinitions, top of the stack first) and the operations using its results (ReachesDefinitions).
+    DUP and SWAP only move definitions around and are not annotated.
+
+    Linear in the number of operations: the simulated stack of definitions is modified in place and calls
+    are walked with an explicit stack of frames instead of recursing.
+    """
+    frames = [iter(ast.ops)]
+    stacks = [[]]
+    while frames:
+        stack = stacks[-1]
+        for op in frames[-1]:
+            opname, ins, outs, gas = opcodes.get(op.opcode, INVALID)
+            if ins > 0:
+                args = stack[-ins:]
+                del stack[-ins:]
+            else:
+                args = []
+            if opname.startswith('DUP'):
+                stack.extend(args)
+                stack.append(args[0])
+            elif opname.startswith('SWAP'):
+                stack.append(args[-1])
+                stack.extend(args[1:-1])
+                stack.append(args[0])
+            else:
+                for arg in args:
+                    arg._reaches.append(op)
+                args.reverse()
+                op.setAnnotation(ReachingDefinitions(args))
+                op.setAnnotation(ReachesDefinitions())
+                stack.extend([op] * outs)
+            if hasattr(op, 'ops'):
+                # continue with the call, and with this frame once it is done
+                frames.append(iter(op.ops))
+                stacks.append([])
+                break
         else:
-            for arg in args:
-                arg.annotations[ReachesDefinitions].append(op)
-            op.setAnnotation(ReachingDefinitions(args[::-1]))
-            op.setAnnotation(ReachesDefinitions())
-            stack.extend([op] * op.outs)
-        if hasattr(op, 'ops'):
-            findReachings(op)
+            frames.pop()
+            stacks.pop()
 
 
 def nameIterator():
@@ -281,36 +458,70 @@ def nameIterator():
         prefix = next(prefixIterator)
 
 
-def buildExpression(op):
-    subexps = []
-    for arg in op.annotations[ReachingDefinitions]:
-        if VariableName in arg.annotations:
-            subexps.append(VariableExpression(op.depth, arg.annotations[VariableName]))
-        else:
-            subexps.append(buildExpression(arg))
+def _expression(op, subexps, pending):
     if isinstance(op, CallNode):
-        return CallExpression(op.depth, op, subexps, composeOperations(op.ops))
+        # the operations of the call are composed later on, see _composeFrames
+        expression = CallExpression(op.depth, op, subexps, [])
+        pending.append((op.ops, expression.ops))
+        return expression
     elif isinstance(op, PushNode):
         return LiteralExpression(op.depth, op.result[0])
     else:
         return OperationExpression(op.depth, op, subexps)
 
 
+def _buildExpression(op, pending):
+    # post-order walk of the definitions reaching op, arguments with a variable name are not expanded
+    result = []
+    work = [(op, iter(op._reaching), [])]
+    while work:
+        (node, args, subexps) = work[-1]
+        for arg in args:
+            if arg._varname is not None:
+                subexps.append(VariableExpression(node.depth, arg._varname))
+            else:
+                work.append((arg, iter(arg._reaching), []))
+                break
+        else:
+            work.pop()
+            (work[-1][2] if work else result).append(_expression(node, subexps, pending))
+    return result[0]
+
+
+def _composeFrames(pending):
+    # composes (ops, statements) frames until no calls are left
+    while pending:
+        (ops, statements) = pending.pop()
+        varnames = nameIterator()
+        for op in ops:
+            # Ignore SWAP and DUP, which don't have annotations
+            if op._reaching is None:
+                continue
+            reaches = op._reaches
+            if not op.opname.startswith('PUSH'):
+                if len(reaches) == 0:
+                    statements.append(ExpressionStatement(op.depth, op.pc, _buildExpression(op, pending)))
+                elif len(reaches) > 1 or isinstance(op, CallNode):
+                    varname = next(varnames)
+                    op.setAnnotation(VariableName(varname))
+                    statements.append(AssignmentStatement(op.depth, op.pc, varname, _buildExpression(op, pending)))
+
+
+def buildExpression(op):
+    pending = []
+    expression = _buildExpression(op, pending)
+    _composeFrames(pending)
+    return expression
+
+
 def composeOperations(ops):
-    varnames = nameIterator()
+    """
+    Composes the annotated operations (see findReachings) into statements. Operations whose result is used
+    more than once, and calls, are assigned to variables. All others are inlined into the expressions using
+    them. Expressions and calls are walked iteratively, so there is no limit on their nesting.
+    """
     statements = []
-    for op in ops:
-        # Ignore SWAP and DUP, which don't have annotations
-        if ReachingDefinitions not in op.annotations:
-            continue
-        reaches = op.annotations[ReachesDefinitions]
-        if not op.opname.startswith('PUSH'):
-            if len(reaches) == 0:
-                statements.append(ExpressionStatement(op.depth, op.pc, buildExpression(op)))
-            elif len(reaches) > 1 or isinstance(op, CallNode):
-                varname = next(varnames)
-                op.setAnnotation(VariableName(varname))
-                statements.append(AssignmentStatement(op.depth, op.pc, varname, buildExpression(op)))
+    _composeFrames([(ops, statements)])
     return statements
 
 
@@ -324,95 +535,237 @@ def trace(web3, txid, compose = True):
     return ast
 
 def traceEvmOutput(tracefile, compose = True):
-    result = evmResult(tracefile)
-    ast = TransactionTrace.build(result)
+    with open(tracefile) as f:
+        ast = TransactionTrace.build(evmSteps(f))
     findReachings(ast)
     if compose: 
         ast = TransactionTrace(composeOperations(ast.ops))
  
     return ast
 
-def evmResult(tracefile):
+# number of stack items pushed by an op, read from the stack of the next step
+NPUSHES = {0: 0, 1: 1, 2: 1, 3: 1, 4: 1, 5: 1, 6: 1, 7: 1, 8: 1, 9: 1, 10: 1, 11: 1, 16: 1, 17: 1, 18: 1, 19: 1, 20: 1, 21: 1, 22: 1, 23: 1, 24: 1, 25: 1, 26: 1, 32: 1, 48: 1, 49: 1, 50: 1, 51: 1, 52: 1, 53: 1, 54: 1, 55: 0, 56: 1, 57: 0, 58: 1, 59: 1, 60: 0, 61: 1, 62: 0, 64: 1, 65: 1, 66: 1, 67: 1, 68: 1, 69: 1, 80: 0, 81: 1, 82: 0, 83: 0, 84: 1, 85: 0, 86: 0, 87: 0, 88: 1, 89: 1, 90: 1, 91: 0, 96: 1, 97: 1, 98: 1, 99: 1, 100: 1, 101: 1, 102: 1, 103: 1, 104: 1, 105: 1, 106: 1, 107: 1, 108: 1, 109: 1, 110: 1, 111: 1, 112: 1, 113: 1, 114: 1, 115: 1, 116: 1, 117: 1, 118: 1, 119: 1, 120: 1, 121: 1, 122: 1, 123: 1, 124: 1, 125: 1, 126: 1, 127: 1, 128: 2, 129: 3, 130: 4, 131: 5, 132: 6, 133: 7, 134: 8, 135: 9, 136: 10, 137: 11, 138: 12, 139: 13, 140: 14, 141: 15, 142: 16, 143: 17, 144: 2, 145: 3, 146: 4, 147: 5, 148: 6, 149: 7, 150: 8, 151: 9, 152: 10, 153: 11, 154: 12, 155: 13, 156: 14, 157: 15, 158: 16, 159: 17, 160: 0, 161: 0, 162: 0, 163: 0, 164: 0, 240: 1, 241: 1, 242: 1, 243: 0, 244: 0, 245: 1, 255: 0}
 
-    def isPush(op):
-        return op >= compiler.PUSH1 and op <= compiler.PUSH32 
+CALLS = (compiler.CALL, compiler.CALLCODE, compiler.DELEGATECALL, compiler.STATICCALL)
+# creates enter a frame as well, running the init code
+CREATES = (compiler.CREATE, compiler.CREATE2)
 
-    res = {
-        'stack' : [{"ops" : []}]
-    }
-    npushes = {0: 0, 1: 1, 2: 1, 3: 1, 4: 1, 5: 1, 6: 1, 7: 1, 8: 1, 9: 1, 10: 1, 11: 1, 16: 1, 17: 1, 18: 1, 19: 1, 20: 1, 21: 1, 22: 1, 23: 1, 24: 1, 25: 1, 26: 1, 32: 1, 48: 1, 49: 1, 50: 1, 51: 1, 52: 1, 53: 1, 54: 1, 55: 0, 56: 1, 57: 0, 58: 1, 59: 1, 60: 0, 61: 1, 62: 0, 64: 1, 65: 1, 66: 1, 67: 1, 68: 1, 69: 1, 80: 0, 81: 1, 82: 0, 83: 0, 84: 1, 85: 0, 86: 0, 87: 0, 88: 1, 89: 1, 90: 1, 91: 0, 96: 1, 97: 1, 98: 1, 99: 1, 100: 1, 101: 1, 102: 1, 103: 1, 104: 1, 105: 1, 106: 1, 107: 1, 108: 1, 109: 1, 110: 1, 111: 1, 112: 1, 113: 1, 114: 1, 115: 1, 116: 1, 117: 1, 118: 1, 119: 1, 120: 1, 121: 1, 122: 1, 123: 1, 124: 1, 125: 1, 126: 1, 127: 1, 128: 2, 129: 3, 130: 4, 131: 5, 132: 6, 133: 7, 134: 8, 135: 9, 136: 10, 137: 11, 138: 12, 139: 13, 140: 14, 141: 15, 142: 16, 143: 17, 144: 2, 145: 3, 146: 4, 147: 5, 148: 6, 149: 7, 150: 8, 151: 9, 152: 10, 153: 11, 154: 12, 155: 13, 156: 14, 157: 15, 158: 16, 159: 17, 160: 0, 161: 0, 162: 0, 163: 0, 164: 0, 240: 1, 241: 1, 242: 1, 243: 0, 244: 0, 255: 0}
 
-    with open(tracefile) as f:
-        for line in f:
-        
+class MemoryTracker(object):
+    """
+    The memory of a call frame. Trace lines carry a full dump of the memory, the tracker keeps the last one
+    and turns the next into a diff: the changed region as (offset, bytes)
+    """
+    __slots__ = ("memory",)
+
+    def __init__(self):
+        self.memory = b""
+
+    def update(self, memory):
+        """ updates to a memory dump, "0x.." or a list of hex words. returns the diff, None if unchanged """
+        if memory is None:
+            return None
+        if isinstance(memory, list):
+            memory = "".join(memory)
+        data = bytes.fromhex(memory[2:] if memory.startswith("0x") else memory)
+        old = self.memory
+        self.memory = data
+        if data == old:
+            return None
+        # the first and last changed byte, by bisecting over slice compares
+        n = min(len(old), len(data))
+        (lo, hi) = (0, n)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if old[lo:mid + 1] == data[lo:mid + 1]:
+                lo = mid + 1
+            else:
+                hi = mid
+        start = lo
+        if len(old) != len(data):
+            end = len(data)
+        else:
+            (lo, hi) = (start, n)
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if old[mid:n] == data[mid:n]:
+                    hi = mid
+                else:
+                    lo = mid + 1
+            end = lo
+        return (start, data[start:end])
+
+    def read(self, offset, size):
+        """ memory[offset:offset+size] as hexstring, zero padded """
+        data = self.memory[offset:offset + size]
+        return "0x" + (data + bytes(size - len(data))).hex()
+
+
+class _TraceReader(object):
+    """ the parsed lines of a trace, with one line of lookahead. None at the end of the trace """
+    __slots__ = ("_lines", "_next")
+
+    def __init__(self, lines):
+        self._lines = iter(lines)
+        self._next = None
+
+    def peek(self):
+        if self._next is None:
+            self._next = self._read()
+        return self._next
+
+    def advance(self):
+        self._next = None
+
+    def _read(self):
+        for line in self._lines:
+            if not line.strip():
+                continue
             log = json.loads(line)
-            if 'output' in log.keys():
-                return res['stack'][0]['ops']
-
-            def peek(n):
-                return int(log['stack'][-1-n],16)
-
-            def isOp(op):
-                return log['op'] == op
-
-            d = ' '.ljust(log['depth']*4)
-
-            if log['depth'] != len(res['stack']):
-                res['stack'] = res['stack'][0:-1]
-            #print("line", line)
-            try:
-                frame = res['stack'][-1]
-            except Exception as e:
-                print(res)
-                print(line)
-                raise e
-
-            if log['depth'] == len(res['stack']):
-                opinfo = {
-                "op" : log['op'], 
-                "depth" : log['depth'],
-                'result' : [],
-                }
-                if len(frame['ops']) > 0:
-                    prevop = frame['ops'][-1]
-                    for i in range(0,npushes[prevop['op']]):
-                        prevop['result'].append(hex(peek(i)))
-
-                if isOp(compiler.CALL) or isOp(compiler.CALLCODE) or isOp(compiler.DELEGATECALL) or isOp(compiler.STATICCALL):
-                    opinfo["error"] = None;
-                    opinfo["return"] = None;
-                    opinfo["ops"] = [];
-                    opinfo["gas"]   = peek(0)
-                    opinfo["to"]    = peek(1)
-
-                    if isOp(compiler.DELEGATECALL) or isOp(compiler.STATICCALL):
-                        instart = peek(-2)
-                        insize  = peek(-3)
-                    else:
-                        opinfo["value"] = peek(2)
-                        instart = peek(3)
-                        insize  = peek(4)
-
-                    opinfo["input"] = log['memory'][instart: instart + insize];
-                    res['stack'].append(opinfo)
-
-                elif isOp(compiler.RETURN):
-                    out = peek(0)
-                    outsize = peek(1)
-                    print("Out" , out)
-                    print("Outsize", outsize)
-                    frame['return'] = log['memory'][out:out+outsize]
-                elif isOp(compiler.STOP) or isOp(compiler.SELFDESTRUCT):
-                    frame['return'] = None
-                elif isOp(compiler.JUMPDEST):
-                    opinfo['pc'] = log['pc']
-
-                if isPush(log['op']):
-                    opinfo['len'] = log['op'] - 0x5e
-
-                frame['ops'].append(opinfo)
-
-        
+            if 'output' in log:
+                break
+            if 'op' in log:
+                return log
+        self._lines = iter(())
+        return False
+
+
+def _results(log, op):
+    stack = log['stack']
+    return [hex(int(stack[-1 - i], 16)) for i in range(NPUSHES.get(op, 0))]
+
+
+def _frameSteps(reader, depth, call):
+    """
+    Yields the steps of the call frame at depth. A step is yielded once its result is known, with the stack of
+    the next line of the frame. Steps of calls which entered a frame are yielded at the first line of the
+    frame, with 'ops' the generator of its steps; their result is set when the frame returns.
+    """
+    memory = MemoryTracker()
+    step = None    # the last step, waiting for its result
+    called = None  # the last call which entered a frame
+
+    while True:
+        log = reader.peek()
+        if called is not None:
+            # skip the rest of the frame, if it was not walked
+            while log and log['depth'] > depth:
+                reader.advance()
+                log = reader.peek()
+            if log and log['depth'] == depth:
+                called['result'] = _results(log, called['op'])
+            called = None
+        if not log or log['depth'] < depth:
+            break
+        if log['depth'] > depth:
+            if step is None or 'ops' not in step:
+                raise ValueError("trace enters depth %d without a call" % log['depth'])
+            step['ops'] = _frameSteps(reader, depth + 1, step)
+            yield step
+            (step, called) = (None, step)
+            continue
+
+        reader.advance()
+        if step is not None:
+            step['result'] = _results(log, step['op'])
+            yield step
+
+        def peek(n):
+            return int(log['stack'][-1 - n], 16)
+
+        op = log['op']
+        step = {
+            'op': op,
+            'depth': depth,
+            'pc': log['pc'],
+            'result': [],
+            'memdiff': memory.update(log.get('memory')),
+        }
+        if op in CALLS or op in CREATES:
+            step['error'] = None
+            step['return'] = None
+            step['ops'] = []
+        if op in CREATES:
+            step['value'] = peek(0)
+            step['input'] = memory.read(peek(1), peek(2))
+            if op == compiler.CREATE2:
+                step['salt'] = peek(3)
+        elif op in CALLS:
+            step['gas'] = peek(0)
+            step['to'] = peek(1)
+            if op in (compiler.DELEGATECALL, compiler.STATICCALL):
+                (instart, insize) = (peek(2), peek(3))
+            else:
+                step['value'] = peek(2)
+                (instart, insize) = (peek(3), peek(4))
+            step['input'] = memory.read(instart, insize)
+        elif op in (compiler.RETURN, compiler.REVERT):
+            if call is not None:
+                call['return'] = memory.read(peek(0), peek(1))
+        elif compiler.PUSH1 <= op <= compiler.PUSH32:
+            step['len'] = op - 0x5e
+
+    if step is not None:
+        yield step
+    if call is not None and log and log['depth'] == depth - 1:
+        # back in the caller, the result of the call is on its stack. set here already, as the caller's
+        # step is only read once the frame is walked
+        call['result'] = _results(log, call['op'])
+
+
+def evmSteps(lines):
+    """
+    Streams the steps of a json trace (an iterable of lines, e.g. a file) for TransactionTrace.build. Steps are
+    dicts as returned by evmResult, with 'pc', and 'memdiff' the (offset, bytes) of the memory changed by the
+    previous step instead of the memory. 'ops' of calls and creates are generators reading from the same lines, they have
+    to be walked before the next step of the caller is read, or are skipped.
+    """
+    return _frameSteps(_TraceReader(lines), 1, None)
+
+
+def evmEvents(lines):
+    """
+    Yields the events of a json trace as (event, step):
+      ("step", step) ... an executed step, with its result
+      ("enter", call) .. a call entered a frame, the following events are of the callee
+      ("exit", call) ... the frame of the call finished, 'return' and the result of the call are set
+    """
+    frames = [evmSteps(lines)]
+    calls = [None]
+    while frames:
+        for step in frames[-1]:
+            if isinstance(step.get('ops', []), list):
+                yield ("step", step)
+                continue
+            yield ("enter", step)
+            frames.append(step['ops'])
+            calls.append(step)
+            break
+        else:
+            frames.pop()
+            call = calls.pop()
+            if call is not None:
+                yield ("exit", call)
+
+
+def evmResult(tracefile):
+    """ the steps of a json trace file, with the steps of calls in 'ops' lists """
+    root = []
+    with open(tracefile) as f:
+        frames = [(evmSteps(f), root)]
+        while frames:
+            (steps, ops) = frames[-1]
+            for step in steps:
+                ops.append(step)
+                if not isinstance(step.get('ops', []), list):
+                    frames.append((step['ops'], []))
+                    step['ops'] = frames[-1][1]
+                    break
+            else:
+                frames.pop()
+    return root
+
+
 def testFile(fname):
     testfile = os.path.join(os.path.dirname(__file__), fname)
     ast = traceEvmOutput(testfile)
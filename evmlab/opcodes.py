@@ -1,6 +1,7 @@
-from copy import copy
+import array
 import collections
 import binascii
+import hashlib
 
 from . import parse_int_or_hex,decode_hex,remove_0x_head,bytearray_to_bytestr,encode_hex
 
@@ -101,6 +102,61 @@ for o in opcodes:
     vars()[opcodes[o][0]] = opcodes[o]
     reverse_opcodes[opcodes[o][0]] = o
 
+INVALID = ['INVALID', 0, 0, 0]
+
+# opcodes introduced by each fork, in the order of the forks
+FORK_OPCODES = collections.OrderedDict([
+    ("Frontier", set(opcodes) - {0xf4} - opcodesMetropolis - {0x1b, 0x1c, 0x1d, 0x3f, 0xf5}),
+    ("Homestead", {0xf4}),
+    ("EIP150", set()),
+    ("EIP158", set()),
+    ("Byzantium", opcodesMetropolis),
+    ("Constantinople", {0x1b, 0x1c, 0x1d, 0x3f, 0xf5}),
+    ("ConstantinopleFix", set()),
+    ("Petersburg", set()),
+])
+
+
+class OpcodeTable(object):
+    """
+    Opcode metadata of a fork as 256-entry tables, indexed by the opcode byte
+
+    names[op] .. name, 'INVALID' if the opcode is undefined
+    ins[op], outs[op], gas[op]
+    valid[op] .. 1 if the opcode is defined in the fork
+    byName ..... name -> opcode, of the valid opcodes
+    """
+    __slots__ = ("fork", "names", "ins", "outs", "gas", "valid", "byName")
+
+    def __init__(self, fork, valid):
+        self.fork = fork
+        info = [opcodes.get(op, INVALID) if op in valid else INVALID for op in range(256)]
+        self.names = tuple(i[0] for i in info)
+        self.ins = bytes(i[1] for i in info)
+        self.outs = bytes(i[2] for i in info)
+        self.gas = array.array("I", (i[3] for i in info))
+        self.valid = bytes(1 if op in valid else 0 for op in range(256))
+        self.byName = {opcodes[op][0]: op for op in valid}
+
+
+def _forkTables():
+    tables = collections.OrderedDict()
+    valid = set()
+    for fork, introduced in FORK_OPCODES.items():
+        valid |= introduced
+        tables[fork] = OpcodeTable(fork, frozenset(valid))
+    return tables
+
+
+FORK_TABLES = _forkTables()
+LATEST_FORK = next(reversed(FORK_TABLES))
+
+
+def opcodeTable(fork=None):
+    """ the OpcodeTable of a fork by name, of the latest fork if None. raises KeyError for unknown forks """
+    return FORK_TABLES[fork or LATEST_FORK]
+
+
 # Non-opcode gas prices
 GDEFAULT = 1
 GMEMORY = 3
@@ -142,37 +198,88 @@ CALL_CHILD_LIMIT_DENOM = 64
 SUICIDE_SUPPLEMENTAL_GAS = 5000
 
 
-def parseCode(code):
-    code = code[2:] if code[:2] == '0x' else code
+class Disassembly(object):
+    """
+    Disassembled code, as parallel arrays indexed by instruction
 
-    try:
-        codes = [c for c in decode_hex(code)]
-    except ValueError as e:
-        print(code)
-        raise Exception("Did you forget to link any libraries?") from e
+    pcs[i] ......... pc of the i-th instruction
+    ops[i] ......... its opcode
+    immediates[i] .. offset right after its opcode, where the push data starts. set for every instruction,
+                     the length of the push data follows from the opcode, see immediate()
+    index[pc] ...... instruction index at pc, -1 within push data
+    jumpdests[pc] .. 1 if pc is a valid jump destination
+    """
+    __slots__ = ("code", "pcs", "ops", "immediates", "index", "jumpdests")
 
-    instructions = collections.OrderedDict()
-    pc = 0
-    length = None
-    while pc < len(codes):
-        try:
-            opcode = opcodes[codes[pc]]
-        except KeyError:
-            opcode = ['INVALID', 0, 0, 0]
-        if opcode[0][:4] == 'PUSH':
-            opcode = copy(opcode)
-            length = codes[pc] - 0x5f
-            pushData = codes[pc + 1 : pc + length + 1]
-            pushData = "0x" + encode_hex(bytearray_to_bytestr(pushData))
-            if type(pushData) is not str:
-                pushData = pushData.decode()
-            opcode.append(pushData)
+    def __init__(self, code):
+        self.code = code
+        self.pcs = array.array("I")
+        self.immediates = array.array("I")
+        self.index = array.array("i", [-1]) * len(code)
+        self.jumpdests = bytearray(len(code))
 
-        instructions[pc] = opcode
+        pc = 0
+        while pc < len(code):
+            op = code[pc]
+            self.index[pc] = len(self.pcs)
+            self.pcs.append(pc)
+            self.immediates.append(pc + 1)
+            if op == 0x5b:
+                self.jumpdests[pc] = 1
+            pc += op - 0x5e if 0x60 <= op <= 0x7f else 1
+        self.ops = bytes(code[pc] for pc in self.pcs)
+
+    def __len__(self):
+        return len(self.pcs)
+
+    def immediate(self, i):
+        """ the push data of the i-th instruction, truncated at the end of the code """
+        op = self.ops[i]
+        start = self.immediates[i]
+        return self.code[start:start + op - 0x5f] if 0x60 <= op <= 0x7f else b''
+
+    def instructionAt(self, pc):
+        """ the index of the instruction at pc, raises KeyError if pc is not an instruction """
+        i = self.index[pc] if 0 <= pc < len(self.index) else -1
+        if i < 0:
+            raise KeyError(pc)
+        return i
+
+    def isJumpdest(self, pc):
+        return 0 <= pc < len(self.jumpdests) and self.jumpdests[pc] == 1
+
+
+_DISASSEMBLIES = collections.OrderedDict()
+DISASSEMBLY_CACHE_SIZE = 256
 
-        if length is not None:
-            pc += length
-            length = None
-        pc += 1
 
-    return instructions
\ No newline at end of file
+def disassembly(code):
+    """ the Disassembly of code (hex or bytes), memoized by the hash of the code """
+    if isinstance(code, str):
+        try:
+            code = decode_hex(remove_0x_head(code))
+        except ValueError as e:
+            print(code)
+            raise Exception("Did you forget to link any libraries?") from e
+    key = hashlib.sha256(code).digest()
+    try:
+        _DISASSEMBLIES.move_to_end(key)
+        return _DISASSEMBLIES[key]
+    except KeyError:
+        pass
+    result = _DISASSEMBLIES[key] = Disassembly(bytes(code))
+    if len(_DISASSEMBLIES) > DISASSEMBLY_CACHE_SIZE:
+        _DISASSEMBLIES.popitem(last=False)
+    return result
+
+
+def parseCode(code):
+    """ pc -> [name, ins, outs, gas], plus the push data as hex for PUSHes """
+    dis = disassembly(code)
+    instructions = collections.OrderedDict()
+    for i, pc in enumerate(dis.pcs):
+        opcode = opcodes.get(dis.ops[i], INVALID)
+        if 0x60 <= dis.ops[i] <= 0x7f:
+            opcode = opcode + ["0x" + dis.immediate(i).hex()]
+        instructions[pc] = opcode
+    return instructions
@@ -0,0 +1,155 @@
+"""
+Instruction-aware reduction of EVM bytecode, used by the testcase minimizer.
+
+Instead of chopping bytes off the end of the code, the reducer works on the disassembly and
+proposes edits which keep the code well-formed: removing basic blocks, call sequences and
+instruction ranges, and shrinking PUSH immediates. Jump targets are relocated after every edit.
+"""
+import collections
+
+from .opcodes import opcodes, disassembly, reverse_opcodes
+
+Instruction = collections.namedtuple("Instruction", ["pc", "opcode", "operand"])
+Edit = collections.namedtuple("Edit", ["saved", "description", "remove", "replace"])
+
+PUSH1 = reverse_opcodes['PUSH1']
+JUMPDEST = reverse_opcodes['JUMPDEST']
+JUMPS = {reverse_opcodes['JUMP'], reverse_opcodes['JUMPI']}
+# a basic block ends after any of these
+TERMINATORS = JUMPS | {reverse_opcodes[n] for n in ('STOP', 'RETURN', 'REVERT', 'SUICIDE')} | {0xfe}
+# instructions which push a single result after consuming their arguments
+CALLS = {reverse_opcodes[n] for n in ('CALL', 'CALLCODE', 'DELEGATECALL', 'STATICCALL', 'CREATE', 'CREATE2')}
+
+MAX_RANGE_SPLITS = 64
+
+
+def disassemble(code):
+    """Returns the list of Instructions for the given (hex) code"""
+    dis = disassembly(code)
+    return [Instruction(pc, dis.ops[i], dis.immediate(i)) for i, pc in enumerate(dis.pcs)]
+
+
+def isPush(instruction):
+    return bool(instruction.operand) or instruction.opcode == PUSH1
+
+
+def size(instruction):
+    return 1 + len(instruction.operand)
+
+
+class CodeReducer(object):
+
+    def __init__(self, code):
+        self.code = code
+        self.instructions = disassemble(code)
+        self.jumpdests = {i.pc for i in self.instructions if i.opcode == JUMPDEST}
+
+    def __len__(self):
+        return sum(size(i) for i in self.instructions)
+
+    def _isJumpTarget(self, idx):
+        """True if the instruction at idx pushes the target of a directly following jump"""
+        nxt = idx + 1
+        return isPush(self.instructions[idx]) and nxt < len(self.instructions) \
+            and self.instructions[nxt].opcode in JUMPS
+
+    def _removal(self, description, indexes):
+        indexes = set(indexes)
+        return Edit(sum(size(self.instructions[i]) for i in indexes), description, indexes, {})
+
+    def blocks(self):
+        """Returns the basic blocks as lists of instruction indexes"""
+        blocks = [[]]
+        for idx, instr in enumerate(self.instructions):
+            if instr.opcode == JUMPDEST and blocks[-1]:
+                blocks.append([])
+            blocks[-1].append(idx)
+            if instr.opcode in TERMINATORS:
+                blocks.append([])
+        return [b for b in blocks if b]
+
+    def edits(self):
+        """Returns all candidate edits, ordered by the number of bytes they save"""
+        instrs = self.instructions
+        edits = []
+
+        # drop basic blocks
+        for block in self.blocks():
+            edits.append(self._removal("block at pc %d" % instrs[block[0]].pc, block))
+
+        # replace calls and creates, including the pushes for their arguments, with a zero result
+        for idx, instr in enumerate(instrs):
+            if instr.opcode not in CALLS:
+                continue
+            args = []
+            while len(args) < opcodes[instr.opcode][1] and idx - len(args) > 0 \
+                    and isPush(instrs[idx - len(args) - 1]):
+                args.append(idx - len(args) - 1)
+            edit = self._removal("call sequence at pc %d" % instr.pc, args)
+            saved = edit.saved + size(instr) - 2
+            # without argument pushes, the PUSH1 is larger than the call
+            if saved > 0:
+                edits.append(Edit(saved, edit.description, edit.remove,
+                                  {idx: Instruction(instr.pc, PUSH1, b'\x00')}))
+
+        # drop ranges of instructions, from halves down to 1/MAX_RANGE_SPLITS of the code
+        n = 2
+        while n <= min(len(instrs), MAX_RANGE_SPLITS):
+            k, m = divmod(len(instrs), n)
+            for i in range(n):
+                start, end = i * k + min(i, m), (i + 1) * k + min(i + 1, m)
+                edits.append(self._removal("instructions %d-%d" % (start, end), range(start, end)))
+            n = n * 2
+
+        # shrink push values, but leave jump targets alone
+        for idx, instr in enumerate(instrs):
+            if not isPush(instr) or self._isJumpTarget(idx) or instr.operand in (b'', b'\x00'):
+                continue
+            operand = instr.operand[-1:] if len(instr.operand) > 1 else b'\x00'
+            edits.append(Edit(len(instr.operand) - len(operand), "push at pc %d" % instr.pc, set(),
+                              {idx: Instruction(instr.pc, PUSH1, operand)}))
+
+        # stable sort: equal savings keep the order above (blocks, calls, ranges, pushes)
+        return sorted(edits, key=lambda e: -e.saved)
+
+    def apply(self, edit):
+        """Returns the code with the edit applied, and jump targets relocated. Only targets pushed directly
+        before their jump can be relocated: returns None if the edit moves a JUMPDEST whose pc is pushed
+        elsewhere (it may be jumped to later on), or if a relocated target does not fit into its push"""
+        kept = [edit.replace.get(idx, instr) for idx, instr in enumerate(self.instructions)
+                if idx not in edit.remove]
+        # pushes of the original code, the values of replacements are new
+        original = [idx not in edit.replace for idx in range(len(self.instructions)) if idx not in edit.remove]
+
+        relocation = {}
+        pc = 0
+        for instr in kept:
+            if instr.opcode == JUMPDEST:
+                relocation[instr.pc] = pc
+            pc += size(instr)
+
+        out = bytearray()
+        for i, instr in enumerate(kept):
+            out.append(instr.opcode)
+            operand = instr.operand
+            if operand and not (i + 1 < len(kept) and kept[i + 1].opcode in JUMPS):
+                value = int.from_bytes(operand, 'big')
+                if original[i] and value in self.jumpdests and relocation.get(value) != value:
+                    return None
+            elif operand:
+                target = int.from_bytes(operand, 'big')
+                if target in relocation:
+                    try:
+                        operand = relocation[target].to_bytes(len(operand), 'big')
+                    except OverflowError:
+                        return None
+            out += operand
+
+        return "0x" + out.hex()
+
+    def candidates(self):
+        """Yields (description, code) for all candidate reductions, most promising first"""
+        for edit in self.edits():
+            code = self.apply(edit)
+            if code is not None and code != self.code:
+                yield (edit.description, code)
@@ -0,0 +1,155 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# Author : <github.com/tintinweb>
+"""
+Packed, indexed corpus of pre-generated statetests.
+
+A corpus file is a sequence of records, one statetest file ({name: test} json) each, followed by an index of
+the record offsets. Records are optionally compressed one by one, so that any test, or range of tests, can be
+read without touching the rest of the file. Ranges of indexes are how a corpus is sharded across workers.
+
+    header  | MAGIC | codec (1 byte) |
+    records | record 0 | record 1 | ... | record n-1 |
+    index   | offset 0 | offset 1 | ... | offset n-1 | offset n (= end of the records) |    uint64 little endian
+    trailer | n (uint64) | offset of the index (uint64) | MAGIC |
+"""
+import array
+import bz2
+import gzip
+import lzma
+import struct
+import sys
+
+MAGIC = b"EVMCRP01"
+TRAILER = struct.Struct("<QQ%ds" % len(MAGIC))
+
+# codec name -> (id in the header, compress, decompress)
+CODECS = {None: (0, None, None),
+          "gzip": (1, gzip.compress, gzip.decompress),
+          "bz2": (2, bz2.compress, bz2.decompress),
+          "xz": (3, lzma.compress, lzma.decompress)}
+
+
+class CorpusError(Exception):
+    pass
+
+
+def _offsets(values=()):
+    offsets = array.array("Q", values)
+    if offsets.itemsize != 8:
+        raise CorpusError("unsupported platform, no 64bit array type")
+    return offsets
+
+
+class CorpusWriter(object):
+    """
+    Writes a corpus file, tests are added one by one.
+
+    with CorpusWriter("tests.corpus", compress="gzip") as corpus:
+        corpus.add('{"randomStatetest0": {...}}')
+    """
+
+    def __init__(self, path, compress=None):
+        if compress not in CODECS:
+            raise CorpusError("unknown codec %r" % compress)
+        self.path = path
+        (codec, self._compress, _) = CODECS[compress]
+        self._f = open(path, "wb")
+        self._f.write(MAGIC + bytes([codec]))
+        self._offsets = _offsets([self._f.tell()])
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def add(self, test):
+        """ adds a statetest file, as json str or bytes. returns its index """
+        data = test.encode("utf-8") if isinstance(test, str) else test
+        if self._compress:
+            data = self._compress(data)
+        self._f.write(data)
+        self._offsets.append(self._f.tell())
+        return len(self) - 1
+
+    def close(self):
+        if self._f is None:
+            return
+        index_offset = self._f.tell()
+        offsets = _offsets(self._offsets)
+        if sys.byteorder != "little":
+            offsets.byteswap()
+        self._f.write(offsets.tobytes())
+        self._f.write(TRAILER.pack(len(self), index_offset, MAGIC))
+        self._f.close()
+        self._f = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class Corpus(object):
+    """
+    Reads a corpus file written by CorpusWriter.
+
+    len(corpus) ............ number of tests
+    corpus[i] .............. statetest file (json, bytes) of the i-th test
+    corpus.read(start, end)  yields (index, json bytes) of the tests start..end-1, reading the file sequentially
+    """
+
+    BUFFER_SIZE = 1024 * 1024
+
+    def __init__(self, path):
+        self.path = path
+        self._f = open(path, "rb", buffering=Corpus.BUFFER_SIZE)
+        header = self._f.read(len(MAGIC) + 1)
+        if header[:len(MAGIC)] != MAGIC:
+            raise CorpusError("%s is not a corpus file" % path)
+        codecs = {codec: decompress for (codec, _, decompress) in CODECS.values()}
+        if header[-1] not in codecs:
+            raise CorpusError("%s: unknown codec %d" % (path, header[-1]))
+        self._decompress = codecs[header[-1]]
+
+        self._f.seek(-TRAILER.size, 2)
+        (count, index_offset, magic) = TRAILER.unpack(self._f.read(TRAILER.size))
+        if magic != MAGIC:
+            raise CorpusError("%s is truncated, the index is missing" % path)
+        self._f.seek(index_offset)
+        self._offsets = _offsets()
+        self._offsets.frombytes(self._f.read(8 * (count + 1)))
+        if sys.byteorder != "little":
+            self._offsets.byteswap()
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def _decode(self, data):
+        return self._decompress(data) if self._decompress else data
+
+    def __getitem__(self, index):
+        if not -len(self) <= index < len(self):
+            raise IndexError("corpus index %d out of range" % index)
+        index = index % len(self)
+        self._f.seek(self._offsets[index])
+        return self._decode(self._f.read(self._offsets[index + 1] - self._offsets[index]))
+
+    def read(self, start=0, end=None):
+        """ yields (index, json bytes) of the tests start..end-1, clamped to the corpus """
+        end = len(self) if end is None else min(end, len(self))
+        start = max(start, 0)
+        if start >= end:
+            return
+        offsets = self._offsets
+        self._f.seek(offsets[start])
+        for index in range(start, end):
+            yield index, self._decode(self._f.read(offsets[index + 1] - offsets[index]))
+
+    def close(self):
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -37,8 +37,19 @@ def get_classes():
             yield cls
 
 
+_PLACEHOLDERS = None
+
+
+def get_placeholders():
+    """ returns the placeholder -> rndval class map. rndval is only scanned once """
+    global _PLACEHOLDERS
+    if _PLACEHOLDERS is None:
+        _PLACEHOLDERS = {cls.placeholder: cls for cls in get_classes()}
+    return _PLACEHOLDERS
+
+
 def process_template(d):
-    placeholders = {cls.placeholder:cls for cls in get_classes()}
+    placeholders = get_placeholders()
 
     def substitute(d,k):
         sub = placeholders.get(d[k])  # substitute with rnd class, otherwise keep value
@@ -55,3 +66,88 @@ class RandomTestsJsonEncoder(json.JSONEncoder):
         if isinstance(obj, rndval._RndBase):
             return obj.generate()
         return super(RandomTestsJsonEncoder, self).default(obj)
+
+
+def resolve(obj):
+    """
+    Returns a copy of obj with all rndval values generated, made of plain dicts, lists and scalars only.
+    Same as json.loads(json.dumps(obj, cls=RandomTestsJsonEncoder)), in a single pass and without the
+    intermediate string. Values are generated in the same order as the encoder would.
+    """
+    if isinstance(obj, dict):
+        return {k if isinstance(k, str) else json.dumps(k): resolve(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [resolve(v) for v in obj]
+    if isinstance(obj, (str, int, float)) or obj is None:
+        return obj
+    if isinstance(obj, rndval._RndBase):
+        return resolve(obj.generate())
+    raise TypeError("Object of type %s is not JSON serializable" % obj.__class__.__name__)
+
+
+def is_static(obj):
+    """ True if obj does not contain any rndval values, i.e. it encodes the same on every fill """
+    if isinstance(obj, dict):
+        return all(is_static(v) for v in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return all(is_static(v) for v in obj)
+    return not isinstance(obj, rndval._RndBase)
+
+
+class TemplatePlan(object):
+    """
+    A template analysed once into a flat list of (path, generator) slots and a skeleton of builders for its
+    static parts. Placeholder strings (text based templates) are replaced by instances of their rndval class.
+
+    fill() evaluates the slots into a fresh copy of the skeleton, which is the same as
+    resolve(process_template(templates.new(template))) without walking the template on every fill.
+    """
+
+    def __init__(self, template):
+        self.slots = []  # [(path, generator), ...] in the order the values are generated
+        self._value, self._builder = self._compile(template, ())
+
+    def _compile(self, obj, path):
+        """ returns (value, builder). builder(values) builds a copy of obj, taking generated values from the
+        iterator values, or is None if obj is an immutable scalar used as is """
+        if isinstance(obj, dict):
+            entries = []
+            for k, v in obj.items():
+                entries.append((k if isinstance(k, str) else json.dumps(k),) + self._compile(v, path + (k,)))
+            if all(b is None for _, _, b in entries):
+                static = {k: v for k, v, _ in entries}
+                return static, lambda values: static.copy()
+            return None, lambda values: {k: v if b is None else b(values) for k, v, b in entries}
+        if isinstance(obj, (list, tuple)):
+            entries = [self._compile(v, path + (i,)) for i, v in enumerate(obj)]
+            if all(b is None for _, b in entries):
+                static = [v for v, _ in entries]
+                return static, lambda values: static[:]
+            return None, lambda values: [v if b is None else b(values) for v, b in entries]
+        if isinstance(obj, str) and obj in get_placeholders():
+            obj = get_placeholders()[obj]()
+        if isinstance(obj, rndval._RndBase):
+            self.slots.append((path, obj))
+            return None, next
+        if isinstance(obj, (str, int, float)) or obj is None:
+            return obj, None
+        raise TypeError("Object of type %s is not JSON serializable" % obj.__class__.__name__)
+
+    def generate(self):
+        """ returns the generated values of all slots """
+        values = []
+        for _, generator in self.slots:
+            value = generator.generate()
+            values.append(value if isinstance(value, str) else resolve(value))
+        return values
+
+    def fill(self):
+        """ returns a filled copy of the template, made of plain dicts, lists and scalars only """
+        if self._builder is None:
+            return self._value
+        return self._builder(iter(self.generate()))
+
+
+def compile_template(template):
+    """ returns the TemplatePlan of template, to fill it many times """
+    return TemplatePlan(template)
@@ -11,6 +11,7 @@ from .hexint import RndHex32, RndBlockGasLimit, RndGasPrice, RndTransactionGasLi
 from .rlp import RndRlp
 from .seed import RandomSeed
 from .base import _RndBase, hex2
+from .source import RandomSource, DEFAULT_SOURCE
 
 from .code import RndCodeBytes
 
@@ -1,5 +1,4 @@
 import enum
-import random
 from .bytes import RndByteSequence
 from .base import _RndBase, WeightedRandomizer
 from evmlab import decode_hex
@@ -47,8 +46,8 @@ class RndAddress(RndByteSequence):
                                                         "0000000000000000000000000000000000000008"],
                  RndAddressType.SPECIAL_CREATE: [""]}
 
-    def __init__(self, seed=None, length=20, prefix="0x", _types=[RndAddressType.RANDOM]):
-        super().__init__(seed=seed, length=length, prefix=prefix)
+    def __init__(self, seed=None, length=20, prefix="0x", _types=[RndAddressType.RANDOM], source=None):
+        super().__init__(seed=seed, source=source, length=length, prefix=prefix)
         self.types = _types
 
     def _get_rnd_address_from_list(self, addrlist):
@@ -57,7 +56,7 @@ class RndAddress(RndByteSequence):
         elif not addrlist:
             raise KeyError("AddressType.%s is empty!" % self.types)
 
-        hex_addr = random.choice(addrlist)
+        hex_addr = self.source.choice(addrlist)
         if hex_addr.startswith("0x"):
             hex_addr = hex_addr[2:]  # skip 0x. will be generically added by prefix
         return "%s%s" % (self.prefix, hex_addr)
@@ -126,8 +125,8 @@ class RndDestAddress(RndAddress):
     placeholder = "[DESTADDRESS]"
 
     def __init__(self, seed=None, length=20, prefix="0x", _types=[RndAddressType.PRECOMPILED,
-                                                                  RndAddressType.STATE_ACCOUNT]):
-        super().__init__(seed=seed, length=length, prefix=prefix)
+                                                                  RndAddressType.STATE_ACCOUNT], source=None):
+        super().__init__(seed=seed, source=source, length=length, prefix=prefix)
         self.types = _types
 
 
@@ -137,22 +136,22 @@ class RndDestAddressOrZero(RndAddress):
 
     def __init__(self, seed=None, length=20, prefix="0x", _types=[RndAddressType.PRECOMPILED,
                                                                   RndAddressType.STATE_ACCOUNT,
-                                                                  RndAddressType.SPECIAL_CREATE]):
-        super().__init__(seed=seed, length=length, prefix=prefix)
+                                                                  RndAddressType.SPECIAL_CREATE], source=None):
+        super().__init__(seed=seed, source=source, length=length, prefix=prefix)
         self.types = _types
 
 
 class RndSourceAddress(RndAddress):
 
-    def __init__(self, seed=None, length=20, prefix="0x"):
-        super().__init__(seed=seed, length=length, prefix=prefix)
+    def __init__(self, seed=None, length=20, prefix="0x", source=None):
+        super().__init__(seed=seed, source=source, length=length, prefix=prefix)
 
         # more likely to hit a valid address
-        weights = {RndAddress().generate: 5,
-                   RndDestAddress().generate: 10,
+        weights = {RndAddress(source=self.source).generate: 5,
+                   RndDestAddress(source=self.source).generate: 10,
                    lambda: "0x"+RndAddress.addresses[RndAddressType.SENDING_ACCOUNT][0]: 85,}
 
-        self._randomizer = WeightedRandomizer(weights=weights)
+        self._randomizer = WeightedRandomizer(weights=weights, source=self.source)
 
     def generate(self):
         return self._randomizer.random()()
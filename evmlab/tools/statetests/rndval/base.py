@@ -1,34 +1,110 @@
-import random
 import binascii
+from .source import RandomSource, DEFAULT_SOURCE
+
+try:
+    import numpy
+except ImportError:
+    # optional, speeds up generating large batches. run `#> pip install evmlab[numpy]` to install.
+    numpy = None
+
+# use the vectorized (numpy) implementations if available
+USE_NUMPY = numpy is not None
+
+
+def numpy_rng(source=None):
+    """returns a numpy generator seeded from the given RandomSource, so that seeding the source
+    still determines all values generated
+    """
+    return numpy.random.default_rng((source or DEFAULT_SOURCE).getrandbits(64))
 
 
 class WeightedRandomizer(object):
-    # https://stackoverflow.com/a/14993631/1729555
-    def __init__(self, weights):
-        self.__max = .0
-        self.__weights = []
-        for value, weight in weights.items():
-            if weight == 0:
-                # skip disabled items
-                continue
-            self.__max += weight
-            self.__weights.append((self.__max, value))
-
-    def random(self):
-        if len(self.__weights) == 1:
-            return self.__weights[0][1]  # shortcut: return value
-
-        r = random.random() * self.__max
-        for ceil, value in self.__weights:
-            if ceil > r:
-                return value
-
-
-def toCompactHex(int):
-    raise NotImplementedError
+    """
+    Draws values according to their weights in O(1), using Vose's alias method:
+    https://www.keithschwarz.com/darts-dice-coins/
+
+    Every value gets a column of equal height. A column holds the value itself up to its
+    threshold, the rest of the column is filled up with another (alias) value.
+    """
+    def __init__(self, weights, source=None):
+        self.source = source or DEFAULT_SOURCE
+        # skip disabled items
+        items = [(value, weight) for value, weight in weights.items() if weight != 0]
+        self.__values = [value for value, _ in items]
+
+        n = len(items)
+        total = float(sum(weight for _, weight in items))
+        threshold = [weight * n / total for _, weight in items]
+        alias = list(range(n))
+        small = [i for i, t in enumerate(threshold) if t < 1.0]
+        large = [i for i, t in enumerate(threshold) if t >= 1.0]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            alias[s] = l
+            threshold[l] = threshold[l] - (1.0 - threshold[s])
+            (small if threshold[l] < 1.0 else large).append(l)
+        for i in small + large:
+            # leftovers are only due to rounding errors, they are full columns
+            threshold[i] = 1.0
+
+        self.__threshold = threshold
+        self.__aliases = [self.__values[i] for i in alias]
+        self.__arrays = None  # numpy versions of the tables, built on first use
+
+    def __len__(self):
+        return len(self.__values)
+
+    def random(self, source=None):
+        n = len(self.__values)
+        if n <= 1:
+            return self.__values[0] if n else None  # shortcut: return value
+
+        u = (source or self.source).random() * n
+        i = int(u)
+        return self.__values[i] if u - i < self.__threshold[i] else self.__aliases[i]
+
+    def sample(self, n, source=None):
+        """returns a list of n random draws"""
+        values, threshold, aliases, k = self.__values, self.__threshold, self.__aliases, len(self.__values)
+        if k <= 1:
+            return [self.random()] * max(n, 0)
+
+        rnd = (source or self.source).random
+        samples = []
+        for _ in range(n):
+            u = rnd() * k
+            i = int(u)
+            samples.append(values[i] if u - i < threshold[i] else aliases[i])
+        return samples
+
+    def sample_bytes(self, n, source=None):
+        """returns n random draws as bytes. all values must be in 0..255"""
+        if n <= 0:
+            return b''
+        if not USE_NUMPY or len(self.__values) <= 1:
+            return bytes(self.sample(n, source=source))
+
+        if self.__arrays is None:
+            self.__arrays = (numpy.array(self.__values, dtype=numpy.uint8),
+                             numpy.array(self.__threshold),
+                             numpy.array(self.__aliases, dtype=numpy.uint8))
+        values, threshold, aliases = self.__arrays
+        u = numpy_rng(source or self.source).random(n) * len(values)
+        i = u.astype(numpy.intp)
+        return numpy.where(u - i < threshold[i], values[i], aliases[i]).tobytes()
+
+
+def toCompactBytes(i, min_size=0):
+    """ big endian bytes of i without leading zeros, at least min_size bytes. 0 is b'' by default """
+    return i.to_bytes(max((i.bit_length() + 7) // 8, min_size), "big")
+
+def toCompactHex(i, min_size=0):
+    """ hexstring (without 0x prefix) of i without leading zero bytes, at least min_size bytes """
+    return toCompactBytes(i, min_size).hex()
 
 def fromHex(b):
-    raise NotImplementedError
+    """ bytes of the hexstring b, with or without 0x prefix """
+    return bytes.fromhex(b[2:] if b.startswith(("0x", "0X")) else b)
 
 def hex2(n):
     # https://stackoverflow.com/questions/4368676/is-there-a-way-to-pad-to-an-even-number-of-digits
@@ -49,9 +125,11 @@ class _RndBase(object):
 
     QUOTE = "'"
 
-    def __init__(self, seed=None, _config=None):
+    def __init__(self, seed=None, _config=None, source=None):
         self.seed = seed
         self._config = _config
+        # a seeded generator gets a source of its own, all others share the default source
+        self.source = source or (RandomSource(seed) if seed is not None else DEFAULT_SOURCE)
 
     def __str__(self):
         # for json serialization
@@ -69,10 +147,12 @@ class _RndBase(object):
         max = max or 2**64-1
         assert(min <= max)
         # numpy.random.randint
-        return min + random.randint(min, max) % (max-min)  # uniIntDist 0..0x7fffffff
+        return min + self.source.randint(min, max) % (max-min)  # uniIntDist 0..0x7fffffff
 
     def randomByteSequence(self, length):
-        return bytearray(random.getrandbits(8) for _ in range(length))
+        if length <= 0:
+            return bytearray()
+        return bytearray(self.source.bytes(length))
 
     def randomPercent(self):
         return self.randomUniInt(0,100)  ## percentDist 0..100 percent
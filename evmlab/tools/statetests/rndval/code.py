@@ -1,6 +1,5 @@
 
 
-import random
 import binascii
 from .base import _RndBase, WeightedRandomizer
 
@@ -9,8 +8,8 @@ class _RndCodeBase(_RndBase):
 
     FLAG_FOCUS_CONSTANTINOPLE = 1
 
-    def __init__(self, seed=None, length=None, prefix="0x", fill_arguments=True, flags=[], _config=None):
-        super().__init__(seed=seed, _config=_config)
+    def __init__(self, seed=None, length=None, prefix="0x", fill_arguments=True, flags=[], _config=None, source=None):
+        super().__init__(seed=seed, source=source, _config=_config)
         self.length = length
         self.prefix = prefix
         self.fill_arguments = fill_arguments
@@ -349,25 +348,26 @@ class RndCodeBytes(_RndCodeBase):
     MIN_CONTRACT_SIZE = 6
     MAX_CONTRACT_SIZE = 11526
 
+    _RANDOMIZERS = None
+
 
 
     def random_code_byte_sequence(self, length=None):
         # todo: add gauss histogramm random.randgauss(min,max,avg) - triangle is not really correct here
-        length = length or int(random.triangular(self.MIN_CONTRACT_SIZE, 2 * self.AVERAGE_CONTRACT_SIZE + self.MIN_CONTRACT_SIZE))  # use gauss
+        length = length or int(self.source.triangular(self.MIN_CONTRACT_SIZE, 2 * self.AVERAGE_CONTRACT_SIZE + self.MIN_CONTRACT_SIZE))  # use gauss
 
-        rnd_prolog = WeightedRandomizer(self.LIKELYHOOD_PROLOG_BY_OPCODE_INT)
-        rnd_epilog = WeightedRandomizer(self.LIKELYHOOD_EPILOG_BY_OPCODE_INT)  # not completely true as this incorps. pro/epilog
-        rnd_corpus = WeightedRandomizer(self.LIKELYHOOD_BY_OPCODE_INT)
+        (rnd_prolog, rnd_corpus, rnd_epilog) = self._randomizers()
 
-        b = []
-        for _ in range(128):
-            b.append(rnd_prolog.random())
-        for _ in range(length - 128 * 2):
-            b.append(rnd_corpus.random())
-        for _ in range(128):
-            b.append(rnd_epilog.random())
+        return rnd_prolog.sample_bytes(128, self.source) + rnd_corpus.sample_bytes(length - 128 * 2, self.source) + rnd_epilog.sample_bytes(128, self.source)
 
-        return bytes(b)
+    @classmethod
+    def _randomizers(cls):
+        # the tables are static, so the alias tables are only built once
+        if cls._RANDOMIZERS is None:
+            cls._RANDOMIZERS = (WeightedRandomizer(cls.LIKELYHOOD_PROLOG_BY_OPCODE_INT),
+                                WeightedRandomizer(cls.LIKELYHOOD_BY_OPCODE_INT),
+                                WeightedRandomizer(cls.LIKELYHOOD_EPILOG_BY_OPCODE_INT))  # not completely true as this incorps. pro/epilog
+        return cls._RANDOMIZERS
 
     def generate(self, length=50):
         return "%s%s" % (self.prefix,
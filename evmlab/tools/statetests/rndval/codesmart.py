@@ -1,6 +1,6 @@
-import random
 import binascii
 
+from . import base
 from .base import _RndBase, WeightedRandomizer, int2bytes
 from .code import _RndCodeBase
 from .address import RndAddress, RndDestAddress, RndAddressType
@@ -95,6 +95,7 @@ const_opcodes = [0x1b, #: ['SHL', 2, 1, 3],
                     0x3f] #: ['EXTCODEHASH', 1, 1, 400],
 
 constantinople_skewed_set = valid_opcodes + const_opcodes + const_opcodes  + const_opcodes 
+constantinople_skewed_array = base.numpy.array(constantinople_skewed_set, dtype=base.numpy.uint8) if base.USE_NUMPY else None
 
 from evmlab import decode_hex
 def as_bytes(s):
@@ -117,11 +118,16 @@ class RndCodeInstr(_RndCodeBase):
 
     def random_code_byte_sequence(self, length=None):
         # todo: add gauss histogramm random.randgauss(min,max,avg) - triangle is not really correct here
-        length = length or int(random.triangular(self.MIN_CONTRACT_SIZE, 2 * self.AVERAGE_CONTRACT_SIZE + self.MIN_CONTRACT_SIZE))  # use gauss
+        length = length or int(self.source.triangular(self.MIN_CONTRACT_SIZE, 2 * self.AVERAGE_CONTRACT_SIZE + self.MIN_CONTRACT_SIZE))  # use gauss
 
-        b = [random.choice(constantinople_skewed_set) for _ in range(length)]
+        if base.USE_NUMPY:
+            return base.numpy_rng(self.source).choice(constantinople_skewed_array, size=length).tobytes()
 
-        return bytes(b)
+        return bytes(self.source.choices(constantinople_skewed_set, k=length))
+
+    def _randomize_operand(self, instr):
+        instr.operand_bytes = self.source.bytes(instr.length_of_operand)
+        return instr
 
     def _track_address(self, address):
         self._addresses_seen.add(binascii.hexlify(address).decode("utf-8"))
@@ -143,16 +149,16 @@ class RndCodeInstr(_RndCodeBase):
             if self.randomPercent() < self._config_getint("engine.RndCodeInstr.smartCodeProbability.p", 990)/10:
                 # push arguments code
                 if instr.name.startswith("PUSH"):
-                    instr.randomize_operand()
+                    self._randomize_operand(instr)
                 elif instr.name.startswith("SWAP"):
                     times = instr.opcode - asm_registry.create_instruction("SWAP1").opcode +2
                     for _ in range(times):
-                        yield asm_registry.create_instruction("PUSH%s"%self.randomUniInt(1,32)).randomize_operand()
+                        yield self._randomize_operand(asm_registry.create_instruction("PUSH%s"%self.randomUniInt(1,32)))
                     args_filled = True
                 elif instr.name.startswith("DUP"):
                     times = instr.opcode - asm_registry.create_instruction("DUP1").opcode + 1
                     for _ in range(times):
-                        yield asm_registry.create_instruction("PUSH%s"%self.randomUniInt(1,32)).randomize_operand()
+                        yield self._randomize_operand(asm_registry.create_instruction("PUSH%s"%self.randomUniInt(1,32)))
                     args_filled = True
                 elif instr.name.startswith("LOG"):
                     # There can be any number of topics, 
@@ -182,7 +188,7 @@ class RndCodeInstr(_RndCodeBase):
                     yield create_push_for_data(self.randomSmallMemoryLength())   # length
                     yield create_push_for_data(self.randomMemoryLength())        # codeoffset
                     yield create_push_for_data(self.randomSmallMemoryLength())   # memoffset
-                    yield create_push_for_data(self._track_address(RndDestAddress().as_bytes()))      # address
+                    yield create_push_for_data(self._track_address(RndDestAddress(source=self.source).as_bytes()))      # address
                     args_filled = True
                 elif instr.name=="CODECOPY":
                     yield create_push_for_data(self.randomSmallMemoryLength())   # length
@@ -200,7 +206,7 @@ class RndCodeInstr(_RndCodeBase):
                     yield create_push_for_data(self.randomSmallMemoryLength())
                     yield create_push_for_data(self.randomSmallMemoryLength())
                     yield create_push_for_data(self.randomUniInt(max=255))   # value
-                    yield create_push_for_data(self._track_address(RndDestAddress().as_bytes()))  # address
+                    yield create_push_for_data(self._track_address(RndDestAddress(source=self.source).as_bytes()))  # address
                     yield create_push_for_data(self.randomUniInt())          # gas 
                     args_filled = True
                 elif instr.name in ("STATICCALL","DELEGATECALL"):
@@ -208,11 +214,11 @@ class RndCodeInstr(_RndCodeBase):
                     yield create_push_for_data(self.randomSmallMemoryLength()) # retoffset
                     yield create_push_for_data(self.randomSmallMemoryLength()) # insize
                     yield create_push_for_data(self.randomSmallMemoryLength()) # inoffset
-                    yield create_push_for_data(self._track_address(RndDestAddress().as_bytes()))
+                    yield create_push_for_data(self._track_address(RndDestAddress(source=self.source).as_bytes()))
                     yield create_push_for_data(self.randomUniInt())            # gas
                     args_filled = True
                 elif instr.name=="SUICIDE":
-                    yield create_push_for_data(self._track_address(RndDestAddress().as_bytes()))
+                    yield create_push_for_data(self._track_address(RndDestAddress(source=self.source).as_bytes()))
                     args_filled = True
                 elif instr.name in ("RETURN","REVERT"):
                     yield create_push_for_data(self.randomSmallMemoryLength())
@@ -236,7 +242,7 @@ class RndCodeInstr(_RndCodeBase):
                     args_filled = True
                 elif instr.name in ["EXTCODEHASH", "EXTCODESIZE"]:
                     # todo: rework                    
-                    yield create_push_for_data(self._track_address(RndDestAddress().as_bytes()))  # address
+                    yield create_push_for_data(self._track_address(RndDestAddress(source=self.source).as_bytes()))  # address
                     args_filled = True
                 elif instr.category in ("bitwise-logic","comparison"):
                     for _ in instr.args:
@@ -1,29 +1,64 @@
 import random
+import collections
+import contextlib
+import threading
 import evmdasm
 import evmcodegen
+import evmcodegen.utils.random
 from evmcodegen.codegen import Rnd
 from .code import _RndCodeBase
 from .address import RndAddress, RndDestAddress, RndAddressType
-from .base import WeightedRandomizer
-
-
-VALUEMAP ={
-    evmdasm.argtypes.Address: lambda: RndDestAddress().as_bytes(),
-    evmdasm.argtypes.Word: lambda: Rnd.byte_sequence(32),
-    evmdasm.argtypes.Timestamp: lambda: Rnd.byte_sequence(4),
-    evmdasm.argtypes.Data: lambda: Rnd.byte_sequence(Rnd.uni_integer(0, Rnd.opcode())),
-    evmdasm.argtypes.CallValue: lambda: Rnd.uni_integer(0,1024),
-    evmdasm.argtypes.Gas: lambda: Rnd.uni_integer(0,1024),
-    evmdasm.argtypes.Length: lambda: Rnd.small_memory_length_1024(),
-    evmdasm.argtypes.MemOffset: lambda: Rnd.small_memory_length_1024(),
-    evmdasm.argtypes.Index256: lambda: Rnd.uni_integer(1,256),
-    evmdasm.argtypes.Index64: lambda: Rnd.uni_integer(1,64),
-    evmdasm.argtypes.Index32: lambda: Rnd.length_32(),
-    evmdasm.argtypes.Byte: lambda: Rnd.byte_sequence(1),
-    evmdasm.argtypes.Bool: lambda: Rnd.byte_sequence(1),
-    evmdasm.argtypes.Value: lambda: Rnd.uni_integer(),
-    #evmdasm.argtypes.Label: lambda: 0xc0fefefe,  # this is handled by fix_code_layout (fix jumps)
-}
+from .base import _RndBase, WeightedRandomizer
+
+
+def valuemap(source=None):
+    """values for the stack arguments of generated instructions, drawn from the given RandomSource"""
+    rnd = _RndBase(source=source)
+    return {
+        evmdasm.argtypes.Address: lambda: RndDestAddress(source=rnd.source).as_bytes(),
+        evmdasm.argtypes.Word: lambda: rnd.randomByteSequence(32),
+        evmdasm.argtypes.Timestamp: lambda: rnd.randomByteSequence(4),
+        evmdasm.argtypes.Data: lambda: rnd.randomByteSequence(rnd.randomUniInt(0, rnd.randomOpcode())),
+        evmdasm.argtypes.CallValue: lambda: rnd.randomUniInt(0,1024),
+        evmdasm.argtypes.Gas: lambda: rnd.randomUniInt(0,1024),
+        evmdasm.argtypes.Length: lambda: rnd.randomSmallMemoryLength(),
+        evmdasm.argtypes.MemOffset: lambda: rnd.randomSmallMemoryLength(),
+        evmdasm.argtypes.Index256: lambda: rnd.randomUniInt(1,256),
+        evmdasm.argtypes.Index64: lambda: rnd.randomUniInt(1,64),
+        evmdasm.argtypes.Index32: lambda: rnd.randomLength32(),
+        evmdasm.argtypes.Byte: lambda: rnd.randomByteSequence(1),
+        evmdasm.argtypes.Bool: lambda: rnd.randomByteSequence(1),
+        evmdasm.argtypes.Value: lambda: rnd.randomUniInt(),
+        #evmdasm.argtypes.Label: lambda: 0xc0fefefe,  # this is handled by fix_code_layout (fix jumps)
+    }
+
+
+VALUEMAP = valuemap()
+
+# evmcodegen draws from the random module imported by these modules
+EVMCODEGEN_MODULES = (evmcodegen.codegen, evmcodegen.generators.distribution, evmcodegen.utils.random)
+_evmcodegen_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def evmcodegen_random(rnd):
+    """routes the draws of evmcodegen to rnd, a random.Random, instead of the global random module.
+    evmcodegen is used by one thread at a time"""
+    with _evmcodegen_lock:
+        modules = [(module, module.random) for module in EVMCODEGEN_MODULES]
+        for module, _ in modules:
+            module.random = rnd
+        try:
+            yield rnd
+        finally:
+            for module, saved in modules:
+                module.random = saved
+
+# config snapshot of RndCodeSmart2, see RndCodeSmart2.reload()
+Settings = collections.namedtuple("Settings", ["min_gas",
+                                               "fix_stack_arguments_p", "fix_stack_balance_p",
+                                               "mutate_instructions_p", "mutate_instructions_max_amount",
+                                               "mutate_bytecode_p", "mutate_bytecode_max_amount"])
 
 
 class InstructionMutators:
@@ -118,26 +153,71 @@ class RndCodeSmart2(_RndCodeBase):
 
     # analyzed based on statedump.json
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._valuemap = valuemap(self.source)
+        self.reload()
+
+    def reload(self, _config=None):
+        """
+        (re)builds the generator, distribution, mutation samplers and the settings snapshot from the config.
+        generate() does not look at the config, call this after changing it.
+        """
+        if _config is not None:
+            self._config = _config
+
+        self.distribution = getattr(evmcodegen.distributions,
+                                    self._config_get("engine.RndCodeSmart2.distribution", ""),
+                                    evmcodegen.distributions.EVM_CATEGORY)
+        generator = getattr(evmcodegen.generators.distribution,
+                            self._config_get("engine.RndCodeSmart2.generator", ""),
+                            evmcodegen.generators.distribution.GaussDistrCodeGen)
+        self.generator = generator(distribution=self.distribution)
+
+        self.settings = Settings(
+            min_gas=self._config_getint("engine.RndCodeSmart2.min_gas", 100),
+            fix_stack_arguments_p=self._config_getint("engine.RndCodeSmart2.fixes.fix_stack_arguments.p", 995),
+            fix_stack_balance_p=self._config_getint("engine.RndCodeSmart2.fixes.fix_stack_balance.p", 950),
+            mutate_instructions_p=self._config_getint("engine.RndCodeSmart2.mutate.instructions.p", 10),
+            mutate_instructions_max_amount=self._config_getint("engine.RndCodeSmart2.mutate.instructions.max_amount", 3),
+            mutate_bytecode_p=self._config_getint("engine.RndCodeSmart2.mutate.bytecode.p", 1),
+            mutate_bytecode_max_amount=self._config_getint("engine.RndCodeSmart2.mutate.bytecode.max_amount", 3))
+
+        weights = {InstructionMutators.randomize_operand: self._config_getint("engine.RndCodeSmart2.mutate.instructions.randomize_operand.weight", 60),
+                   InstructionMutators.drop_item: self._config_getint("engine.RndCodeSmart2.mutate.instructions.drop_item.weight", 10),
+                   InstructionMutators.dup_instruction: self._config_getint("engine.RndCodeSmart2.mutate.instructions.dup_instruction.weight", 20),
+                   InstructionMutators.insert_random_instructions: self._config_getint("engine.RndCodeSmart2.mutate.instructions.insert_random_instructions.weight", 10)}
+        self._instruction_mutator = WeightedRandomizer(weights=weights, source=self.source)
+
+        weights = {BytecodeMutators.dup_byte: self._config_getint("engine.RndCodeSmart2.mutate.bytecode.dup_byte.weight", 50),
+                   BytecodeMutators.insert_random_bytes: self._config_getint("engine.RndCodeSmart2.mutate.bytecode.insert_random_bytes.weight", 10),
+                   BytecodeMutators.drop_byte: self._config_getint("engine.RndCodeSmart2.mutate.bytecode.drop_byte.weight", 20),
+                   BytecodeMutators.switch_random: self._config_getint("engine.RndCodeSmart2.mutate.bytecode.switch_random.weight", 20)}
+        self._bytecode_mutator = WeightedRandomizer(weights=weights, source=self.source)
+        return self
+
     def generate(self, length=None):
-        # override this in here to adjust weights
-        distribution = getattr(evmcodegen.distributions,
-                                self._config_get("engine.RndCodeSmart2.distribution", ""),
-                                evmcodegen.distributions.EVM_CATEGORY)
+        # evmcodegen draws from a private random.Random seeded from our source, so that the generated code
+        # is determined by the source, and the global random module is left alone
+        with evmcodegen_random(random.Random(self.source.getrandbits(64))):
+            return self._generate(length)
+
+    def _generate(self, length):
+        settings = self.settings
 
         if length is None:
-            length = distribution.avg
-        generator = evmcodegen.generators.distribution.GaussDistrCodeGen(distribution=distribution)
+            length = self.distribution.avg
 
         evmcode = evmcodegen.codegen.CodeGen()\
-            .generate(generator=generator, length=length, min_gas=self._config_getint("engine.RndCodeSmart2.min_gas", 100))\
+            .generate(generator=self.generator, length=length, min_gas=settings.min_gas)\
 
         # fix the stack and code in 99.5% of cases
-        if Rnd.uni_integer(0,1000) <= self._config_getint("engine.RndCodeSmart2.fixes.fix_stack_arguments.p", 995):
-            evmcode.fix_stack_arguments(valuemap=VALUEMAP)\
+        if self.randomUniInt(0,1000) <= settings.fix_stack_arguments_p:
+            evmcode.fix_stack_arguments(valuemap=self._valuemap)\
                 .fix_jumps()
 
         # fix stack balance in 95% of cases
-        if Rnd.uni_integer(0,1000) <= self._config_getint("engine.RndCodeSmart2.fixes.fix_stack_balance.p", 950):
+        if self.randomUniInt(0,1000) <= settings.fix_stack_balance_p:
             # balance it?
             evmcode.fix_stack_balance()
 
@@ -147,21 +227,13 @@ class RndCodeSmart2(_RndCodeBase):
         ######## mutation ########
 
         # mutate instructions in 1% of cases - likely invalid code
-        if Rnd.uni_integer(0,1000) <= self._config_getint("engine.RndCodeSmart2.mutate.instructions.p", 10):
-            weights = {InstructionMutators.randomize_operand: self._config_getint("engine.RndCodeSmart2.mutate.instructions.randomize_operand.weight", 60),
-                       InstructionMutators.drop_item: self._config_getint("engine.RndCodeSmart2.mutate.instructions.drop_item.weight", 10),
-                       InstructionMutators.dup_instruction: self._config_getint("engine.RndCodeSmart2.mutate.instructions.dup_instruction.weight", 20),
-                       InstructionMutators.insert_random_instructions: self._config_getint("engine.RndCodeSmart2.mutate.instructions.insert_random_instructions.weight", 10)}
-            mutator = WeightedRandomizer(weights=weights)
-            evmcode.instructions = mutator.random()(evmcode.instructions,Rnd.uni_integer(1,self._config_getint("engine.RndCodeSmart2.mutate.instructions.max_amount", 3)))
+        if self.randomUniInt(0,1000) <= settings.mutate_instructions_p:
+            mutator = self._instruction_mutator.random()
+            evmcode.instructions = mutator(evmcode.instructions, Rnd.uni_integer(1, settings.mutate_instructions_max_amount))
 
         # mutate evmbytecode in 0.1% of  - very likely invalid code
-        if Rnd.uni_integer(0, 1000) <= self._config_getint("engine.RndCodeSmart2.mutate.bytecode.p", 1):
-            weights = {BytecodeMutators.dup_byte: self._config_getint("engine.RndCodeSmart2.mutate.bytecode.dup_byte.weight", 50),
-                       BytecodeMutators.insert_random_bytes: self._config_getint("engine.RndCodeSmart2.mutate.bytecode.insert_random_bytes.weight", 10),
-                       BytecodeMutators.drop_byte: self._config_getint("engine.RndCodeSmart2.mutate.bytecode.drop_byte.weight", 20),
-                       BytecodeMutators.switch_random: self._config_getint("engine.RndCodeSmart2.mutate.bytecode.switch_random.weight", 20)}
-            mutator = WeightedRandomizer(weights=weights)
-            evmcode.instructions = evmdasm.EvmBytecode(mutator.random()(evmcode.assemble().as_bytes, Rnd.uni_integer(1, self._config_getint("engine.RndCodeSmart2.mutate.bytecode.max_amount", 3)))).disassemble()
+        if self.randomUniInt(0, 1000) <= settings.mutate_bytecode_p:
+            mutator = self._bytecode_mutator.random()
+            evmcode.instructions = evmdasm.EvmBytecode(mutator(evmcode.assemble().as_bytes, Rnd.uni_integer(1, settings.mutate_bytecode_max_amount))).disassemble()
 
         return "0x%s" % evmcode.assemble().as_hexstring
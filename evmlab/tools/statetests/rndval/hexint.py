@@ -7,8 +7,8 @@ class RndHexInt(_RndBase):
     """
     placeholder = "[HEX]"
 
-    def __init__(self, seed=None, _min=None, _max=None):
-        super().__init__(seed=seed)
+    def __init__(self, seed=None, _min=None, _max=None, source=None):
+        super().__init__(seed=seed, source=source)
         self.min = _min or 0
         self.max = _max or 2**64-1  # max int 64
 
@@ -22,8 +22,8 @@ class RndHex32(RndHexInt):
     """
     placeholder = "[HEX32]"
 
-    def __init__(self, seed=None, _min=None, _max=None):
-        super().__init__(seed=seed, _min=_min or 0, _max=_max or 2 ** 32 - 1)
+    def __init__(self, seed=None, _min=None, _max=None, source=None):
+        super().__init__(seed=seed, source=source, _min=_min or 0, _max=_max or 2 ** 32 - 1)
 
 
 class RndBlockGasLimit(RndHexInt):
@@ -32,8 +32,8 @@ class RndBlockGasLimit(RndHexInt):
     """
     placeholder = "[BLOCKGASLIMIT]"
 
-    def __init__(self, seed=None, _min=None, _max=None):
-        super().__init__(seed=seed, _min=_min or 2**50, _max=_max or 2 ** 64 - 1)
+    def __init__(self, seed=None, _min=None, _max=None, source=None):
+        super().__init__(seed=seed, source=source, _min=_min or 2**50, _max=_max or 2 ** 64 - 1)
 
 
 class RndTransactionGasLimit(RndHexInt):
@@ -42,8 +42,8 @@ class RndTransactionGasLimit(RndHexInt):
     """
     placeholder = "[TRANSACTIONGASLIMIT]"
 
-    def __init__(self, seed=None, _min=None, _max=None):
-        super().__init__(seed=seed, _min=_min or 25000, _max=_max or 10000000)
+    def __init__(self, seed=None, _min=None, _max=None, source=None):
+        super().__init__(seed=seed, source=source, _min=_min or 25000, _max=_max or 10000000)
 
 
 class RndGasPrice(RndHexInt):
@@ -52,6 +52,6 @@ class RndGasPrice(RndHexInt):
     """
     placeholder = "[GASPRICE]"
 
-    def __init__(self, seed=None, _min=None, _max=None):
-        super().__init__(seed=seed, _min=_min or 0, _max=_max or 10)
+    def __init__(self, seed=None, _min=None, _max=None, source=None):
+        super().__init__(seed=seed, source=source, _min=_min or 0, _max=_max or 10)
 
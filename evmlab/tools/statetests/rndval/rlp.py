@@ -1,111 +1,103 @@
-from .base import _RndBase, toCompactHex, fromHex
+from .base import _RndBase, toCompactBytes
+
+
+# maps random bytes to single byte rlp items [0x00, 0x7f]
+_LIST_ITEMS = bytes(b & 0x7f for b in range(256))
+
 
 class RndRlp(_RndBase):
     """
-    Random RLP String
+    Random RLP String, valid or deliberately malformed
+
+    based on testeth's fillRandomRLP:
+    https://github.com/ethereum/testeth/blob/develop/test/tools/fuzzTesting/createRandomTest.cpp
+
+    depth ....... nesting depth of the lists, 1 = a single item
+    malformed ... percentage of items that are malformed: leading zeros in lengths and payloads, single bytes >= 0x80,
+                  lengths out of range. 0 = valid rlp only
     """
     placeholder = "[RLP]"
 
-    def generate(self, depth=2):
-        """
-        :return:
-        """
+    def __init__(self, depth=2, malformed=20, prefix="0x", seed=None, _config=None, source=None):
+        super().__init__(seed=seed, _config=_config, source=source)
         assert(1 <= depth <= 7)
-        return 1
-
-    def recursive_rlp(self, depth):
-        result = ''
-        header = ''
+        self.depth = depth
+        self.malformed = malformed
+        self.prefix = prefix
+
+    def generate(self, depth=None):
+        return "%s%s" % (self.prefix, self.as_bytes(depth=depth).hex())
+
+    def as_bytes(self, depth=None):
+        buf = bytearray()
+        self.recursive_rlp(buf, depth or self.depth)
+        return bytes(buf)
+
+    def generate_batch(self, n, depth=None):
+        """ returns n random rlp hexstrings, built in one buffer """
+        buf = bytearray()
+        offsets = [0]
+        for _ in range(n):
+            self.recursive_rlp(buf, depth or self.depth)
+            offsets.append(len(buf))
+        data = memoryview(buf)
+        return ["%s%s" % (self.prefix, data[offsets[i]:offsets[i + 1]].hex()) for i in range(n)]
+
+    def _long_header(self, base, length, zeros=b''):
+        # [base + 55 + len(length)] + length. malformed if zeros are given, or if length <= 55
+        length = zeros + toCompactBytes(length, 1)
+        return toCompactBytes(base + 55 + len(length)) + length
+
+    def _header(self, base, length):
+        return toCompactBytes(base + length) if length <= 55 else self._long_header(base, length)
+
+    def recursive_rlp(self, buf, depth):
+        """ appends a random rlp item of the given depth to the bytearray buf """
+        start = len(buf)
 
         if depth > 1:
-
             # create RLP blocks
-            size = 1 + self.randomSmallUniInt() % 4
-            res_block = []
-            for i in range(size):
-                res_block.append(self.recursive_rlp(depth=depth-1))
-
-            result += ''.join(res_block)
-
-            # make RLP header
-            length = len(result) / 2
-
-            if self.randomPercent() < 10:
-
-                # make header as array
-                if length <= 55:
-                    header = toCompactHex(128 + length)
-                    rtype = 1
-                else:
-                    hexlength = toCompactHex(length)
-                    header = toCompactHex(183 + len(hexlength) / 2) + hexlength # todo fixit
-                    rtype = 2
-
-            else:
-
-                # make header as list
-                if length <= 55:
-                    header = toCompactHex(192+length)
-                    rtype = 3
-                else:
-                    hexlength = toCompactHex(length,1)
-                    header = toCompactHex(247 + len(hexlength)/2) + hexlength
-                    rtype = 4
-
-            return header + result
-
-
-        if depth == 1:
-            generate_valid_rlp = False if self.randomPercent() < 80 else True
-
-            genbug_1 = True if not generate_valid_rlp and self.randomPercent() < 50 else False
-            genbug_2 = True if not generate_valid_rlp and self.randomPercent() < 50 else False
-
-            emptyZeros = emptyZeros2 = ""
-            if not generate_valid_rlp:
-                emptyZeros = "00" if genbug_1 else ""
-                emptyZeros2 = "00" if genbug_2 else ""
-
-            rnd = self.randomSmallUniInt() % 5
-
-            if rnd == 0:
-                # // single byte [0x00, 0x7f]
-                rlp = emptyZeros + toCompactHex(self.randomSmallUniInt()%255 if genbug_1 else self.randomSmallUniInt() % 128, 1)
-                return rlp + result
-
-            elif rnd == 1:
-                # string 0-55 [0x80, 0xb7] + string
-                length = self.randomSmallUniInt() % 255 if genbug_1 else self.randomSmallUniInt() % 55
-                _hex = self.randomByteSequence(length)
-                if length == 1:
-                    if generate_valid_rlp and fromHex(hex)[0] < 128:
-                        _hex = toCompactHex(128)
-                return toCompactHex(128+length) + emptyZeros + _hex
-
-            elif rnd == 2:
-                # string more 55 [0xb8, 0xbf] + length + string
-                length = self.randomPercent()
-                if length < 56 and generate_valid_rlp:
-                    length = 56
-
-                _hex = self.randomByteSequence(length)
-                hexlen = emptyZeros2 + toCompactHex(length, 1)
-                rlpblock = toCompactHex(183 + len(hexlen) / 2) + hexlen + emptyZeros + hex;
-                return rlpblock + result
-
-            elif rnd == 3:
-                # list 0-55 [0xc0, 0xf7] + data
-                length = self.randomSmallUniInt() % 255 if genbug_1 else self.randomSmallUniInt() % 55
-                _hex = emptyZeros + self.randomByteSequence(length)
-                return toCompactHex(192 + length) + _hex
-
-            elif rnd == 4:
-                # list more 55 [0xf8, 0xff] + length + data
-
-                length = self.randomPercent()
-                if generate_valid_rlp and length < 56:
-                    length = 56
-
-                hexlen = emptyZeros2 + toCompactHex(length, 1)
-                rlpblock = toCompactHex(247 + len(hexlen)/2) + hexlen + emptyZeros + self.randomByteSequence(length)
-                return rlpblock + result
+            for _ in range(1 + self.randomSmallUniInt() % 4):
+                self.recursive_rlp(buf, depth=depth - 1)
+
+            # prepend the RLP header, as string in 10% of the cases or as list
+            length = len(buf) - start
+            as_string = self.randomPercent() < 10 and not (length == 1 and buf[start] < 0x80)
+            buf[start:start] = self._header(0x80 if as_string else 0xc0, length)
+            return buf
+
+        valid = self.randomPercent() >= self.malformed
+        genbug_1 = not valid and self.randomPercent() < 50
+        genbug_2 = not valid and self.randomPercent() < 50
+        zeros = b'\x00' if genbug_1 else b''
+        zeros2 = b'\x00' if genbug_2 else b''
+
+        rnd = self.randomSmallUniInt() % 5
+
+        if rnd == 0:
+            # single byte [0x00, 0x7f]
+            buf += zeros
+            buf.append(self.randomSmallUniInt() % 255 if genbug_1 else self.randomSmallUniInt() % 128)
+            return buf
+
+        if rnd in (1, 3):
+            # string 0-55 [0x80, 0xb7] + string, list 0-55 [0xc0, 0xf7] + data
+            length = self.randomSmallUniInt() % 255 if genbug_1 else self.randomSmallUniInt() % 56
+            buf += toCompactBytes((0x80 if rnd == 1 else 0xc0) + length)
+        else:
+            # string more than 55 [0xb8, 0xbf] + length + string, list more than 55 [0xf8, 0xff] + length + data
+            length = self.randomPercent()
+            if length < 56 and valid:
+                length = 56
+            buf += self._long_header(0x80 if rnd == 2 else 0xc0, length, zeros2)
+        buf += zeros
+
+        data = self.randomByteSequence(length)
+        if valid and rnd == 1 and length == 1 and data[0] < 0x80:
+            # a single byte below 0x80 is its own encoding
+            data[0] |= 0x80
+        elif valid and rnd in (3, 4):
+            # single byte items, to keep the list well formed
+            data = data.translate(_LIST_ITEMS)
+        buf += data
+        return buf
@@ -1,5 +1,6 @@
 import random, pickle, zlib, base64
 from .base import _RndBase
+from .source import DEFAULT_SOURCE
 
 class RandomSeed(_RndBase):
 
@@ -19,8 +20,18 @@ class RandomSeed(_RndBase):
 
     @staticmethod
     def get_compressed_random_state():
-        return base64.b64encode(zlib.compress(pickle.dumps(random.getstate()), 9)).decode("utf-8")
+        # (random module state, default source state). older versions wrote the random module state only,
+        # which set_compressed_random_state still accepts; they can't read this layout
+        state = (random.getstate(), DEFAULT_SOURCE.getstate())
+        return base64.b64encode(zlib.compress(pickle.dumps(state), 9)).decode("utf-8")
 
     @staticmethod
     def set_compressed_random_state(state):
-        random.setstate(pickle.loads(zlib.decompress(base64.b64decode(state))))
+        state = pickle.loads(zlib.decompress(base64.b64decode(state)))
+        if len(state) == 3:
+            # plain random module state (version, internalstate, gauss_next) of older versions
+            random.setstate(state)
+            return
+        (module_state, source_state) = state
+        random.setstate(module_state)
+        DEFAULT_SOURCE.setstate(source_state)
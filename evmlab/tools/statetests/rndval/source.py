@@ -0,0 +1,127 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# Author : <github.com/tintinweb>
+import random
+import hashlib
+
+
+class RandomSource(object):
+    """
+    Source of randomness for the rndval generators and the statetest template.
+
+    Wraps a dedicated random.Random, so that a source can be seeded (and its state saved and
+    restored) without touching the global random module. Random bytes are served from a large
+    prefetched entropy buffer instead of one RNG call per value.
+
+    Independent streams, e.g. one per worker of a campaign, are derived from the campaign seed
+    with stream(n); the same (seed, n) always yields the same stream.
+    """
+
+    BUFFER_SIZE = 64 * 1024  # bytes of entropy fetched at once
+
+    def __init__(self, seed=None, buffer_size=BUFFER_SIZE):
+        self.buffer_size = buffer_size
+        self._random = random.Random()
+        self.seed(seed)
+
+    def seed(self, seed=None):
+        """(re)seeds the source. without a seed, one is picked from the global random module and
+        can be read back from .initial_seed to reproduce the stream"""
+        self.initial_seed = seed if seed is not None else random.getrandbits(64)
+        self._random.seed(self.initial_seed)
+        self._buffer = b''
+        self._offset = 0
+
+    @staticmethod
+    def derive(seed, n):
+        """returns the seed of the n-th stream derived from seed"""
+        digest = hashlib.sha256(("%r/%d" % (seed, n)).encode("utf-8")).digest()
+        return int.from_bytes(digest[:16], "big")
+
+    def stream(self, n):
+        """returns a new, independent source for the n-th stream of this source's seed"""
+        return RandomSource(RandomSource.derive(self.initial_seed, n), buffer_size=self.buffer_size)
+
+    def getstate(self):
+        return (self.initial_seed, self._random.getstate(), self._buffer, self._offset)
+
+    def setstate(self, state):
+        (self.initial_seed, rndstate, self._buffer, self._offset) = state
+        self._random.setstate(rndstate)
+
+    def __reduce__(self):
+        if self is DEFAULT_SOURCE:
+            # generators pickled along with e.g. a template keep sharing the default source
+            return "DEFAULT_SOURCE"
+        return (RandomSource, (self.initial_seed, self.buffer_size), self.getstate())
+
+    def __setstate__(self, state):
+        self.setstate(state)
+
+    #### random.Random interface
+
+    def random(self):
+        return self._random.random()
+
+    def randint(self, a, b):
+        return self._random.randint(a, b)
+
+    def randrange(self, *args):
+        return self._random.randrange(*args)
+
+    def getrandbits(self, k):
+        return self._random.getrandbits(k)
+
+    def choice(self, seq):
+        return self._random.choice(seq)
+
+    def choices(self, population, weights=None, cum_weights=None, k=1):
+        return self._random.choices(population, weights=weights, cum_weights=cum_weights, k=k)
+
+    def shuffle(self, seq):
+        self._random.shuffle(seq)
+
+    def sample(self, population, k):
+        return self._random.sample(population, k)
+
+    def triangular(self, low=0.0, high=1.0, mode=None):
+        return self._random.triangular(low, high, mode)
+
+    def gauss(self, mu, sigma):
+        return self._random.gauss(mu, sigma)
+
+    #### bulk helpers
+
+    def bytes(self, n):
+        """returns n random bytes from the entropy buffer"""
+        if n <= 0:
+            return b''
+        if n > self.buffer_size:
+            # does not fit the buffer, fetch it in one go
+            return self._random.getrandbits(8 * n).to_bytes(n, "little")
+        if self._offset + n > len(self._buffer):
+            self._buffer = self._random.getrandbits(8 * self.buffer_size).to_bytes(self.buffer_size, "little")
+            self._offset = 0
+        data = self._buffer[self._offset:self._offset + n]
+        self._offset += n
+        return data
+
+    def hex(self, n):
+        """returns n random bytes as hexstring (without 0x prefix)"""
+        return self.bytes(n).hex()
+
+    def ints(self, n, a, b):
+        """returns a list of n random ints in a..b (inclusive)"""
+        span = b - a + 1
+        if span <= 0:
+            raise ValueError("empty range %d..%d" % (a, b))
+        if span == 1 << (span.bit_length() - 1) and span <= 256:
+            # power of two up to a byte: mask buffered bytes, no rejection needed
+            mask = span - 1
+            return [a + (x & mask) for x in self.bytes(n)]
+        rnd = self._random.randrange
+        return [rnd(a, b + 1) for _ in range(n)]
+
+
+# shared by all generators that are not handed a source of their own
+DEFAULT_SOURCE = RandomSource()
@@ -2,10 +2,149 @@
 # -*- coding: utf-8 -*-
 # Author : <github.com/tintinweb>
 import argparse
+import bz2
+import contextlib
+import gzip
 import json
+import lzma
+import multiprocessing
+import os
+import sys
+import time
 from . import templates
 from . import randomtest
 from . import rndval
+from .corpus import CorpusWriter
+
+# name -> (open(file or fileobj, mode), file extension)
+COMPRESSORS = {"gzip": (gzip.open, ".gz"),
+               "bz2": (bz2.open, ".bz2"),
+               "xz": (lzma.open, ".xz")}
+
+CHUNK_SIZE = 64  # tests per work item of a worker process
+
+
+@contextlib.contextmanager
+def open_output(target, compress=None):
+    """ binary file object writing to the path target, or to stdout if target is '-'. stdout is not closed """
+    if target != "-":
+        with (COMPRESSORS[compress][0] if compress else open)(target, "wb") as f:
+            yield f
+    elif compress:
+        with COMPRESSORS[compress][0](sys.stdout.buffer, "wb") as f:
+            yield f
+    else:
+        yield sys.stdout.buffer
+        sys.stdout.buffer.flush()
+
+
+def fill_tests(plan, start, end):
+    """ yields (name, json) of the tests start..end filled from plan """
+    for index in range(start, end):
+        test = plan.fill()['randomStatetest']  # todo: remove this ugly-hack by removing the name from the template.
+        yield ('randomStatetest%d' % index, json.dumps(test))
+
+
+_PLAN = None
+
+
+def _init_worker(template):
+    global _PLAN
+    _PLAN = randomtest.compile_template(template)
+
+
+def _fill_chunk(args):
+    # every chunk is seeded on its own, the tests do not depend on the number of workers or the order chunks run in
+    (seed, start, end) = args
+    rndval.DEFAULT_SOURCE.seed(rndval.RandomSource.derive(seed, start))
+    return list(fill_tests(_PLAN, start, end))
+
+
+def generate_tests(template, count, jobs=1):
+    """
+    yields (name, json) of count tests filled from template, in order. the tests are filled in chunks seeded
+    from the default source, by a pool of worker processes with jobs > 1 or in process otherwise
+    """
+    seed = rndval.DEFAULT_SOURCE.initial_seed
+    chunks = ((seed, start, min(start + CHUNK_SIZE, count)) for start in range(0, count, CHUNK_SIZE))
+    if jobs <= 1:
+        _init_worker(template)
+        for chunk in chunks:
+            yield from _fill_chunk(chunk)
+        return
+    with multiprocessing.Pool(jobs, initializer=_init_worker, initargs=(template,)) as pool:
+        for tests in pool.imap(_fill_chunk, chunks):
+            yield from tests
+
+
+class Progress(object):
+    """ reports the number of tests written and tests/sec to stderr """
+
+    def __init__(self, interval=5, quiet=False):
+        self.interval = interval
+        self.quiet = quiet
+        self.count = 0
+        self.started = self._reported = time.time()
+
+    def rate(self):
+        return self.count / max(time.time() - self.started, 1e-9)
+
+    def update(self, n=1):
+        self.count += n
+        if not self.quiet and time.time() - self._reported >= self.interval:
+            self._reported = time.time()
+            self.report()
+
+    def report(self):
+        if not self.quiet:
+            print("%d tests, %.2f tests/sec" % (self.count, self.rate()), file=sys.stderr)
+
+
+def write_json(tests, output, compress=None, progress=None):
+    """ writes all tests as a single json object {"randomStatetest0": {..}, "randomStatetest1": {..}, ..} """
+    with open_output(output, compress) as f:
+        f.write(b"{")
+        for n, (name, test) in enumerate(tests):
+            f.write(("%s%s: %s" % (", " if n else "", json.dumps(name), test)).encode("utf-8"))
+            if progress:
+                progress.update()
+        f.write(b"}\n")
+
+
+def write_jsonl(tests, output, compress=None, progress=None):
+    """ writes one test per line, {"randomStatetest0": {..}} """
+    with open_output(output, compress) as f:
+        for name, test in tests:
+            f.write(("{%s: %s}\n" % (json.dumps(name), test)).encode("utf-8"))
+            if progress:
+                progress.update()
+
+
+def write_files(tests, output, compress=None, progress=None):
+    """ writes every test to <output>/<name>.json """
+    os.makedirs(output, exist_ok=True)
+    extension = ".json" + (COMPRESSORS[compress][1] if compress else "")
+    for name, test in tests:
+        with open_output(os.path.join(output, name + extension), compress) as f:
+            f.write(("{%s: %s}" % (json.dumps(name), test)).encode("utf-8"))
+        if progress:
+            progress.update()
+
+
+def write_corpus(tests, output, compress=None, progress=None):
+    """ writes all tests to a corpus file, see corpus.py. compression is applied per test """
+    with CorpusWriter(output, compress=compress) as corpus:
+        for name, test in tests:
+            corpus.add("{%s: %s}" % (json.dumps(name), test))
+            if progress:
+                progress.update()
+
+
+WRITERS = {"json": write_json,
+           "jsonl": write_jsonl,
+           "files": write_files,
+           "corpus": write_corpus}
+
 
 def main():
     description = """
@@ -16,6 +155,15 @@ def main():
 
     # Reproduce a tx with a local evm binary
     python3 statetests.py --random=random_compressed_state
+
+    # Fill a million tests with 8 worker processes, one test per line, xz compressed
+    python3 statetests.py -c 1000000 -j 8 -f jsonl -z xz -o corpus.jsonl.xz
+
+    # Fill 1000 tests into a directory, one file per test
+    python3 statetests.py -c 1000 -f files -o tests/
+
+    # Fill an indexed corpus for the fuzzer (fuzzer.py --corpus tests.corpus)
+    python3 statetests.py -c 1000000 -j 8 -f corpus -z gzip -o tests.corpus
         """
     parser = argparse.ArgumentParser(description=description, epilog=examples,
                                      formatter_class=argparse.RawDescriptionHelpFormatter)
@@ -25,23 +173,31 @@ def main():
     parser.add_argument('-t', '--template', help="Select statetest template", default='RandomStateTest')
     parser.add_argument('-S', '--include-random-state', action="store_true", default=False,
                         help="include random state in output. Can be used as a seed to reproduce the filled template")
-    parser.add_argument('-c', '--count', default=1, type=int, help="number of random statetests to be generated [%default]")
+    parser.add_argument('-c', '--count', default=1, type=int, help="number of random statetests to be generated [%(default)s]")
+    parser.add_argument('-f', '--format', default="json", choices=sorted(WRITERS),
+                        help="json: a single json object, jsonl: one test per line, files: one file per test, "
+                             "corpus: indexed corpus file for the fuzzer [%(default)s]")
+    parser.add_argument('-o', '--output', default="-",
+                        help="output file, '-' for stdout. the output directory for --format=files [%(default)s]")
+    parser.add_argument('-z', '--compress', default=None, choices=sorted(COMPRESSORS), help="compress the output")
+    parser.add_argument('-j', '--jobs', default=1, type=int, help="number of worker processes filling tests [%(default)s]")
+    parser.add_argument('-q', '--quiet', action="store_true", default=False, help="do not report tests/sec to stderr")
 
     args = parser.parse_args()
     selected_template = getattr(templates.object_based, "TEMPLATE_"+args.template)
 
     if not selected_template:
         raise Exception("Template does not exist! - templates.object_based.TEMPLATE_%s"%args.template)
+    if args.format in ("files", "corpus") and args.output == "-":
+        parser.error("--format=%s requires an output path (-o)" % args.format)
 
     if args.random:
         rndval.RandomSeed.set_state(args.random)  # set the state if provided, otherwise stay silent.
     elif args.include_random_state:
         rndval.RandomSeed.set_state()  # add random seed
 
-    testsuite = {}
-    for _ in range(args.count):
-        t = templates.new(selected_template)  # todo: remove this ugly-hack by removing the name from the template.
-        t['randomStatetest%d' % _] = t['randomStatetest']
-        del(t['randomStatetest'])
-        testsuite.update(t)
-    print(json.dumps(testsuite, cls=randomtest.RandomTestsJsonEncoder), end="\n")
+    # the template is analysed once, tests are written as they are filled
+    progress = Progress(quiet=args.quiet)
+    tests = generate_tests(selected_template, args.count, jobs=args.jobs)
+    WRITERS[args.format](tests, args.output, compress=args.compress, progress=progress)
+    progress.report()
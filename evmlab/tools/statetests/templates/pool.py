@@ -0,0 +1,148 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# Author : <github.com/tintinweb>
+import time
+import threading
+import logging
+
+logger = logging.getLogger("evmlab.tools.statetest")
+
+
+class PrestatePool(object):
+    """
+    Bounded pools of pre-generated prestates (code and storage), one pool per code generator.
+
+    A background thread keeps the pools filled, so that filling a template samples prestates
+    instead of generating code. Prestates are evicted after max_uses samples, and the oldest
+    prestate of a pool is replaced every refresh seconds, to keep up the diversity of the code.
+
+    codegens ... the code generators of the template. the pool uses its own instances of them,
+                 drawing from source
+    generate ... generate(codegen, source) -> (code, storage)
+    size     ... prestates per code generator
+    max_uses ... a prestate is evicted after it has been sampled this many times, 0 = never
+    refresh  ... seconds after which the oldest prestate of a pool is replaced, 0 = never
+    """
+
+    def __init__(self, codegens, generate, size=64, max_uses=0, refresh=0, source=None):
+        self.source = source
+        self.size = size
+        self.max_uses = max_uses
+        self.refresh = refresh
+        self._generate = generate
+        self._codegens = {type(cg): type(cg)(_config=cg._config, source=source) for cg in codegens}
+        # engine -> [[code, storage, addresses seen, uses], ...]
+        self._pools = {engine: [] for engine in self._codegens}
+        self._refreshed = {engine: time.time() for engine in self._codegens}
+        self.stats = {"hits": 0, "misses": 0, "evicted": 0, "generated": 0}
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        # held while a prestate is generated and added, so that getstate() sees the source and pools agree
+        self._generating = threading.Lock()
+        self._thread = None
+        self._stopped = False
+
+    def __len__(self):
+        return sum(len(pool) for pool in self._pools.values())
+
+    def sample(self, codegen, source):
+        """
+        returns (code, storage, addresses seen) of a pooled prestate for the code generator, drawn
+        with source, or None if its pool is (still) empty
+        """
+        with self._lock:
+            pool = self._pools.get(type(codegen))
+            if not pool:
+                self.stats["misses"] += 1
+                self._wakeup.notify()
+                return None
+            entry = pool[source.randrange(len(pool))]
+            entry[3] += 1
+            if self.max_uses and entry[3] >= self.max_uses:
+                pool.remove(entry)
+                self.stats["evicted"] += 1
+                self._wakeup.notify()
+            self.stats["hits"] += 1
+            return entry[0], entry[1], entry[2]
+
+    def _next(self):
+        """ returns the engine of the emptiest pool that is not full, or None. call with the lock held """
+        now = time.time()
+        for engine, pool in self._pools.items():
+            if self.refresh and pool and now - self._refreshed[engine] >= self.refresh:
+                pool.pop(0)
+                self.stats["evicted"] += 1
+                self._refreshed[engine] = now
+        todo = [engine for engine, pool in self._pools.items() if len(pool) < self.size]
+        return min(todo, key=lambda engine: len(self._pools[engine])) if todo else None
+
+    def _add(self, engine):
+        codegen = self._codegens[engine]
+        with self._generating:
+            (code, storage) = self._generate(codegen, self.source)
+            entry = [code, storage, frozenset(getattr(codegen, "_addresses_seen", ())), 0]
+            with self._lock:
+                self._pools[engine].append(entry)
+                self.stats["generated"] += 1
+
+    def fill(self):
+        """ fills all pools, in the calling thread """
+        while True:
+            with self._lock:
+                engine = self._next()
+            if engine is None:
+                return
+            self._add(engine)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                engine = self._next()
+                while engine is None and not self._stopped:
+                    self._wakeup.wait(timeout=self.refresh or None)
+                    engine = self._next()
+                if self._stopped:
+                    return
+            try:
+                self._add(engine)
+            except Exception as e:
+                # don't let one bad prestate kill the pool, the template falls back to generating prestates
+                logger.exception("Failed to generate a prestate for the pool: %r" % e)
+                time.sleep(1)
+
+    def start(self):
+        """ keeps the pools filled in a background thread """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="prestate-pool", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        with self._lock:
+            self._stopped = True
+            self._wakeup.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def getstate(self):
+        """ the pooled prestates and the state of the source they are generated from """
+        with self._generating, self._lock:
+            return {"source": self.source.getstate() if self.source is not None else None,
+                    "pools": {engine: [list(entry) for entry in pool] for engine, pool in self._pools.items()},
+                    "stats": dict(self.stats)}
+
+    def setstate(self, state):
+        with self._generating, self._lock:
+            if self.source is not None and state["source"] is not None:
+                self.source.setstate(state["source"])
+            pools = state["pools"]
+            self._pools = {engine: [list(entry) for entry in pools.get(engine, [])] for engine in self._codegens}
+            self._refreshed = {engine: time.time() for engine in self._codegens}
+            self.stats.update(state["stats"])
+            self._wakeup.notify()
+
+    def status(self):
+        with self._lock:
+            return dict(self.stats, size={engine.__name__: len(pool) for engine, pool in self._pools.items()})
@@ -1,28 +1,71 @@
 #! /usr/bin/env python
 # -*- coding: utf-8 -*-
 # Author : <github.com/tintinweb>
-import random
 import json
 import logging
 from types import SimpleNamespace
+from json.encoder import encode_basestring_ascii
 from evmlab.tools.statetests import rndval, randomtest
 from evmlab.tools.statetests.rndval.base import WeightedRandomizer
+from evmlab.tools.statetests.rndval.source import DEFAULT_SOURCE
+from evmlab.tools.statetests.templates.pool import PrestatePool
 
 from evmlab.tools.statetests.rndval import RndCodeBytes
 
 
 logger = logging.getLogger("evmlab.tools.statetest")
 
+ENCODER = randomtest.RandomTestsJsonEncoder()
+
+
+def _encode_generated(value):
+    # shortcut for the usual rndval values, which generate a string
+    if isinstance(value, rndval._RndBase):
+        value = value.generate()
+        if isinstance(value, str):
+            return encode_basestring_ascii(value)
+    return ENCODER.encode(value)
+
+
+class _SectionJson(object):
+    """
+    json of a section of the test, a dict. Static values are encoded once, and encoded again only once another
+    object is assigned to their key; rndval values are encoded on every call. Static values must not be
+    modified in place.
+    """
+
+    def __init__(self):
+        self._pairs = {}  # key -> (value, encoded "key": value)
+
+    def json(self, section):
+        pairs = []
+        for k, v in section.items():
+            cached = self._pairs.get(k)
+            if cached is not None and cached[0] is v:
+                pairs.append(cached[1])
+            elif randomtest.is_static(v):
+                pair = "%s: %s" % (encode_basestring_ascii(k), ENCODER.encode(v))
+                self._pairs[k] = (v, pair)
+                pairs.append(pair)
+            else:
+                pairs.append("%s: %s" % (encode_basestring_ascii(k), _encode_generated(v)))
+        return "{%s}" % ", ".join(pairs)
+
 
 class Account(object):
 
-    def __init__(self, address, balance=None, code=None, nonce=None, storage=None):
+    def __init__(self, address, balance=None, code=None, nonce=None, storage=None, source=None):
         self.address = address
-        self.balance = balance if balance is not None else rndval.RndHexInt(_min=2**24-1)
+        self.balance = balance if balance is not None else rndval.RndHexInt(_min=2**24-1, source=source)
         self.code = code if code is not None else ''
         self.nonce = nonce
         self.storage = storage if storage is not None else {}
 
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        if name != "_fragments":
+            object.__setattr__(self, "_fragments", None)  # reassigned, encode again
+
     @property
     def __dict__(self):
         return {"balance": self.balance,
@@ -30,14 +73,27 @@ class Account(object):
                 "nonce": self.nonce,
                 "storage": self.storage}
 
+    def json(self):
+        """
+        json of the account. The account does not change unless it is renewed (replaced), so only rndval
+        members (usually the balance) are encoded on every call. Storage must not be modified in place.
+        """
+        if self._fragments is None:
+            self._fragments = [(encode_basestring_ascii(k), v if not randomtest.is_static(v) else ENCODER.encode(v))
+                               for k, v in self.__dict__.items()]
+        return "{%s}" % ", ".join("%s: %s" % (k, v if isinstance(v, str) else _encode_generated(v))
+                                  for k, v in self._fragments)
+
 
 
 class StateTestTemplate(object):
 
     def __init__(self, nonce=None, codegenerators={}, datalength=None,
-                 fill_prestate_for_tx_to=True, fill_prestate_for_args=False, _config=None):
+                 fill_prestate_for_tx_to=True, fill_prestate_for_args=False, _config=None, source=None):
         ### global settings
-        self._nonce = nonce if nonce is not None else str(rndval.RndV())
+        # all values of the template, and of its code generators, are drawn from this RandomSource
+        self._source = source or DEFAULT_SOURCE
+        self._nonce = nonce if nonce is not None else str(rndval.RndV(source=self._source))
         self._config = _config
         ### set by setters below
         self._codegenerators = None  # default
@@ -53,6 +109,19 @@ class StateTestTemplate(object):
 
         # other
         self._fill_counter = 0  # track how often we've filled from this template
+        # cached json of the static values of the sections, see _fill_json
+        self._json = {section: _SectionJson() for section in ("_info", "env", "post", "transaction")}
+
+        ### prestates are sampled from a pool of pre-generated ones if enabled (prestate.pool.*)
+        self._prestate_pool = None
+        self._addresses_seen = set()  # addresses referenced by the code of sampled prestates
+        pool_size = self._config_getint("prestate.pool.size", 0)
+        if pool_size:
+            self._prestate_pool = PrestatePool(self._codegenerators.values(), self._random_prestate,
+                                               size=pool_size,
+                                               max_uses=self._config_getint("prestate.pool.max.uses", 0),
+                                               refresh=self._config_getint("prestate.pool.refresh.every.x.seconds", 0),
+                                               source=self._source.stream(1)).start()
 
         ### info
         self._info = SimpleNamespace(fuzzer="evmlab",
@@ -60,12 +129,12 @@ class StateTestTemplate(object):
                                      filledwith="evmlab randomfuzz")
 
         ### env
-        self._env = SimpleNamespace(currentCoinbase=self._config_get("env.coinbase", rndval.RndSourceAddress()),
+        self._env = SimpleNamespace(currentCoinbase=self._config_get("env.coinbase", rndval.RndSourceAddress(source=self._source)),
                                     currentDifficulty=self._config_get("env.difficulty", "0x20000"),
                                     currentGasLimit=self._config_get("env.gaslimit", "0x1312D00"),
                                     currentNumber=self._config_get("env.number", "1"),
                                     currentTimestamp=self._config_get("env.timestamp", "1000"),
-                                    previousHash=self._config_get("env.previousHash", rndval.RndHash32()))
+                                    previousHash=self._config_get("env.previousHash", rndval.RndHash32(source=self._source)))
 
         ### post
         self._post = {"Byzantium": [
@@ -81,13 +150,14 @@ class StateTestTemplate(object):
 
         ### transaction
         self._transaction = SimpleNamespace(secretKey="0x45a915e4d060149eb4365960e6a7a45f334393093061116b197e3240065ff2d8",
-                                            data=[RndCodeBytes().generate(length=self._datalength)],
-                                            gasLimit=[rndval.RndTransactionGasLimit(_min=self._config_getint("transaction.gaslimit.random.min",34*14000))],
-                                            gasPrice=rndval.RndGasPrice(),
+                                            data=[RndCodeBytes(source=self._source).generate(length=self._datalength)],
+                                            gasLimit=[rndval.RndTransactionGasLimit(_min=self._config_getint("transaction.gaslimit.random.min",34*14000), source=self._source)],
+                                            gasPrice=rndval.RndGasPrice(source=self._source),
                                             nonce=self._nonce,
-                                            to=rndval.RndDestAddressOrZero(),
+                                            to=rndval.RndDestAddressOrZero(source=self._source),
                                             value=[rndval.RndHexInt(_min=self._config_getint("transaction.value.random.min", 0),
-                                                                    _max=self._config_getint("transaction.value.random.max", 2**24))])
+                                                                    _max=self._config_getint("transaction.value.random.max", 2**24),
+                                                                    source=self._source)])
 
     def _config_getint(self, key, default=None):
         if not self._config or not self._config.statetest:
@@ -104,11 +174,28 @@ class StateTestTemplate(object):
             return default
         return self._config.statetest.getboolean(key, default)
 
-    def _random_storage(self, _min=0, _max=10):
-        hx = rndval.RndHex32()
-        rnd_vals = (hx.generate() for _ in range(random.randint(_min, _max)))
+    def _random_storage(self, _min=0, _max=10, source=None):
+        source = source or self._source
+        hx = rndval.RndHex32(source=source)
+        rnd_vals = (hx.generate() for _ in range(source.randint(_min, _max)))
         return {hx:hx for hx in rnd_vals}
 
+    def _random_prestate(self, codegen, source):
+        """returns (code, storage) for a prestate. called by the prestate pool with its own codegen and source"""
+        codelength_min, codelength_max = self._config_getint("prestate.random.code.length.min", None), self._config_getint("prestate.random.code.length.max", None)
+        if codelength_min is not None:
+            if codelength_min == codelength_max or codelength_max is None:
+                codelength = codelength_min
+            else:
+                codelength = source.randint(codelength_min, codelength_max)
+        else:
+            codelength = None
+
+        return (codegen.generate(length=codelength),  # limit length, main code is in first prestate
+                self._random_storage(_min=self._config_getint("prestate.storage.random.slots.min",0),
+                                     _max=self._config_getint("prestate.storage.random.slots.max",2),
+                                     source=source))
+
 
     def _autofill_prestates_from_transaction(self, tx):
         logger.debug("autofill from tx.to")
@@ -142,19 +229,15 @@ class StateTestTemplate(object):
         ### random balance
         ### random storage
 
-        codelength_min, codelength_max = self._config_getint("prestate.random.code.length.min", None), self._config_getint("prestate.random.code.length.max", None)
-        if codelength_min is not None:
-            if codelength_min == codelength_max or codelength_max is None:
-                codelength = codelength_min
-            else:
-                codelength = random.randint(codelength_min, codelength_max)
+        codegen = self.pick_codegen()
+        sampled = self._prestate_pool.sample(codegen, self._source) if self._prestate_pool else None
+        if sampled is not None:
+            (code, storage, addresses_seen) = sampled
+            self._addresses_seen.update(addresses_seen)
         else:
-            codelength = None
+            (code, storage) = self._random_prestate(codegen, self._source)
 
-        self.add_prestate(address="0x%s"%address.replace("0x",""),
-                          code=self.pick_codegen().generate(length=codelength),  # limit length, main code is in first prestate
-                          storage=self._random_storage(_min=self._config_getint("prestate.storage.random.slots.min",0),
-                                                       _max=self._config_getint("prestate.storage.random.slots.max",2)))
+        self.add_prestate(address="0x%s"%address.replace("0x",""), code=code, storage=storage)
 
         return self
 
@@ -175,13 +258,15 @@ class StateTestTemplate(object):
             except (KeyError, AttributeError) as ae:
                 #print(ae)
                 pass
+        all_addresses.update(self._addresses_seen)
+        self._addresses_seen = set()
 
         # do not handle precompiled accounts.
         # remove tx.to to avoid renewing it. this is handled in autifille
         all_addresses = list(all_addresses.difference(rndval.RndAddress.addresses[rndval.RndAddressType.PRECOMPILED] + [tx.to.replace("0x","")]))
 
         # shuffle list to avoid bailing always on the same objects (set is ordered)
-        random.shuffle(all_addresses)
+        self._source.shuffle(all_addresses)
 
         for addr in all_addresses:
             #print(addr)
@@ -209,7 +294,7 @@ class StateTestTemplate(object):
 
 
 
-    def _build(self):
+    def _build(self, name="randomStatetest", forks=None):
         # clone the tx namespace and replace the generator with a concrete value (we can then refer to that value later)
         tx = SimpleNamespace(**self.transaction.__dict__)
         if isinstance(tx.to, rndval.RndAddress):
@@ -227,10 +312,16 @@ class StateTestTemplate(object):
 
         self.add_prestate(address=env.currentCoinbase, code="")
 
-        return {"randomStatetest": {
+        post = self.post
+        if forks is not None:
+            # the same post-state for all forks
+            post_state = next(iter(post.values()))
+            post = {fork: post_state for fork in forks}
+
+        return {name: {
                        "_info": self.info.__dict__,
                        "env": env.__dict__,
-                       "post": self.post,
+                       "post": post,
                        "pre": {address: a.__dict__ for address,a in self.pre.items()},
                        "transaction": tx.__dict__}}
 
@@ -240,10 +331,18 @@ class StateTestTemplate(object):
 
     @codegens.setter
     def codegens(self, weighted_codegens):
-        self._codegenerators = {engine: engine(_config=self._config.codegen if self._config else None) for engine in
-                                weighted_codegens.keys()}  # instantiate available code generators
+        self._codegenerators = {engine: engine(_config=self._config.codegen if self._config else None, source=self._source)
+                                for engine in weighted_codegens.keys()}  # instantiate available code generators
         self._codegenerators_weighted = WeightedRandomizer(
-            {self._codegenerators[engine]: weight for engine, weight in weighted_codegens.items()})  #
+            {self._codegenerators[engine]: weight for engine, weight in weighted_codegens.items()}, source=self._source)  #
+
+    @property
+    def source(self):
+        return self._source
+
+    @property
+    def prestate_pool(self):
+        return self._prestate_pool
 
     @property
     def datalength(self):
@@ -286,7 +385,8 @@ class StateTestTemplate(object):
                       balance=balance,
                       code=code if code is not None else self.pick_codegen().generate(),
                       nonce=nonce if nonce is not None else self._nonce,  # use global nonce if not explicitly set
-                      storage=storage)
+                      storage=storage,
+                      source=self._source)
         self.pre[acc.address] = acc
 
     def add_precomipled_prestates(self, force=False):
@@ -299,6 +399,33 @@ class StateTestTemplate(object):
             if addr not in self._pre or force:
                 self.add_prestate(address=addr, balance="0x01", code="")
 
+    def getstate(self):
+        """
+        returns the part of the template that evolves while filling (prestates, fill counter, addresses seen by
+        the code generators but not given a prestate yet, prestate pool), and the transaction data generated
+        with the template. The pool is refilled in the background, so which pooled prestates a fill samples
+        also depends on timing
+        """
+        addresses_seen = set(self._addresses_seen)
+        for cg in self._codegenerators.values():
+            addresses_seen.update(getattr(cg, "_addresses_seen", ()))
+        return {"fill_counter": self._fill_counter,
+                "pre": {address: (acc.balance, acc.code, acc.nonce, acc.storage) for address, acc in self._pre.items()},
+                "addresses_seen": sorted(addresses_seen),
+                "data": self._transaction.data,
+                "pool": self._prestate_pool.getstate() if self._prestate_pool is not None else None}
+
+    def setstate(self, state):
+        self._fill_counter = state["fill_counter"]
+        self._pre = {address: Account(address, *values, source=self._source) for address, values in state["pre"].items()}
+        self._transaction.data = state.get("data", self._transaction.data)
+        self._addresses_seen = set(state.get("addresses_seen", ()))
+        for cg in self._codegenerators.values():
+            if hasattr(cg, "_addresses_seen"):
+                cg._addresses_seen = set()
+        if self._prestate_pool is not None and state.get("pool") is not None:
+            self._prestate_pool.setstate(state["pool"])
+
     def pick_codegen(self, name=None):
         if name:
             return self._codegenerators[name]
@@ -320,10 +447,36 @@ class StateTestTemplate(object):
     def json(self):
         return json.dumps(self.__dict__, cls=randomtest.RandomTestsJsonEncoder)
 
-    def fill(self):
+    def fill(self, name="randomStatetest", forks=None):
+        """returns a filled test as plain dict. name is the top level name of the test, the post-state
+        is repeated for each of the given forks"""
         self._fill_counter += 1
         # will be filled by _build
-        return json.loads(self.json())
+        return randomtest.resolve(self._build(name=name, forks=forks))
+
+    def _fill_json(self, name, forks):
+        self._fill_counter += 1
+        test = self._build(name=name, forks=forks)[name]
+        # same as ENCODER.encode(test), but composed from the cached json of the static values and of the
+        # prestates. values are generated in the same order: _info, env, post, pre, transaction
+        sections = ["%s: %s" % (encode_basestring_ascii(section), self._json[section].json(test[section]))
+                    for section in ("_info", "env", "post")]
+        pre = ", ".join("%s: %s" % (encode_basestring_ascii(address), self.pre[address].json()) for address in test["pre"])
+        return '{%s: {%s, "pre": {%s}, "transaction": %s}}' % (json.dumps(name), ", ".join(sections), pre,
+                                                                self._json["transaction"].json(test["transaction"]))
+
+    def fill_bytes(self, name="randomStatetest", forks=None):
+        """returns a filled test as json encoded bytes, see fill()"""
+        return self._fill_json(name, forks).encode("utf-8")
+
+    def fill_to_file(self, f, name="randomStatetest", forks=None):
+        """fills a test and writes it as json to f, a filename or text file object. see fill()"""
+        data = self._fill_json(name, forks)
+        if isinstance(f, str):
+            with open(f, "w") as fp:
+                fp.write(data)
+        else:
+            f.write(data)
 
 
 if __name__=="__main__":
@@ -10,7 +10,16 @@ logger = logging.getLogger()
 
 FNULL = open(os.devnull, 'w')
 
-valid_opcodes = opcodes.reverse_opcodes.keys()
+# opcode metadata of the latest fork, as 256-entry tables
+OPCODES = opcodes.opcodeTable()
+CONSTANTINOPLE_OPCODES = frozenset(opcodes.FORK_OPCODES['Constantinople'])
+
+# the fork of a subtest in geth's test summary
+GETH_FORK = re.compile(r'"fork"\s*:\s*"([^"]+)"')
+
+
+class UnknownForkError(ValueError):
+    """ The output of a client holds several subtests, which can't be told apart by fork """
 
 # The 'stateRoot' comparison can be disabled, in which case
 # the analysis will check only the internal states after every 
@@ -51,7 +60,7 @@ class Stats():
             if "depth" in step.keys() and int(step['depth']) > self.maxdepth:
                 self.maxdepth = int(step['depth'])
             if "op" in step:
-                if step["op"] in [0x1b, 0x1c, 0x1d, 0x3F,0xF5]:
+                if step["op"] in CONSTANTINOPLE_OPCODES:
                     self.numConstantinople = self.numConstantinople + 1
             yield step
 
@@ -70,8 +79,8 @@ def toText(op):
         return "END"
     if 'pc' in op.keys():
         op_key = op['op']
-        if op_key in opcodes.opcodes.keys():
-            opname = opcodes.opcodes[op_key][0]
+        if 0 <= op_key < 256 and OPCODES.valid[op_key]:
+            opname = OPCODES.names[op_key]
         else:
             opname = "UNKNOWN"
         op['opname'] = opname
@@ -99,6 +108,28 @@ def toText(op):
         return fmt.format(**op)
     return "N/A"
 
+def subtests_by_fork(clients_subtests, forks):
+    """ Pairs the subtests of several clients by fork. clients_subtests holds, for each client, its
+    subtests as (fork, trace). Subtests without a fork name are taken to be the forks in order.
+    Fork names are matched case insensitively.
+    Returns [(fork, [trace of each client])], for the forks in order, followed by any others
+    """
+    names = {fork.lower(): fork for fork in forks}
+    order = list(forks)
+    clients = []
+    for subtests in clients_subtests:
+        traces = {}
+        for i, (fork, trace) in enumerate(subtests):
+            if fork is None:
+                fork = forks[i] if i < len(forks) else "subtest-%d" % i
+            fork = names.setdefault(fork.lower(), fork)
+            if fork not in order:
+                order.append(fork)
+            traces[fork] = trace
+        clients.append(traces)
+    return [(fork, [traces.get(fork, []) for traces in clients])
+            for fork in order if any(fork in traces for traces in clients)]
+
 def compare_traces(clients_canon_traces, names):
 
     """ Compare 'canonical' traces from the clients"""
@@ -171,6 +202,14 @@ class VM(object):
         self.lastCommand = " ".join(cmd)
         return startProc(cmd)
 
+    @staticmethod
+    def subtests(output):
+        """ Splits the output of a statetest run into the outputs of the subtests (one per fork), as
+        (fork, lines). The fork is None if the client does not name it.
+        Unless the client tells us otherwise, it's all one subtest
+        """
+        return [(None, list(output))]
+
 class JsVM(VM):
     @staticmethod
     def canonicalized(output):
@@ -185,9 +224,6 @@ class JsVM(VM):
 class HeraVM(VM):
     @staticmethod
     def canonicalized(output):
-        from . import opcodes
-        valid_opcodes = opcodes.reverse_opcodes.keys()
-
         steps = []
         for x in output:
             try:
@@ -216,9 +252,6 @@ class CppVM(VM):
 
     @staticmethod
     def canonicalized(output):
-        from . import opcodes
-        valid_opcodes = opcodes.reverse_opcodes.keys()
-
         steps = []
         for x in output:
             try:
@@ -251,7 +284,7 @@ class CppVM(VM):
                 if step['op'] in ['INVALID', 'STOP'] :
                     # skip STOPs
                     continue
-                if step['op'] not in valid_opcodes:
+                if step['op'] not in OPCODES.byName:
                     logger.info("got cpp step for an unknown opcode:")
                     logger.info(step)
                     continue
@@ -259,7 +292,7 @@ class CppVM(VM):
                 trace_step = {
                     'pc'  : step['pc'],
                     'gas': '0x{0:01x}'.format(int(step['gas'])) ,
-                    'op': opcodes.reverse_opcodes[step['op']],
+                    'op': OPCODES.byName[step['op']],
                     'depth' : step['depth'],
                     'stack' : toHexQuantities(step['stack']),
                 }
@@ -316,7 +349,7 @@ class PyVM(VM):
             if 'event' not in step.keys():               
                 continue
             if step['event'] == 'eth.vm.op.vm':
-                if step['op'] not in valid_opcodes:
+                if step['op'] not in OPCODES.byName:
                     # invalid opcode
                     continue
                 if step['op'] == 'STOP':
@@ -407,6 +440,31 @@ class GethVM(VM):
     def execute(self, **kwargs):
         return finishProc(self.start(**kwargs))
 
+    @staticmethod
+    def subtests(output):
+        """ Geth emits the stateRoot after the trace of every subtest, and names the forks in the
+        test summary at the end, in the order they were executed (which is random, geth walks a map).
+        Raises UnknownForkError if there are several subtests and the summary does not name their forks
+        """
+        segments = [[]]
+        forks = []
+        for line in output:
+            segments[-1].append(line)
+            if '"stateRoot"' in line:
+                segments.append([])
+            elif '"fork"' in line:
+                match = GETH_FORK.search(line)
+                if match:
+                    forks.append(match.group(1))
+        # trailing output (the test summary) belongs to the last subtest
+        if len(segments) > 1:
+            segments[-2].extend(segments.pop())
+        if len(forks) != len(segments):
+            if len(segments) > 1:
+                raise UnknownForkError("geth output holds %d subtests, but names %d forks" % (len(segments), len(forks)))
+            forks = [None]
+        return list(zip(forks, segments))
+
     @staticmethod
     def canonicalized(output):
         from . import opcodes
@@ -449,7 +507,7 @@ class GethVM(VM):
             if step['op'] == 0:
                 # skip STOPs
                 continue
-            if step['opName'] == "" or step['op'] not in opcodes.opcodes:
+            if step['opName'] == "" or not OPCODES.valid[step['op']]:
                 # invalid opcode
                 continue
             trace_step = {
@@ -545,6 +603,26 @@ class ParityVM(VM):
     def execute(self, **kwargs):
         return finishProc(self.start(**kwargs))
 
+    @staticmethod
+    def subtests(output):
+        """ Parity starts every subtest with a line containing the test name, "<name>:<fork>:<index>" """
+        segments = [[None, []]]
+        started = False
+        for line in output:
+            if line[:1] == "{" and '"test"' in line:
+                try:
+                    test = json.loads(line)['test'].split(":")
+                except (ValueError, KeyError, AttributeError):
+                    test = None
+                if test is not None:
+                    if started:
+                        segments.append([None, []])
+                    # output before the first header belongs to the first subtest
+                    segments[-1][0] = test[1] if len(test) > 1 else None
+                    started = True
+            segments[-1][1].append(line)
+        return [tuple(segment) for segment in segments]
+
     @staticmethod
     def canonicalized(output):
         from . import opcodes
@@ -596,7 +674,7 @@ class ParityVM(VM):
             if p_step['op'] == 0:
                 # skip STOPs
                 continue
-            if p_step['opName'] == "" or p_step['op'] not in opcodes.opcodes:
+            if p_step['opName'] == "" or not OPCODES.valid[p_step['op']]:
                 # invalid opcode
                 continue
             trace_step = {
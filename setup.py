@@ -44,5 +44,6 @@ setup(name='Evmlab',
                       "abidecoder": ["ethereum-input-decoder"],
                       "docker": ["docker==3.0.0"],
                       "fuzztests": ["docker==3.0.0", "evmcodegen"],
+                      "numpy": ["numpy"],
                       }
       )
@@ -26,8 +26,8 @@ def generateCall():
     def sstore(k, v):
         p.push(v).push(k).op(c.SSTORE)
 
-    label = 21
-    p = c.Program()
+    label = c.Label("callee")
+    p = c.Program(label_width=1)
     # Check if we're calling ourself:
     p.op(c.CALLER) #0
     p.op(c.ADDRESS)#1
@@ -50,7 +50,7 @@ def generateCall():
     p.op(c.STOP)     # 
 
     #This is 3.1
-    p.op(c.JUMPDEST) # posotion 21
+    p.jumpdest("callee") # posotion 21
     # Set slot 
     sstore(1,3)    
     p.op(c.STOP)
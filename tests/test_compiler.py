@@ -0,0 +1,64 @@
+import unittest
+from evmlab import compiler as c
+
+
+class ProgramTest(unittest.TestCase):
+
+    def test_push(self):
+        p = c.Program()
+        p.push(0).push(0x1234).push("0xabcdef").op(c.ADD)
+        self.assertEqual(p.bytecode(), "6000611234" + "62abcdef" + "01")
+        self.assertEqual(p.label(), 10)
+        self.assertIsInstance(p.label(), int)
+
+    def test_labels(self):
+        p = c.Program()
+        p.jump(c.Label("end"))
+        loop = p.jumpdest("loop")
+        p.jumpi(c.Label("loop"), 1)
+        end = p.jumpdest("end")
+        self.assertEqual((loop, end), (4, 11))
+        self.assertEqual(p.bytecode(), "61000b56" + "5b" + "6001" + "61000457" + "5b")
+        with self.assertRaises(ValueError):
+            p.label("end")
+
+        p.push(c.Label("missing"))
+        with self.assertRaises(ValueError):
+            p.bytecode()
+
+    def test_label_width(self):
+        p = c.Program(label_width=1)
+        p.push(c.Label("far"))
+        p.raw(bytes(300))
+        p.label("far")
+        with self.assertRaises(ValueError):
+            p.assemble()
+
+    def test_bulk(self):
+        body = c.Program()
+        body.push(1).push(0).op(c.SSTORE).jump(c.Label("end"))
+        p = c.Program()
+        p.repeat(body, 3)
+        p.repeat("0x5b", 2)
+        p.jumpdest("end")
+        self.assertEqual(len(p), 3 * 9 + 3)
+        self.assertEqual(p.bytecode(), ("600160005561001d56" * 3) + "5b5b5b")
+
+        outer = c.Program()
+        outer.op(c.STOP).extend(p)
+        self.assertEqual(outer.labels, {"end": 30})
+        self.assertEqual(outer.bytecode(), "00" + ("600160005561001e56" * 3) + "5b5b5b")
+
+        with self.assertRaises(ValueError):
+            outer.repeat(p, 2)
+
+    def test_mixed_label_widths(self):
+        # references are patched with the width of the program which pushed them
+        narrow = c.Program(label_width=1)
+        narrow.push(c.Label("end"))
+        wide = c.Program(label_width=4)
+        wide.extend(narrow)
+        wide.repeat(narrow, 2)
+        wide.push(c.Label("end"))
+        wide.jumpdest("end")
+        self.assertEqual(wide.bytecode(), "600b" * 3 + "630000000b" + "5b")
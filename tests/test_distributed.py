@@ -0,0 +1,92 @@
+import os
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "utilities"))
+from distributed import Coordinator, Worker
+
+
+class DistributedTest(unittest.TestCase):
+
+    def setUp(self):
+        self.coordinator = Coordinator(campaign={"fork_config": "Byzantium", "sections": {}},
+                                       range_size=10, max_tests=95, retry_interval=0.01)
+        (host, port) = self.coordinator.start()
+        self.url = "http://%s:%d" % (host, port)
+
+    def tearDown(self):
+        self.coordinator.stop()
+
+    def test_workers_on_one_host(self):
+        leased = []
+
+        def work(n):
+            worker = Worker(self.url, "host-%d" % n)
+            self.assertEqual(worker.register()["fork_config"], "Byzantium")
+            passes = 0
+            for (start, end) in worker.ranges(lambda: {"pass": passes, "fail": 1,
+                                                       "failures": [{"id": n, "signature": "Byzantium|geth:SLOAD"}]}):
+                leased.append((start, end))
+                passes += end - start
+                for seed in range(start, end):
+                    worker.finished(seed)
+            worker.report({"pass": passes, "fail": 1, "failures": [{"id": n, "signature": "Byzantium|geth:SLOAD"}]})
+
+        threads = [threading.Thread(target=work, args=(n,)) for n in range(3)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        # every seed is handed out exactly once
+        seeds = sorted(s for (start, end) in leased for s in range(start, end))
+        self.assertEqual(seeds, list(range(95)))
+
+        status = Worker(self.url, "observer").status()
+        self.assertEqual(len(status["workers"]), 3)
+        self.assertEqual(status["pass"], 95)
+        self.assertEqual(status["fail"], 3)
+        self.assertEqual(status["signatures"], {"Byzantium|geth:SLOAD": 3})
+        self.assertEqual(status["seeds"]["leased"], 0)
+
+    def test_expired_lease(self):
+        self.coordinator.lease_timeout = 0
+        first, second = Worker(self.url, "a"), Worker(self.url, "b")
+        first.register()
+        second.register()
+        self.assertEqual(first.lease(), (0, 10))
+        # the first worker never reports back, its range goes to the next worker asking
+        self.assertEqual(second.lease(), (0, 10))
+        # its late report does not release the lease of the second worker
+        first._completed.append((0, 10))
+        first.report({})
+        self.assertEqual(self.coordinator.leases[(0, 10)][0], second.id)
+
+    def test_done_after_execution(self):
+        worker = Worker(self.url, "a")
+        worker.register()
+        ranges = worker.ranges(lambda: {})
+        self.assertEqual(next(ranges), (0, 10))
+        # the tests of the range have been generated, not executed
+        self.assertEqual(next(ranges), (10, 20))
+        self.assertIn((0, 10), self.coordinator.leases)
+        for seed in range(10):
+            worker.finished(seed)
+        worker.report({})
+        self.assertNotIn((0, 10), self.coordinator.leases)
+        self.assertIn((10, 20), self.coordinator.leases)
+
+    def test_retry_while_leased(self):
+        self.coordinator.max_tests = 10
+        first, second = Worker(self.url, "a"), Worker(self.url, "b")
+        first.register()
+        second.register()
+        self.assertEqual(first.lease(), (0, 10))
+        # no seeds are left, but the lease may still expire
+        self.assertEqual(second.lease(), 0.01)
+        self.coordinator.lease_timeout = 0
+        self.assertEqual(second.lease(), (0, 10))
+        second._completed.append((0, 10))
+        second.report({})
+        self.assertIsNone(second.lease())
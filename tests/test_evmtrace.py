@@ -0,0 +1,216 @@
+import io
+import itertools
+import json
+import os
+import tempfile
+import unittest
+from evmlab import evmtrace
+from evmlab import compiler
+
+# PUSH1 0x02, PUSH1 0x03, ADD, <call frame: PUSH1 0x01, POP, STOP>, POP
+TRACE = [
+    {"op": compiler.PUSH1, "depth": 1, "result": ["0x2"], "len": 2},
+    {"op": compiler.PUSH1, "depth": 1, "result": ["0x3"], "len": 2},
+    {"op": compiler.ADD, "depth": 1, "result": ["0x5"]},
+    {"op": compiler.CALL, "depth": 1, "result": ["0x1"], "ops": [
+        {"op": compiler.PUSH1, "depth": 2, "result": ["0x1"], "len": 2},
+        {"op": compiler.POP, "depth": 2, "result": []},
+        {"op": compiler.STOP, "depth": 2, "result": []},
+    ]},
+    {"op": compiler.POP, "depth": 1, "result": []},
+]
+
+
+class BuildASTTest(unittest.TestCase):
+
+    def test_build(self):
+        ops = evmtrace.buildAST(TRACE)
+        self.assertEqual([op.pc for op in ops], [0, 2, 4, 5, 6])
+        self.assertIsInstance(ops[0], evmtrace.PushNode)
+        self.assertEqual(ops[2].args, ["0x3", "0x2"])
+        self.assertIsInstance(ops[3], evmtrace.CallNode)
+        self.assertEqual([op.opname for op in ops[3].ops], ["PUSH1", "POP", "STOP"])
+        self.assertEqual(ops[3].ops[1].args, ["0x1"])
+        # the call consumed the sum and pushed its own result
+        self.assertEqual(ops[4].args, ["0x1"])
+
+    def test_generator(self):
+        def nodes(ops):
+            return [(op.pc, op.opname, op.args, op.result, nodes(getattr(op, "ops", []))) for op in ops]
+        self.assertEqual(nodes(evmtrace.buildAST(step for step in TRACE)), nodes(evmtrace.buildAST(TRACE)))
+
+    def test_deep_calls(self):
+        step = {"op": compiler.STOP, "depth": 5001, "result": []}
+        for depth in range(5000, 0, -1):
+            step = {"op": compiler.CALL, "depth": depth, "result": ["0x1"], "ops": [step]}
+        ops = evmtrace.buildAST([step])
+        for _ in range(5000):
+            ops = ops[0].ops
+        self.assertEqual(ops[0].opname, "STOP")
+
+    def test_annotations(self):
+        ast = evmtrace.TransactionTrace.build(TRACE)
+        evmtrace.findReachings(ast)
+        (push, add) = (ast.ops[0], ast.ops[2])
+        self.assertFalse(hasattr(add, "__dict__"))
+        self.assertEqual(add.annotations[evmtrace.ReachingDefinitions], [ast.ops[1], push])
+        self.assertEqual(push.annotations[evmtrace.ReachesDefinitions], [add])
+        self.assertNotIn(evmtrace.VariableName, add.annotations)
+        add.setAnnotation(evmtrace.VariableName("a"))
+        self.assertEqual(add.annotations.get(evmtrace.VariableName), "a")
+        self.assertEqual(set(add.annotations), {evmtrace.ReachingDefinitions, evmtrace.ReachesDefinitions,
+                                                evmtrace.VariableName})
+
+    def test_write(self):
+        # CALLCODE is printed with the generic format, CALL needs all seven args
+        trace = [dict(step, op=compiler.CALLCODE) if 'ops' in step else step for step in TRACE]
+        ast = evmtrace.TransactionTrace.build(trace)
+        evmtrace.findReachings(ast)
+        f = io.StringIO()
+        self.assertEqual(ast.write(f), 8)
+        self.assertEqual(f.getvalue(), str(ast) + "\n")
+        # the ops of the call are one level deeper, a range selects lines of the output
+        self.assertEqual(list(ast.lines(maxdepth=0)), [line for line in str(ast).split("\n") if line.startswith("   1")])
+        self.assertEqual(list(ast.lines(start=4, end=6)), str(ast).split("\n")[4:6])
+
+        f = io.StringIO()
+        self.assertEqual(ast.write(f, html=True, maxdepth=0), 5)
+        html = f.getvalue().split("\n")
+        self.assertEqual(html[0], '<pre class="evmtrace">')
+        self.assertEqual(html[3], '<span class="depth">   1</span> <span class="pc">0x0004</span> 0x3 + 0x2'
+                                  '                                -&gt; 0x5')
+
+    def test_compose_deep_expression(self):
+        # 1 + 1 + 1 ... nested 5000 levels deep, used once by the final SSTORE
+        steps = [{"op": compiler.PUSH1, "depth": 1, "result": ["0x1"], "len": 2}]
+        for i in range(5000):
+            steps.append({"op": compiler.PUSH1, "depth": 1, "result": ["0x1"], "len": 2})
+            steps.append({"op": compiler.ADD, "depth": 1, "result": [hex(i + 2)]})
+        steps.append({"op": compiler.PUSH1, "depth": 1, "result": ["0x0"], "len": 2})
+        steps.append({"op": compiler.SSTORE, "depth": 1, "result": []})
+        ast = evmtrace.TransactionTrace.build(steps)
+        evmtrace.findReachings(ast)
+        statements = evmtrace.composeOperations(ast.ops)
+        self.assertEqual(len(statements), 1)
+        expression = statements[0].expression
+        self.assertEqual(expression.opname, "SSTORE")
+        for _ in range(5000):
+            expression = expression.args[1]
+            self.assertEqual(expression.opname, "ADD")
+        # formatting does not recurse either
+        lines = str(evmtrace.TransactionTrace(statements)).split("\n")
+        self.assertEqual(len(lines), 1)
+        self.assertTrue(lines[0].startswith("   1 0x%04x SSTORE(addr=0x0, data=" % statements[0].pc))
+        self.assertEqual(lines[0].count("0x1 + "), 5000)
+
+    def test_compose_calls(self):
+        ast = evmtrace.TransactionTrace.build(TRACE)
+        evmtrace.findReachings(ast)
+        statements = evmtrace.composeOperations(ast.ops)
+        # the call is assigned to a variable, the POP after it uses it
+        self.assertEqual([type(s).__name__ for s in statements], ["AssignmentStatement", "ExpressionStatement"])
+        self.assertEqual(str(statements[1]), "POP(a)")
+        self.assertEqual([str(s) for s in statements[0].expression.ops], ["POP(0x1)", "STOP()"])
+
+
+def _line(pc, op, stack, depth, memory="0x"):
+    return json.dumps({"pc": pc, "op": op, "stack": stack, "depth": depth, "memory": memory})
+
+
+# MSTORE 0x2a at 0, CALL with the word as input; the callee returns 2 bytes of it, then the caller POPs the result
+WORD = "%064x" % 0x2a
+JSON_TRACE = [
+    _line(0, compiler.PUSH1, [], 1),
+    _line(2, compiler.PUSH1, ["0x2a"], 1),
+    _line(4, compiler.MSTORE, ["0x2a", "0x0"], 1),
+    _line(5, compiler.CALL, ["0x0", "0x0", "0x20", "0x0", "0x0", "0xaa", "0xffff"], 1, "0x" + WORD),
+    _line(0, compiler.PUSH1, [], 2),
+    _line(2, compiler.PUSH1, ["0x2"], 2),
+    _line(4, compiler.RETURN, ["0x2", "0x1e"], 2, [WORD[:32], WORD[32:]]),
+    _line(6, compiler.POP, ["0x1"], 1, "0x" + WORD),
+    _line(7, compiler.STOP, [], 1, "0x" + WORD),
+    json.dumps({"output": "", "gasUsed": "0x1"}),
+]
+
+# MSTORE 0x2a at 0, CREATE with the word as init code; the init code returns 2 bytes, the caller POPs the address
+CREATE_TRACE = [
+    _line(0, compiler.PUSH1, [], 1),
+    _line(2, compiler.PUSH1, ["0x2a"], 1),
+    _line(4, compiler.MSTORE, ["0x2a", "0x0"], 1),
+    _line(5, compiler.CREATE, ["0x20", "0x0", "0x0"], 1, "0x" + WORD),
+    _line(0, compiler.PUSH1, [], 2),
+    _line(2, compiler.PUSH1, ["0x2"], 2),
+    _line(4, compiler.RETURN, ["0x2", "0x1e"], 2, [WORD[:32], WORD[32:]]),
+    _line(6, compiler.POP, ["0xbb"], 1, "0x" + WORD),
+    _line(7, compiler.STOP, [], 1, "0x" + WORD),
+    json.dumps({"output": "", "gasUsed": "0x1"}),
+]
+
+
+class EvmResultTest(unittest.TestCase):
+
+    def test_memory_tracker(self):
+        memory = evmtrace.MemoryTracker()
+        self.assertIsNone(memory.update("0x"))
+        self.assertEqual(memory.update("0x" + "00" * 64), (0, bytes(64)))
+        self.assertIsNone(memory.update(["00" * 32, "00" * 32]))
+        self.assertEqual(memory.update("0x" + "00" * 33 + "0102" + "00" * 29), (33, b"\x01\x02"))
+        self.assertEqual(memory.read(33, 2), "0x0102")
+        self.assertEqual(memory.read(63, 2), "0x0000")
+
+    def test_steps(self):
+        steps = evmtrace.evmSteps(JSON_TRACE)
+        self.assertEqual([step['op'] for step in itertools.islice(steps, 3)],
+                         [compiler.PUSH1, compiler.PUSH1, compiler.MSTORE])
+        call = next(steps)
+        self.assertEqual(call['input'], "0x" + WORD)
+        self.assertEqual(call['memdiff'], (0, bytes.fromhex(WORD)))
+        # the result of the call is known once its frame is walked
+        self.assertEqual([step['result'] for step in call['ops']], [["0x2"], ["0x1e"], []])
+        self.assertEqual(call['result'], ["0x1"])
+        self.assertEqual(call['return'], "0x002a")
+        self.assertEqual([step['op'] for step in steps], [compiler.POP, compiler.STOP])
+
+    def test_create(self):
+        steps = evmtrace.evmSteps(CREATE_TRACE)
+        create = list(itertools.islice(steps, 4))[3]
+        self.assertEqual((create['op'], create['value'], create['input']), (compiler.CREATE, 0, "0x" + WORD))
+        # the init code runs in a frame of its own
+        self.assertEqual([step['op'] for step in create['ops']], [compiler.PUSH1, compiler.PUSH1, compiler.RETURN])
+        self.assertEqual(create['result'], ["0xbb"])
+        self.assertEqual(create['return'], "0x002a")
+        self.assertEqual([step['op'] for step in steps], [compiler.POP, compiler.STOP])
+
+        events = [(event, step['op']) for event, step in evmtrace.evmEvents(CREATE_TRACE)]
+        self.assertEqual(events[3:8], [("enter", compiler.CREATE), ("step", compiler.PUSH1), ("step", compiler.PUSH1),
+                                       ("step", compiler.RETURN), ("exit", compiler.CREATE)])
+        ast = evmtrace.TransactionTrace.build(evmtrace.evmSteps(CREATE_TRACE))
+        self.assertEqual(len(ast.ops[3].ops), 3)
+        self.assertEqual(ast.ops[4].args, ["0xbb"])
+
+    def test_skipped_call(self):
+        steps = list(evmtrace.evmSteps(JSON_TRACE))
+        self.assertEqual([step['op'] for step in steps],
+                         [compiler.PUSH1, compiler.PUSH1, compiler.MSTORE, compiler.CALL, compiler.POP, compiler.STOP])
+        self.assertEqual(steps[3]['result'], ["0x1"])
+
+    def test_build(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "trace.json")
+            with open(path, "w") as f:
+                f.write("\n".join(JSON_TRACE) + "\n")
+            result = evmtrace.evmResult(path)
+            self.assertEqual(len(result[3]['ops']), 3)
+            with open(path) as f:
+                streamed = evmtrace.TransactionTrace.build(evmtrace.evmSteps(f))
+            def nodes(ops):
+                return [(op.pc, op.opname, op.args, op.result, nodes(getattr(op, "ops", []))) for op in ops]
+            self.assertEqual(nodes(streamed.ops), nodes(evmtrace.TransactionTrace.build(result).ops))
+            self.assertEqual(streamed.ops[4].args, ["0x1"])
+            self.assertEqual(streamed.ops[3].ops[2].args, ["0x1e", "0x2"])
+
+    def test_events(self):
+        events = [(event, step['op']) for event, step in evmtrace.evmEvents(JSON_TRACE)]
+        self.assertEqual(events[3:8], [("enter", compiler.CALL), ("step", compiler.PUSH1), ("step", compiler.PUSH1),
+                                       ("step", compiler.RETURN), ("exit", compiler.CALL)])
+        self.assertEqual(len(events), 10)
@@ -0,0 +1,58 @@
+import unittest
+from evmlab import opcodes
+
+# PUSH2 0x5b5b, JUMPDEST, PUSH1 0x03, JUMP, INVALID(0xef), PUSH4 truncated 0x0102
+CODE = "0x" + "615b5b" + "5b" + "600356" + "ef" + "630102"
+
+
+class DisassemblyTest(unittest.TestCase):
+
+    def test_disassembly(self):
+        dis = opcodes.disassembly(CODE)
+        self.assertEqual(list(dis.pcs), [0, 3, 4, 6, 7, 8])
+        self.assertEqual(dis.ops, bytes([0x61, 0x5b, 0x60, 0x56, 0xef, 0x63]))
+        self.assertEqual(dis.immediate(0), b"\x5b\x5b")
+        self.assertEqual(dis.immediate(1), b"")
+        self.assertEqual(dis.immediate(5), b"\x01\x02")
+        self.assertEqual(dis.instructionAt(6), 3)
+        with self.assertRaises(KeyError):
+            dis.instructionAt(1)
+        # the 0x5b in the push data is no jump destination
+        self.assertEqual([pc for pc in range(12) if dis.isJumpdest(pc)], [3])
+
+    def test_cache(self):
+        dis = opcodes.disassembly(CODE)
+        self.assertIs(opcodes.disassembly(bytes.fromhex(CODE[2:])), dis)
+        self.assertIsNot(opcodes.disassembly(CODE + "00"), dis)
+
+    def test_parse_code(self):
+        ins = opcodes.parseCode(CODE)
+        self.assertEqual(list(ins), [0, 3, 4, 6, 7, 8])
+        self.assertEqual(ins[0], ['PUSH2', 0, 1, 3, "0x5b5b"])
+        self.assertEqual(ins[7], ['INVALID', 0, 0, 0])
+        self.assertEqual(ins[8][-1], "0x0102")
+        # the table entries are not modified
+        self.assertEqual(opcodes.opcodes[0x61], ['PUSH2', 0, 1, 3])
+
+
+class OpcodeTableTest(unittest.TestCase):
+
+    def test_forks(self):
+        frontier = opcodes.opcodeTable("Frontier")
+        self.assertEqual(frontier.valid[0xf4], 0)
+        self.assertEqual(frontier.names[0xf4], "INVALID")
+        self.assertNotIn("DELEGATECALL", frontier.byName)
+        self.assertEqual(opcodes.opcodeTable("Homestead").names[0xf4], "DELEGATECALL")
+        self.assertEqual(opcodes.opcodeTable("Byzantium").valid[0xfd], 1)
+        self.assertEqual(opcodes.opcodeTable("Byzantium").valid[0x1b], 0)
+        with self.assertRaises(KeyError):
+            opcodes.opcodeTable("Olympic")
+
+    def test_latest(self):
+        table = opcodes.opcodeTable()
+        self.assertIs(table, opcodes.opcodeTable(opcodes.LATEST_FORK))
+        self.assertEqual(table.byName, opcodes.reverse_opcodes)
+        for op in range(256):
+            (name, ins, outs, gas) = opcodes.opcodes.get(op, opcodes.INVALID)
+            self.assertEqual((table.names[op], table.ins[op], table.outs[op], table.gas[op]), (name, ins, outs, gas))
+            self.assertEqual(table.valid[op], op in opcodes.opcodes)
@@ -0,0 +1,65 @@
+import unittest
+from evmlab.reducer import CodeReducer, Edit, Instruction, disassemble
+
+# CALL, PUSH1 0xff, JUMP, 251x STOP, JUMPDEST at pc 255
+CALL_AT_ZERO = "0x" + "f1" + "60ff56" + "00" * 251 + "5b"
+# PUSH1 0x01, PUSH1 0x09, JUMP, PUSH2 0x1234, POP, JUMPDEST, 5x PUSH1 0x00, PUSH20 <addr>, PUSH2 0xffff, CALL, STOP
+CODE = "0x" + "6001" + "600956" + "61123450" + "5b" + "6000" * 5 + "73" + "aa" * 20 + "61ffff" + "f1" + "00"
+
+
+class CodeReducerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.reducer = CodeReducer(CODE)
+
+    def test_disassemble(self):
+        instructions = disassemble(CODE)
+        self.assertEqual(instructions[1].pc, 2)
+        self.assertEqual(instructions[1].operand, b'\x09')
+        self.assertEqual(instructions[3].operand, b'\x12\x34')
+        self.assertEqual(sum(1 + len(i.operand) for i in instructions), len(CODE) // 2 - 1)
+
+    def test_blocks(self):
+        self.assertEqual(self.reducer.blocks(), [[0, 1, 2], [3, 4], list(range(5, 15))])
+
+    def test_candidates_ordered_by_payoff(self):
+        candidates = [code for (_, code) in self.reducer.candidates()]
+        self.assertTrue(candidates)
+        lengths = [len(c) for c in candidates]
+        self.assertEqual(lengths[0], min(lengths))
+        for code in candidates:
+            self.assertLessEqual(len(code), len(CODE))
+
+    def test_jump_relocation(self):
+        # dropping the dead block between JUMP and JUMPDEST moves the JUMPDEST from pc 9 to pc 5
+        candidates = dict(self.reducer.candidates())
+        self.assertTrue(candidates["block at pc 5"].startswith("0x60016005565b"))
+
+    def test_call_sequence(self):
+        candidates = dict(self.reducer.candidates())
+        self.assertEqual(candidates["call sequence at pc 44"], "0x6001600956611234505b600000")
+
+    def test_call_without_arguments(self):
+        # the PUSH1 0x00 replacing the call is one byte larger, and would move the JUMPDEST to pc 256
+        reducer = CodeReducer(CALL_AT_ZERO)
+        candidates = dict(reducer.candidates())
+        self.assertTrue(candidates)
+        self.assertNotIn("call sequence at pc 0", candidates)
+
+    def test_target_out_of_range(self):
+        reducer = CodeReducer(CALL_AT_ZERO)
+        edit = Edit(-1, "grow", set(), {0: Instruction(0, 0x60, b'\x00')})
+        self.assertIsNone(reducer.apply(edit))
+
+    def test_pushed_jumpdest(self):
+        # PUSH1 0x08, PUSH1 0x00, MSTORE, PUSH1 0x00, POP, JUMPDEST, PUSH1 0x00, MLOAD, JUMP: the target is loaded
+        # from memory, so the JUMPDEST at pc 8 must not move while its pc is still pushed
+        reducer = CodeReducer("0x" + "6008600052" + "600050" + "5b" + "600051" + "56")
+        candidates = dict(reducer.candidates())
+        self.assertTrue(candidates)
+        for code in candidates.values():
+            dis = disassemble(code)
+            if Instruction(0, 0x60, b'\x08') in dis:
+                self.assertIn(Instruction(8, 0x5b, b''), dis)
+        self.assertNotIn("instructions 3-5", candidates)
+        self.assertIsNone(reducer.apply(reducer._removal("pop", [3, 4])))
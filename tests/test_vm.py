@@ -0,0 +1,54 @@
+import json
+import unittest
+from evmlab import vm
+
+
+def _step(pc, op, depth):
+    return json.dumps({"pc": pc, "op": op, "gas": "0x10", "gasCost": "0x3", "memory": "0x", "memSize": 0,
+                       "stack": [], "depth": depth, "opName": "PUSH1" if op == 0x60 else "ADDRESS"})
+
+
+# the same test on two forks: a PUSH1 on Byzantium, an ADDRESS on Constantinople
+GETH = [_step(0, 0x30, 1), '{"stateRoot": "0xc0"}',
+        _step(0, 0x60, 1), '{"stateRoot": "0xb0"}',
+        '[', '  {', '    "name": "randomStatetest",', '    "pass": true,', '    "fork": "Constantinople"', '  },',
+        '  {', '    "name": "randomStatetest",', '    "pass": true,', '    "fork": "Byzantium"', '  }', ']']
+PARITY = ['{"test":"randomStatetest:byzantium:0","action":"starting"}',
+          _step(0, 0x60, 1), '{"stateRoot":"0xb0"}',
+          '{"test":"randomStatetest:constantinople:0","action":"starting"}',
+          _step(0, 0x30, 1), '{"stateRoot":"0xc0"}']
+
+
+class SubtestsTest(unittest.TestCase):
+
+    def test_geth(self):
+        subtests = vm.GethVM.subtests(GETH)
+        self.assertEqual([fork for fork, _ in subtests], ["Constantinople", "Byzantium"])
+        self.assertEqual(subtests[1][1][-1], "]")
+        # without a summary, the subtests can't be told apart, geth executes the forks in random order
+        with self.assertRaises(vm.UnknownForkError):
+            vm.GethVM.subtests(GETH[:4])
+        # a single subtest is the one fork of the test
+        self.assertEqual([fork for fork, _ in vm.GethVM.subtests(GETH[:2])], [None])
+
+    def test_parity(self):
+        subtests = vm.ParityVM.subtests(["warming up"] + PARITY)
+        self.assertEqual([fork for fork, _ in subtests], ["byzantium", "constantinople"])
+        self.assertEqual(subtests[0][1][:2], ["warming up", PARITY[0]])
+
+    def test_by_fork(self):
+        forks = ["Byzantium", "Constantinople"]
+        clients = [[(fork, vm.GethVM.canonicalized(lines)) for fork, lines in vm.GethVM.subtests(GETH)],
+                   [(fork, vm.ParityVM.canonicalized(lines)) for fork, lines in vm.ParityVM.subtests(PARITY)]]
+        paired = vm.subtests_by_fork(clients, forks)
+        self.assertEqual([fork for fork, _ in paired], forks)
+        for (fork, traces) in paired:
+            self.assertEqual([[step['op'] for step in trace if 'op' in step] for trace in traces],
+                             [[0x60 if fork == "Byzantium" else 0x30]] * 2)
+            self.assertTrue(vm.compare_traces([[vm.toText(step) for step in trace] for trace in traces],
+                                              ["geth", "parity"])[0])
+
+    def test_by_position(self):
+        # clients which do not name the forks are taken to run them in order
+        paired = vm.subtests_by_fork([[(None, "a"), (None, "b")], [("B", "b"), ("A", "a")]], ["A", "B"])
+        self.assertEqual(paired, [("A", ["a", "a"]), ("B", ["b", "b"])])
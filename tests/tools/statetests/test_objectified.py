@@ -4,8 +4,10 @@
 
 import unittest
 import json
+import io
 from evmlab.tools.statetests import rndval
 import evmlab.tools.statetests.templates
+from evmlab.tools.statetests.templates.statetest import StateTestTemplate
 
 
 class EthFillerObjectifiedTest(unittest.TestCase):
@@ -27,3 +29,149 @@ class EthFillerObjectifiedTest(unittest.TestCase):
         import evmlab.tools.statetests.randomtest
         print(json.dumps(self.template, cls=evmlab.tools.statetests.randomtest.RandomTestsJsonEncoder))
 
+    def test_compiled_template(self):
+        import random
+        import evmlab.tools.statetests.randomtest as randomtest
+        plan = randomtest.compile_template(self.template)
+        self.assertIn((("randomStatetest", "env", "currentCoinbase"), self.template["randomStatetest"]["env"]["currentCoinbase"]),
+                      plan.slots)
+
+        # same values in the same order as the json encoder
+        rndval.DEFAULT_SOURCE.seed(1234)
+        random.seed(1234)
+        filled = plan.fill()
+        rndval.DEFAULT_SOURCE.seed(1234)
+        random.seed(1234)
+        self.assertEqual(filled, json.loads(json.dumps(self.template, cls=randomtest.RandomTestsJsonEncoder)))
+
+        # every fill is a fresh copy
+        filled["randomStatetest"]["post"]["Byzantium"][0]["indexes"]["data"] = 1
+        self.assertEqual(plan.fill()["randomStatetest"]["post"]["Byzantium"][0]["indexes"]["data"], 0)
+
+        # placeholders of text based templates
+        plan = randomtest.compile_template(evmlab.tools.statetests.templates.text_based.TEMPLATE_TransactionTest)
+        self.assertEqual(len(plan.slots), 9)
+        self.assertNotIn("[HEX]", json.dumps(plan.fill()))
+
+
+
+class StateTestTemplateTest(unittest.TestCase):
+
+    def template(self):
+        template = StateTestTemplate(nonce="0x1d", codegenerators={rndval.RndCodeBytes: 50, rndval.RndCodeInstr: 50},
+                                     fill_prestate_for_args=True, source=rndval.RandomSource(1234))
+        template.add_precomipled_prestates()
+        return template
+
+    def test_fill(self):
+        # the json round trip fill() used to do
+        template = self.template()
+        expected = []
+        for _ in range(3):
+            template._fill_counter += 1
+            expected.append(json.loads(template.json()))
+
+        template = self.template()
+        self.assertEqual([template.fill() for _ in range(3)], expected)
+        template = self.template()
+        self.assertEqual([json.loads(template.fill_bytes().decode("utf-8")) for _ in range(3)], expected)
+        template = self.template()
+        filled = []
+        for _ in range(3):
+            f = io.StringIO()
+            template.fill_to_file(f)
+            filled.append(json.loads(f.getvalue()))
+        self.assertEqual(filled, expected)
+
+    def test_fill_name_and_forks(self):
+        test = self.template().fill(name="test1", forks=["Byzantium", "Constantinople"])
+        self.assertEqual(list(test.keys()), ["test1"])
+        post = test["test1"]["post"]
+        self.assertEqual(list(post.keys()), ["Byzantium", "Constantinople"])
+        self.assertEqual(post["Byzantium"], post["Constantinople"])
+
+    def test_fragment_cache(self):
+        template, expected = self.template(), self.template()
+        for _ in range(3):
+            expected._fill_counter += 1
+            self.assertEqual(template.fill_bytes().decode("utf-8"), expected.json())
+
+        # the static members of the prestates are only encoded once
+        account = template.pre["0x0000000000000000000000000000000000000001"]
+        self.assertIsNotNone(account._fragments)
+        self.assertEqual(json.loads(account.json()), {"balance": "0x01", "code": "", "nonce": "0x1d", "storage": {}})
+        account.code = "0x00"
+        self.assertIsNone(account._fragments)
+        self.assertEqual(json.loads(account.json())["code"], "0x00")
+
+        # so are the static values of the other sections, generated ones are encoded on every fill
+        self.assertIn("secretKey", template._json["transaction"]._pairs)
+        self.assertNotIn("gasLimit", template._json["transaction"]._pairs)
+        self.assertIn("Byzantium", template._json["post"]._pairs)
+        template.info.comment = "changed"
+        expected.info.comment = "changed"
+        for forks in (None, ["Byzantium", "Constantinople"]):
+            expected._fill_counter += 1
+            filled = template.fill_bytes(forks=forks).decode("utf-8")
+            self.assertEqual(json.loads(filled)["randomStatetest"]["_info"]["comment"], "changed")
+            self.assertEqual(json.loads(filled)["randomStatetest"]["env"],
+                             json.loads(expected.json())["randomStatetest"]["env"])
+
+    def test_prestate_pool(self):
+        import configparser
+        from types import SimpleNamespace
+        config = configparser.ConfigParser()
+        config.read_dict({"statetest": {"prestate.pool.size": "4", "prestate.pool.max.uses": "2"}})
+        template = StateTestTemplate(nonce="0x1d", codegenerators={rndval.RndCodeBytes: 50, rndval.RndCodeInstr: 50},
+                                     source=rndval.RandomSource(1234),
+                                     _config=SimpleNamespace(statetest=config["statetest"], codegen=None))
+        pool = template.prestate_pool
+        pool.stop()
+        pool.fill()
+        self.assertEqual(pool.status()["size"], {"RndCodeBytes": 4, "RndCodeInstr": 4})
+
+        for _ in range(10):
+            template.fill()
+        status = pool.status()
+        self.assertEqual(status["misses"], 0)
+        self.assertGreater(status["hits"], 0)
+        # prestates are evicted on their second use, the background thread is stopped so nothing is refilled
+        self.assertEqual(status["generated"], 8)
+        self.assertEqual(8 - sum(status["size"].values()), status["evicted"])
+        self.assertGreaterEqual(status["evicted"], status["hits"] - 8)
+
+    def test_prestate_pool_state(self):
+        # the pool is part of the template state, a restored template fills the same tests. the prestates refer
+        # to the template's source, a checkpoint restores them along with the default source
+        import configparser, pickle
+        from types import SimpleNamespace
+        config = configparser.ConfigParser()
+        config.read_dict({"statetest": {"prestate.pool.size": "4", "prestate.pool.max.uses": "2"}})
+
+        def template():
+            template = StateTestTemplate(nonce="0x1d", codegenerators={rndval.RndCodeBytes: 50, rndval.RndCodeInstr: 50},
+                                         fill_prestate_for_args=True,
+                                         _config=SimpleNamespace(statetest=config["statetest"], codegen=None))
+            template.prestate_pool.stop()
+            return template
+
+        saved = rndval.DEFAULT_SOURCE.getstate()
+        try:
+            rndval.DEFAULT_SOURCE.seed(1234)
+            original = template()
+            original.prestate_pool.fill()
+            for _ in range(10):
+                original.fill()
+            state = pickle.loads(pickle.dumps(original.getstate()))
+            source = rndval.DEFAULT_SOURCE.getstate()
+            original.prestate_pool.fill()
+            expected = [original.fill() for _ in range(5)]
+
+            restored = template()
+            restored.setstate(state)
+            self.assertEqual(restored.prestate_pool.getstate(), state["pool"])
+            rndval.DEFAULT_SOURCE.setstate(source)
+            restored.prestate_pool.fill()
+            self.assertEqual([restored.fill() for _ in range(5)], expected)
+        finally:
+            rndval.DEFAULT_SOURCE.setstate(saved)
@@ -33,8 +33,38 @@ class EthFillerTest(unittest.TestCase):
                 self.assertNotIn(cls.placeholder, seen_placeholders)
                 seen_placeholders.add(cls.placeholder)
 
-    #def test_rlp(self):
-    #    raise NotImplementedError
+    def test_rlp(self):
+        source = rndval.RandomSource(1234)
+
+        def items(data):
+            # decodes all items of well formed rlp, returns the number of items
+            (prefix, n) = (data[0], 1)
+            if prefix < 0x80:
+                return 1, data[1:]
+            if prefix < 0xc0:
+                (length, data) = (prefix - 0x80, data[1:]) if prefix <= 0xb7 else \
+                    (int.from_bytes(data[1:prefix - 0xb6], "big"), data[prefix - 0xb6:])
+                self.assertTrue(length >= 56 or prefix <= 0xb7)
+                return 1, data[length:]
+            (length, data) = (prefix - 0xc0, data[1:]) if prefix <= 0xf7 else \
+                (int.from_bytes(data[1:prefix - 0xf6], "big"), data[prefix - 0xf6:])
+            (payload, rest) = (data[:length], data[length:])
+            while payload:
+                (k, payload) = items(payload)
+                n += k
+            return n, rest
+
+        rlp = rndval.RndRlp(depth=3, malformed=0, source=source)
+        for _ in range(200):
+            data = rlp.generate()
+            self.assertTrue(data.startswith("0x"))
+            self.assertEqual(items(bytes.fromhex(data[2:]))[1], b'')
+
+        batch = rndval.RndRlp(depth=1, source=source).generate_batch(50)
+        self.assertEqual(len(batch), 50)
+        self.assertEqual(rndval.RndRlp(seed=1).generate_batch(5), rndval.RndRlp(seed=1).generate_batch(5))
+        self.assertEqual(rndval.base.toCompactHex(0x100), "0100")
+        self.assertEqual(rndval.base.fromHex("0x0100"), b'\x01\x00')
 
     def test_codebytes(self):
         expect_prefix = "0x"
@@ -190,3 +220,91 @@ class EthFillerTest(unittest.TestCase):
     def test_gasprice(self):
         self._test_hex_cls(cls=rndval.RndGasPrice,
                            _min=0, _max=10)
+
+    def test_weightedrandomizer(self):
+        r = rndval.base.WeightedRandomizer({"a": 1, "b": 3, "disabled": 0})
+        self.assertEqual(len(r), 2)
+        samples = r.sample(self.num_samples * 100)
+        self.assertEqual(len(samples), self.num_samples * 100)
+        self.assertNotIn("disabled", samples)
+        self.assertAlmostEqual(samples.count("b") / len(samples), 0.75, delta=0.05)
+        self.assertIn(r.random(), ("a", "b"))
+
+        self.assertEqual(rndval.base.WeightedRandomizer({"only": 5}).sample(3), ["only"] * 3)
+        self.assertIsNone(rndval.base.WeightedRandomizer({"disabled": 0}).random())
+
+    def test_sample_bytes(self):
+        r = rndval.base.WeightedRandomizer({0x60: 1, 0x01: 3})
+        paths = [False, True] if rndval.base.numpy is not None else [False]
+        use_numpy = rndval.base.USE_NUMPY
+        try:
+            for rndval.base.USE_NUMPY in paths:
+                samples = r.sample_bytes(self.num_samples * 100)
+                self.assertIsInstance(samples, bytes)
+                self.assertEqual(set(samples), {0x60, 0x01})
+                self.assertAlmostEqual(samples.count(0x01) / len(samples), 0.75, delta=0.05)
+                self.assertEqual(r.sample_bytes(0), b'')
+                self.assertEqual(len(rndval.RndCodeBytes().random_code_byte_sequence(1000)), 1000)
+        finally:
+            rndval.base.USE_NUMPY = use_numpy
+
+    def test_bytesequence(self):
+        r = rndval.base._RndBase()
+        self.assertEqual(r.randomByteSequence(0), bytearray())
+        self.assertEqual(len(r.randomByteSequence(32)), 32)
+        self.assertGreater(len(set(r.randomByteSequence(1024))), 128)
+
+    def test_randomsource(self):
+        a, b = rndval.RandomSource(1234), rndval.RandomSource(1234)
+        self.assertEqual([a.bytes(n) for n in (1, 32, 100000, 7)], [b.bytes(n) for n in (1, 32, 100000, 7)])
+        self.assertEqual(a.ints(100, 0, 15), b.ints(100, 0, 15))
+        self.assertEqual(a.ints(100, 1, 1000), b.ints(100, 1, 1000))
+        self.assertTrue(all(0 <= i <= 15 for i in a.ints(1000, 0, 15)))
+        self.assertEqual(len(a.hex(20)), 40)
+
+        # the state includes the buffered entropy
+        state = a.getstate()
+        values = a.bytes(64)
+        a.setstate(state)
+        self.assertEqual(a.bytes(64), values)
+
+        # streams are independent, but reproducible from the seed
+        self.assertNotEqual(a.stream(0).bytes(32), a.stream(1).bytes(32))
+        self.assertEqual(a.stream(3).bytes(32), rndval.RandomSource(1234).stream(3).bytes(32))
+
+    def test_seeded_generators(self):
+        def values(seed):
+            source = rndval.RandomSource(seed)
+            return [rndval.RndHexInt(source=source).generate(),
+                    rndval.RndDestAddress(source=source).generate(),
+                    rndval.RndCodeBytes(source=source).generate(),
+                    rndval.RndCodeInstr(source=source).generate()]
+
+        self.assertEqual(values(7), values(7))
+        self.assertNotEqual(values(7), values(8))
+        self.assertEqual(rndval.RndHash32(seed=3).generate(), rndval.RndHash32(seed=3).generate())
+
+    def test_codesmart2_reload(self):
+        import configparser
+        config = configparser.ConfigParser()
+        config.read_dict({"codegen": {"engine.RndCodeSmart2.min_gas": "200"}})
+        codegen = rndval.RndCodeSmart2(_config=config["codegen"], source=rndval.RandomSource(1234))
+        self.assertEqual(codegen.settings.min_gas, 200)
+        self.assertTrue(evmdasm.EvmBytecode(codegen.generate()[2:]).disassemble())
+
+        # the config is only read on reload
+        config["codegen"]["engine.RndCodeSmart2.min_gas"] = "300"
+        config["codegen"]["engine.RndCodeSmart2.mutate.instructions.p"] = "1000"
+        self.assertEqual(codegen.settings.min_gas, 200)
+        codegen.reload()
+        self.assertEqual(codegen.settings.min_gas, 300)
+        self.assertEqual(codegen.settings.mutate_instructions_p, 1000)
+        codegen.generate()
+
+    def test_codesmart2_private_random(self):
+        import random
+        state = random.getstate()
+        codes = [rndval.RndCodeSmart2(source=rndval.RandomSource(99)).generate() for _ in range(2)]
+        self.assertEqual(codes[0], codes[1])
+        # the global random module is neither seeded nor drawn from
+        self.assertEqual(random.getstate(), state)
@@ -0,0 +1,71 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# Author : <github.com/tintinweb>
+
+import unittest
+import json
+import os
+import gzip
+import tempfile
+from evmlab.tools.statetests import rndval, statetests
+import evmlab.tools.statetests.templates as templates
+
+
+class StatetestsCliTest(unittest.TestCase):
+
+    def setUp(self):
+        self.template = templates.object_based.TEMPLATE_RandomStateTest
+
+    def fill(self, count, jobs):
+        rndval.DEFAULT_SOURCE.seed(1234)
+        return list(statetests.generate_tests(self.template, count, jobs=jobs))
+
+    def test_workers(self):
+        tests = self.fill(statetests.CHUNK_SIZE + 6, jobs=2)
+        self.assertEqual([name for name, _ in tests], ["randomStatetest%d" % i for i in range(statetests.CHUNK_SIZE + 6)])
+        # the tests depend on the seed only, not on the number of workers
+        self.assertEqual(tests, self.fill(statetests.CHUNK_SIZE + 6, jobs=3))
+        self.assertEqual(tests, self.fill(statetests.CHUNK_SIZE + 6, jobs=1))
+
+    def test_writers(self):
+        tests = self.fill(3, jobs=1)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "tests.jsonl.gz")
+            statetests.write_jsonl(tests, path, compress="gzip")
+            with gzip.open(path, "rt") as f:
+                lines = [json.loads(line) for line in f]
+            self.assertEqual(lines, [{name: json.loads(test)} for name, test in tests])
+
+            path = os.path.join(tmp, "tests.json")
+            statetests.write_json(tests, path)
+            with open(path) as f:
+                self.assertEqual(json.load(f), {name: json.loads(test) for name, test in tests})
+
+            progress = statetests.Progress(quiet=True)
+            statetests.write_files(tests, os.path.join(tmp, "files"), progress=progress)
+            self.assertEqual(progress.count, 3)
+            self.assertEqual(sorted(os.listdir(os.path.join(tmp, "files"))),
+                             ["randomStatetest0.json", "randomStatetest1.json", "randomStatetest2.json"])
+
+    def test_corpus(self):
+        from evmlab.tools.statetests.corpus import Corpus, CorpusError
+        tests = self.fill(5, jobs=1)
+        with tempfile.TemporaryDirectory() as tmp:
+            for compress in (None, "gzip", "xz"):
+                path = os.path.join(tmp, "tests.corpus")
+                statetests.write_corpus(tests, path, compress=compress)
+                with Corpus(path) as corpus:
+                    self.assertEqual(len(corpus), 5)
+                    self.assertEqual(json.loads(corpus[3].decode("utf-8")), {tests[3][0]: json.loads(tests[3][1])})
+                    self.assertEqual(corpus[-1], corpus[4])
+                    # shards are index ranges, clamped to the corpus
+                    self.assertEqual([index for index, _ in corpus.read(2, 4)], [2, 3])
+                    self.assertEqual([data for _, data in corpus.read(3, 100)], [corpus[3], corpus[4]])
+                    self.assertEqual(list(corpus.read(6)), [])
+                    with self.assertRaises(IndexError):
+                        corpus[5]
+
+            with open(path, "r+b") as f:
+                f.truncate(os.path.getsize(path) - 1)
+            with self.assertRaises(CorpusError):
+                Corpus(path)
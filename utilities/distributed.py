@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+"""
+Spreads one fuzzing campaign over several fuzzer processes, on one or more hosts.
+
+The coordinator hands out the campaign config and ranges of seeds, and collects what the workers
+report: pass/fail counts, failures with their divergence signatures, and metrics. Workers run the
+usual generate/execute/compare pipeline of fuzzer.py, one test per seed of the ranges they lease.
+
+Everything is JSON over plain HTTP:
+
+    POST /register  {"host_id"}                   -> {"worker", "config"}
+    POST /lease     {"worker"}                    -> {"start", "end"}, {"retry": seconds} while no seeds are left but
+                                                     ranges are still leased, or {} when the campaign is done
+    POST /report    {"worker", "status", "done"}  -> {}       done: the ranges whose tests were all executed
+    GET  /status                                  -> aggregated status, see Coordinator.status
+
+Several workers on one host are fine, the host_id of each fuzzer process is unique.
+"""
+import json, time, threading, collections, statistics
+import socketserver
+import urllib.request
+from datetime import datetime
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    """ http.server.ThreadingHTTPServer, which is only available from python 3.7 on """
+    daemon_threads = True
+
+
+class Coordinator(object):
+
+    def __init__(self, campaign=None, range_size=100, max_tests=None, lease_timeout=3600, info=None,
+                 address=("localhost", 0), retry_interval=10):
+        """
+        address       ... (host, port) to listen on, port 0 picks a free port
+        campaign      ... the config handed out to workers, see fuzzer.Config.campaign
+        range_size    ... number of seeds per lease
+        max_tests     ... total number of seeds to hand out, None = no limit
+        lease_timeout ... seconds after which the range of an unresponsive worker is handed out again
+        retry_interval .. seconds a worker waits before asking again, while all seeds are handed out but
+                          ranges are still leased, which may expire
+        """
+        self.campaign = campaign or {}
+        self.range_size = range_size
+        self.max_tests = max_tests
+        self.lease_timeout = lease_timeout
+        self.retry_interval = retry_interval
+        self.info = info or []
+        self.address = address
+        self.start_time = time.time()
+
+        # worker id -> {host_id, last_seen, status, leases}
+        self.workers = collections.OrderedDict()
+        # (start, end) -> (worker id, time leased)
+        self.leases = {}
+        self._next_seed = 0
+        self._lock = threading.Lock()
+        self.server = None
+
+    def register(self, request):
+        with self._lock:
+            worker = "w%d" % len(self.workers)
+            self.workers[worker] = {"host_id": request.get("host_id"), "last_seen": time.time(),
+                                    "status": {}, "leases": 0}
+        logger.info("Registered worker %s (%s)" % (worker, request.get("host_id")))
+        return {"worker": worker, "config": self.campaign}
+
+    def lease(self, request):
+        worker = request["worker"]
+        with self._lock:
+            self.workers[worker]["last_seen"] = time.time()
+            # first hand out ranges which were leased by workers that went away
+            expired = [r for r, (w, t) in self.leases.items() if time.time() - t > self.lease_timeout]
+            if expired:
+                (start, end) = min(expired)
+                logger.warning("Lease %d-%d of worker %s expired" % (start, end, self.leases[(start, end)][0]))
+            elif self.max_tests is None or self._next_seed < self.max_tests:
+                start = self._next_seed
+                end = start + self.range_size
+                if self.max_tests is not None:
+                    end = min(end, self.max_tests)
+                self._next_seed = end
+            elif self.leases:
+                # the holder of a lease may still go away, keep the worker around to take over the range
+                return {"retry": self.retry_interval}
+            else:
+                return {}
+            self.leases[(start, end)] = (worker, time.time())
+            self.workers[worker]["leases"] += 1
+        return {"start": start, "end": end}
+
+    def report(self, request):
+        worker = request["worker"]
+        with self._lock:
+            self.workers[worker]["last_seen"] = time.time()
+            self.workers[worker]["status"] = request.get("status") or {}
+            for done in request.get("done") or []:
+                done = tuple(done)
+                # a late report of a worker whose lease expired must not release the new owner's lease
+                if done in self.leases and self.leases[done][0] == worker:
+                    del self.leases[done]
+        return {}
+
+    def status(self):
+        """ The aggregated status of all workers, in the same format as TestExecutor.status, plus the
+        per-worker status and a count of failures per divergence signature
+        """
+        with self._lock:
+            statuses = [(w, info["status"]) for w, info in self.workers.items() if info["status"]]
+            workers = {w: {"host_id": info["host_id"],
+                           "last_seen": int(time.time() - info["last_seen"]),
+                           "leases": info["leases"],
+                           "pass": info["status"].get("pass", 0),
+                           "fail": info["status"].get("fail", 0),
+                           "speed": info["status"].get("speed", 0)}
+                       for w, info in self.workers.items()}
+            leased = len(self.leases)
+
+        def numbers(key):
+            return [s[key] for (w, s) in statuses if isinstance(s.get(key), (int, float))]
+
+        failures = []
+        for (w, s) in statuses:
+            failures.extend(dict(f, worker=w) for f in s.get("failures", []))
+        passes, fails = sum(numbers("pass")), sum(numbers("fail"))
+
+        return {
+            "starttime": datetime.utcfromtimestamp(self.start_time).strftime('%Y-%m-%d %H:%M:%S'),
+            "pass": passes,
+            "fail": fails,
+            "failures": failures,
+            "speed": (passes + fails) / (time.time() - self.start_time),
+            "mean": statistics.mean(numbers("mean")) if numbers("mean") else "NA",
+            "stdev": "NA",
+            "numZero": sum(numbers("numZero")),
+            "max": max(numbers("max")) if numbers("max") else "NA",
+            "maxDepth": max(numbers("maxDepth")) if numbers("maxDepth") else "NA",
+            "numConst": statistics.mean(numbers("numConst")) if numbers("numConst") else "NA",
+            "activeSockets": sum(numbers("activeSockets")),
+            "activeTests": sum(numbers("activeTests")),
+            "requeued": sum(numbers("requeued")),
+            "health": {"%s/%s" % (w, client): h for (w, s) in statuses for client, h in s.get("health", {}).items()},
+            "workers": workers,
+            "signatures": dict(collections.Counter(f.get("signature") for f in failures)),
+            "seeds": {"next": self._next_seed, "leased": leased, "max": self.max_tests},
+        }
+
+    def _handler(self):
+        coordinator = self
+        routes = {"/register": self.register, "/lease": self.lease, "/report": self.report}
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def _reply(self, code, obj):
+                body = json.dumps(obj).encode("utf-8")
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path == "/status":
+                    return self._reply(200, coordinator.status())
+                self._reply(404, {"error": "not found"})
+
+            def do_POST(self):
+                if self.path not in routes:
+                    return self._reply(404, {"error": "not found"})
+                length = int(self.headers.get("Content-Length", 0))
+                try:
+                    request = json.loads(self.rfile.read(length).decode("utf-8") or "{}")
+                    self._reply(200, routes[self.path](request))
+                except (ValueError, KeyError) as e:
+                    self._reply(400, {"error": str(e)})
+
+            def log_message(self, fmt, *args):
+                logger.debug("%s - %s" % (self.address_string(), fmt % args))
+
+        return Handler
+
+    def start(self):
+        """ Starts serving in a background thread, returns the (host, port) the server listens on """
+        self.server = ThreadingHTTPServer(self.address, self._handler())
+        self.address = self.server.server_address[:2]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        logger.info("Coordinator listening on %s:%d" % self.address)
+        return self.address
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def serve(self):
+        self.start()
+        try:
+            while True:
+                time.sleep(90)
+                status = self.status()
+                logger.info("workers: %d, pass: %d, fail: %d, speed: %f tests/s, signatures: %r" % (
+                    len(status["workers"]), status["pass"], status["fail"], status["speed"], status["signatures"]))
+        finally:
+            self.stop()
+
+
+class Worker(object):
+
+    def __init__(self, url, host_id, timeout=30):
+        self.url = url.rstrip("/")
+        if "://" not in self.url:
+            self.url = "http://%s" % self.url
+        self.host_id = host_id
+        self.timeout = timeout
+        self.id = None
+        self._lock = threading.Lock()
+        # leased range -> number of its tests not executed yet
+        self._pending = {}
+        # ranges whose tests were all executed, reported with the next report()
+        self._completed = []
+
+    def _call(self, path, request=None):
+        data = json.dumps(request).encode("utf-8") if request is not None else None
+        req = urllib.request.Request(self.url + path, data=data, headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(req, timeout=self.timeout) as response:
+            return json.loads(response.read().decode("utf-8"))
+
+    def register(self):
+        """ Registers with the coordinator, returns the campaign config """
+        reply = self._call("/register", {"host_id": self.host_id})
+        self.id = reply["worker"]
+        logger.info("Registered with coordinator %s as %s" % (self.url, self.id))
+        return reply["config"]
+
+    def lease(self):
+        """ Returns the next (start, end) range of seeds, the number of seconds to wait before asking again
+        while other ranges are still leased, or None if the campaign is done
+        """
+        reply = self._call("/lease", {"worker": self.id})
+        if not reply:
+            return None
+        if "retry" in reply:
+            return reply["retry"]
+        return (reply["start"], reply["end"])
+
+    def report(self, status):
+        """ Reports the status, and the ranges completed since the last report """
+        with self._lock:
+            (done, self._completed) = (self._completed, [])
+        self._call("/report", {"worker": self.id, "status": status, "done": done})
+
+    def finished(self, seed):
+        """ Marks the test of seed as executed. Once all tests of a range are, the range is done """
+        with self._lock:
+            for (start, end), pending in self._pending.items():
+                if start <= seed < end:
+                    if pending > 1:
+                        self._pending[(start, end)] = pending - 1
+                    else:
+                        del self._pending[(start, end)]
+                        self._completed.append((start, end))
+                    return
+
+    def status(self):
+        return self._call("/status")
+
+    def ranges(self, status):
+        """ Yields leased ranges until the campaign is done. Before every lease the result of
+        status() is reported, along with the ranges completed meanwhile, see finished()
+        """
+        while True:
+            self.report(status())
+            lease = self.lease()
+            if lease is None:
+                return
+            if not isinstance(lease, tuple):
+                time.sleep(lease)
+                continue
+            logger.info("Leased seeds %d-%d" % lease)
+            with self._lock:
+                if lease[1] > lease[0]:
+                    self._pending[lease] = lease[1] - lease[0]
+                else:
+                    self._completed.append(lease)
+            yield lease
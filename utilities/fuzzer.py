@@ -4,7 +4,8 @@
 Executes state tests on multiple clients, checking for EVM trace equivalence
 
 """
-import json, sys, os, time, collections, shutil
+import json, sys, os, time, collections, shutil, statistics
+import pickle, zlib
 import configparser, getpass
 import signal
 import argparse, queue, threading
@@ -13,7 +14,9 @@ import docker
 import logging
 
 from evmlab import vm as VMUtils
+import distributed
 from evmlab.tools.statetests.templates import statetest
+from evmlab.tools.statetests.corpus import Corpus
 
 logger = logging.getLogger(__name__)
 
@@ -57,6 +60,7 @@ class Config(object):
         uname = getpass.getuser()
         if uname not in self._config.sections():
             uname = "DEFAULT"
+        self.section = uname
 
         # A list of clients-tuples: name , isDocker, path
         self.active_clients = []
@@ -68,9 +72,6 @@ class Config(object):
             if key in self._config[uname]:
                 self.active_clients.append((c, True, self._config[uname][key]))
 
-
-        self.fork_config = self._config.get(uname, 'fork_config', fallback="")
-
         def resolve(path):
             path = path.strip()
             path = os.path.expanduser(path)
@@ -92,30 +93,27 @@ class Config(object):
             if value is not None:
                 self._config.set(uname, arg, str(value))
 
-        for override in self.cmdline_args.set_config:
-            if "=" not in override:
-                logger.warning("skipping config override (format error): %s"%override)
-                continue
-            key, value = override.strip().split("=",1)
-            section, key = key.strip().split(".",1)
-
-            logger.info("overriding: [%s] %s=%s"%(section, key,value))
-            self._config.set(section.strip(), key.strip(), value.strip())
-
+        self.override(self.cmdline_args.set_config)
 
+        # campaign checkpoints, see TestExecutor.checkpoint
+        self.checkpoint_file = resolve(self._config.get(uname, 'checkpoint',
+                                                        fallback=os.path.join(self.artefacts, "campaign.checkpoint")))
+        self.checkpoint_interval = self._config.getint(uname, 'checkpoint_interval', fallback=300)
 
         self.force_save = self._config.get(uname, 'force_save', fallback=False)
         self.enable_reporting = self._config.get(uname, 'enable_reporting', fallback=False)
         self.docker_force_update_image = self._config.get(uname, 'docker_force_update_image', fallback=None)
 
-        # expose default section
-        self.default = self._config[uname]
+        # distributed mode, see distributed.py
+        self.coordinator = self._config.get(uname, 'coordinator', fallback=None)
+        self.worker = None
 
-        # expose all the codegen settings
-        self.codegen = self._config["codegen"] if self._config.has_section("codegen") else None
-
-        # expose all statetest settings
-        self.statetest = self._config["statetest"] if self._config.has_section("statetest") else None
+        # pre-generated tests, see evmlab/tools/statetests/corpus.py. the seeds of a campaign are corpus indexes
+        self.corpus = self._config.get(uname, 'corpus', fallback=None)
+        if self.corpus is not None:
+            self.corpus = resolve(self.corpus)
+        (start, _, end) = self._config.get(uname, 'corpus_range', fallback="").partition(":")
+        self.corpus_range = (int(start or 0), int(end) if end else None)
 
         ## --- init ---
         logger.info("config: using default: %s" % uname)
@@ -131,6 +129,57 @@ class Config(object):
         os.makedirs(self.testfilesPath, exist_ok=True)
         os.makedirs(self.logfilesPath, exist_ok=True)
 
+    def _expose(self):
+        self.fork_config = self._config.get(self.section, 'fork_config', fallback="")
+        # fork_config may list several forks, which are all executed from the same testfile
+        self.forks = [f.strip() for f in self.fork_config.split(",") if f.strip()]
+        if not self.forks:
+            raise ValueError("fork_config in [%s] names no fork" % self.section)
+
+        # expose default section
+        self.default = self._config[self.section]
+
+        # expose all the codegen settings
+        self.codegen = self._config["codegen"] if self._config.has_section("codegen") else None
+
+        # expose all statetest settings
+        self.statetest = self._config["statetest"] if self._config.has_section("statetest") else None
+
+        # expose the daemon health monitoring settings
+        self.health = self._config["health"] if self._config.has_section("health") else None
+
+    def override(self, overrides):
+        """ Applies a list of '<section>.<key>=<value>' settings """
+        for override in overrides:
+            if "=" not in override:
+                logger.warning("skipping config override (format error): %s"%override)
+                continue
+            key, value = override.strip().split("=",1)
+            section, key = key.strip().split(".",1)
+
+            logger.info("overriding: [%s] %s=%s"%(section, key,value))
+            self._config.set(section.strip(), key.strip(), value.strip())
+
+        self._expose()
+
+    def campaign(self):
+        """ The settings a coordinator hands out to its workers: everything which affects what tests
+        are generated and how they are executed, but nothing host specific (paths, docker images)
+        """
+        return {
+            "fork_config": self.fork_config,
+            "sections": {section: dict(self._config._sections.get(section, {}))
+                         for section in ("statetest", "codegen", "health")},
+        }
+
+    def applyCampaign(self, campaign):
+        overrides = ["%s.fork_config=%s" % (self.section, campaign["fork_config"])]
+        for section, values in campaign["sections"].items():
+            if not self._config.has_section(section):
+                self._config.add_section(section)
+            overrides.extend("%s.%s=%s" % (section, key, value) for key, value in values.items())
+        self.override(overrides)
+
     @property
     def testfilesPath(self):
         return "%s/testfiles/" % self.temp_path
@@ -150,12 +199,16 @@ class Config(object):
         for (name, isDocker, path) in self.active_clients:
             out.append("  * {} : {} docker:{}".format(name, path, isDocker))
 
-        out.append("Test generator: native (py)")
+        if self.corpus:
+            out.append("Test generator: corpus %s [%d:%s]" % (self.corpus, self.corpus_range[0], self.corpus_range[1] or ""))
+        else:
+            out.append("Test generator: native (py)")
         out.append("Fork config:   %s" % self.fork_config)
         out.append("Artefacts:     %s" % self.artefacts)
         out.append("Tempfiles:     %s" % self.temp_path)
         out.append("Log path:      %s" % self.logfilesPath)
         out.append("Test files:    %s" % self.testfilesPath)
+        out.append("Checkpoint:    %s" % self.checkpoint_file)
         return out
 
 
@@ -170,6 +223,29 @@ class RawStateTest(object):
         self.traceFiles = []
         self.additionalArtefacts = []
         self._config = config
+        self.socketEvent = ""
+        self.socketData = b''
+        # client name -> reason, for every client whose execution of this test failed
+        self.clientErrors = {}
+        # client name -> seconds from starting the processes until the client's process exited
+        self.latencies = {}
+        self.startTime = None
+        # health monitor generation the test was started in, see HealthMonitor.recycle
+        self.generation = 0
+        self.retries = 0
+        # set for failing tests, see Fuzzer.divergenceSignature
+        self.signature = None
+
+    def reset(self):
+        """ Forget the results of a previous execution, so the test can be executed again """
+        self.canon_traces = []
+        self.procs = []
+        self.traceFiles = []
+        self.socketEvent = ""
+        self.socketData = b''
+        self.clientErrors = {}
+        self.latencies = {}
+        self.startTime = None
 
     @property
     def filename(self):
@@ -179,6 +255,12 @@ class RawStateTest(object):
     def id(self):
         return self.identifier
 
+    @property
+    def forks(self):
+        """ The forks of the post-section, in the order the clients execute them """
+        body = list(self.statetest.values())[0]
+        return list(body.get('post', {}).keys())
+
     @property
     def fullfilename(self):
         return os.path.abspath("%s/%s" % (self._config.testfilesPath, self.filename))
@@ -247,6 +329,7 @@ class RawStateTest(object):
             "file": self.filename,
             "traces": [os.path.basename(f) for f in self.traceFiles],
             "other": [os.path.basename(f) for f in self.additionalArtefacts],
+            "signature": self.signature,
         }
 
 
@@ -257,19 +340,26 @@ class StateTest(RawStateTest):
 
     def __init__(self, statetest, counter, config, overwriteFork=True):
         self.number = None
+        # the seed (or corpus index) of the test
+        self.counter = counter
         identifier = "%s-%d" %(config.host_id, counter)
         filename = "%s-test.json" % identifier
         super().__init__(statetest, identifier, filename, config=config)
 
+        if statetest is None:
+            # filled straight into the file from the template, see fill()
+            return
 
         if overwriteFork and "Byzantium" in statetest['randomStatetest']['post'].keys():
-            # Replace the fork with what we are currently configured for
+            # Replace the fork with what we are currently configured for. With several forks configured,
+            # the same post-state is used for all of them, so one execution covers every fork
             postState = statetest['randomStatetest']['post'].pop('Byzantium')
-            statetest['randomStatetest']['post'][self._config.fork_config] = postState
+            for fork in self._config.forks:
+                statetest['randomStatetest']['post'][fork] = postState
 
 
             # Replace the top level name 'randomStatetest' with something meaningful (same as filename)
-        statetest['randomStatetest%s' % self.identifier] = statetest.pop('randomStatetest', None)
+        statetest[self.name] = statetest.pop('randomStatetest', None)
 
         self.statetest = statetest
         self.canon_traces = []
@@ -277,20 +367,261 @@ class StateTest(RawStateTest):
         self.traceFiles = []
         self.additionalArtefacts = []
 
+    @property
+    def name(self):
+        return "randomStatetest%s" % self.identifier
+
+    @property
+    def forks(self):
+        if self.statetest is None:
+            return list(self._config.forks)
+        return super().forks
+
+    def fill(self, template):
+        """ Fills the template straight into the test file, the test is never materialized as object """
+        template.fill_to_file(self.fullfilename, name=self.name, forks=self._config.forks)
+
+
+class RecordTest(StateTest):
+    """ A statetest given as json bytes ({name: test}), e.g. a corpus record, which is written to the test file
+    as it is. Only the name and the post section are decoded: the test is renamed, and a 'Byzantium' post-state
+    is applied to the configured forks, as StateTest does
+    """
+
+    def __init__(self, data, counter, config):
+        super().__init__(None, counter, config=config)
+        (self._data, self._forks) = self._prepare(data)
+
+    def _prepare(self, data):
+        text = data.decode("utf-8")
+        decoder = json.JSONDecoder()
+
+        name_start = text.index('"')
+        (_, name_end) = decoder.raw_decode(text, name_start)
+        post_key = text.index('"post"', name_end)
+        post_start = text.index(':', post_key + len('"post"')) + 1
+        while text[post_start] in " \t\r\n":
+            post_start += 1
+        (post, post_end) = decoder.raw_decode(text, post_start)
+
+        if "Byzantium" in post and list(post) != self._config.forks:
+            postState = post.pop("Byzantium")
+            for fork in self._config.forks:
+                post[fork] = postState
+            post_json = json.dumps(post)
+        else:
+            post_json = text[post_start:post_end]
+        data = "".join((text[:name_start], json.dumps(self.name), text[name_end:post_start],
+                        post_json, text[post_end:]))
+        return (data.encode("utf-8"), list(post))
+
+    @property
+    def forks(self):
+        return list(self._forks)
+
+    @property
+    def data(self):
+        return self._data
+
+    def writeToFile(self):
+        logger.debug("Writing file %s" % self.fullfilename)
+        with open(self.fullfilename, 'wb') as outfile:
+            outfile.write(self._data)
+
+
+class ClientHealth(object):
+    """ Rolling execution statistics for one client daemon, since it was last (re)started """
+
+    def __init__(self, name, window):
+        self.name = name
+        self.window = window
+        self.recycles = 0
+        self.reset()
+
+    def reset(self):
+        # True for every failed execution
+        self.outcomes = collections.deque([], self.window)
+        # latencies of the first executions after (re)start, and of the most recent ones
+        self.baseline = []
+        self.latencies = collections.deque([], self.window)
+        self.memory = None
+        self.started = time.time()
+
+    def record(self, latency, error):
+        self.outcomes.append(error)
+        if error or latency is None:
+            return
+        if len(self.baseline) < self.window:
+            self.baseline.append(latency)
+        else:
+            self.latencies.append(latency)
+
+    @property
+    def errorRate(self):
+        """ The error rate over the last window executions, or None if there aren't that many yet """
+        if len(self.outcomes) < self.window:
+            return None
+        return sum(self.outcomes) / len(self.outcomes)
+
+    @property
+    def latencyDrift(self):
+        """ The mean latency of the last window executions, relative to the mean latency right
+        after the daemon was started. None if there aren't enough executions yet
+        """
+        if len(self.latencies) < self.window:
+            return None
+        return statistics.mean(self.latencies) / max(statistics.mean(self.baseline), 1e-6)
+
+    def status(self):
+        return {
+            "errorRate": self.errorRate if self.errorRate is not None else "NA",
+            "latencyDrift": self.latencyDrift if self.latencyDrift is not None else "NA",
+            "memory": self.memory if self.memory is not None else "NA",
+            "recycles": self.recycles,
+            "uptime": int(time.time() - self.started),
+        }
+
+
+class HealthMonitor(object):
+    """ Keeps track of the health of each client daemon, and recycles a daemon (kill + restart) when
+    it degrades: too many failed executions, latency drifting away from what it was right after
+    start, or too much memory used. Recycling happens in a background thread; meanwhile the executor
+    holds off starting new tests, and re-queues the tests which were running while it happened.
+
+    Settings go into the [health] section of the config:
+
+        window = 200            number of executions per client the rates are computed over
+        max_error_rate = 0.05   failed executions / window
+        max_latency_drift = 3.0 mean latency of the last window / mean latency after start
+        max_memory_mb = 0       memory usage of the container, 0 = don't check
+        check_interval = 60     seconds between memory checks
+
+    """
+    RESTART_ATTEMPTS = 5
+
+    def __init__(self, fuzzer):
+        self._fuzzer = fuzzer
+        section = fuzzer._config.health
+
+        def get(key, default):
+            return section.getfloat(key, default) if section is not None else default
+
+        self.window = int(get("window", 200))
+        self.max_error_rate = get("max_error_rate", 0.05)
+        self.max_latency_drift = get("max_latency_drift", 3.0)
+        self.max_memory_mb = get("max_memory_mb", 0)
+        self.check_interval = get("check_interval", 60)
+
+        self.clients = {name: ClientHealth(name, self.window) for name in fuzzer._config.clientNames}
+        # bumped on every recycle; tests started in an older generation may have been cut short
+        self.generation = 0
+        self._recycling = set()
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._ready.set()
+        self._next_memory_check = time.time() + self.check_interval
+
+    def record(self, test):
+        """ Records the outcome of each client's execution of the test, and checks the limits """
+        for name, client in self.clients.items():
+            client.record(test.latencies.get(name), name in test.clientErrors)
+        self.check()
+
+    def check(self):
+        for name, client in self.clients.items():
+            if name in self._recycling:
+                continue
+            errorRate, drift = client.errorRate, client.latencyDrift
+            if errorRate is not None and errorRate > self.max_error_rate:
+                self.recycle(name, "error rate %.03f" % errorRate)
+            elif drift is not None and drift > self.max_latency_drift:
+                self.recycle(name, "latency drift %.02f" % drift)
+
+        if self.max_memory_mb and time.time() > self._next_memory_check:
+            self._next_memory_check = time.time() + self.check_interval
+            # docker stats take a second or two, don't hold up the executor
+            threading.Thread(target=self._checkMemory, daemon=True).start()
+
+    def _checkMemory(self):
+        for name, client in self.clients.items():
+            try:
+                stats = self._fuzzer._dockerclient.containers.get(name).stats(stream=False)
+                client.memory = stats["memory_stats"].get("usage", 0) / (1024 * 1024)
+            except Exception as e:
+                logger.warning("Could not get memory stats for %s: %s", name, e)
+                continue
+            if client.memory > self.max_memory_mb:
+                self.recycle(name, "memory usage %d MB" % client.memory)
+
+    def recycle(self, name, reason):
+        """ Starts recycling the daemon in the background. Returns False if it already is """
+        with self._lock:
+            if name in self._recycling:
+                return False
+            self._recycling.add(name)
+            self.generation = self.generation + 1
+            self._ready.clear()
+
+        logger.warning("Recycling daemon %s: %s", name, reason)
+        threading.Thread(target=self._recycle, args=(name,), daemon=True).start()
+        return True
+
+    def _recycle(self, name):
+        images = {client_name: cmd for (client_name, isDocker, cmd) in self._fuzzer._config.active_clients if isDocker}
+        try:
+            if name not in images:
+                logger.warning("Not a docker client %s, can't recycle", name)
+                return
+            self._fuzzer.kill_daemon(name)
+            for attempt in range(HealthMonitor.RESTART_ATTEMPTS):
+                try:
+                    self._fuzzer.start_daemon(name, images[name])
+                    break
+                except docker.errors.APIError as e:
+                    # the old container may still be in the process of being removed
+                    logger.warning("Restarting daemon %s failed (attempt %d): %s", name, attempt + 1, e)
+                    time.sleep(2)
+            else:
+                logger.error("Could not restart daemon %s", name)
+        finally:
+            self.clients[name].reset()
+            self.clients[name].recycles = self.clients[name].recycles + 1
+            with self._lock:
+                self._recycling.discard(name)
+                if not self._recycling:
+                    self._ready.set()
+
+    def wait(self):
+        """ Blocks while any daemon is being recycled """
+        self._ready.wait()
+
+    def status(self):
+        return {name: client.status() for name, client in self.clients.items()}
+
 
 class TestExecutor(object):
 
+    # how many times a test is re-queued before giving up on it
+    MAX_RETRIES = 3
+    CHECKPOINT_VERSION = 1
+
     def __init__(self, fuzzer):
         self._fuzzer = fuzzer
+        self._health = HealthMonitor(fuzzer)
+        # tests to execute again, before taking new ones from the generator
+        self._requeued = collections.deque()
         self.stats = {
             "pass_count": 0,
             "fail_count": 0,
             "start_time": time.time(),
             "total_count": 0,
+            "requeue_count": 0,
             "num_active_tests": 0,
             "num_active_sockets": 0,
         }
         self.failures = []
+        # campaign time before the last resume, so the speed stays continuous
+        self._elapsed = 0
         self.traceLengths = collections.deque([], 100)
         self.traceDepths = collections.deque([], 100)
         self.traceConstantinopleOps = collections.deque([], 100)
@@ -316,11 +647,74 @@ class TestExecutor(object):
     def testsPerSecond(self):
         return self.numTotals() / (time.time() - self.stats["start_time"])
 
+    def checkpoint(self, filename=None):
+        """ Writes the campaign state to a compressed file. The previous checkpoint is only replaced
+        once the new one has been written completely.
+        Tests which are running or queued at the time of the checkpoint are saved with it, and run again on resume().
+        """
+        filename = filename or self._fuzzer._config.checkpoint_file
+        state = {
+            "version": TestExecutor.CHECKPOINT_VERSION,
+            "stats": dict(self.stats, elapsed=time.time() - self.stats["start_time"]),
+            "failures": self.failures,
+            "traceLengths": list(self.traceLengths),
+            "traceDepths": list(self.traceDepths),
+            "traceConstantinopleOps": list(self.traceConstantinopleOps),
+            "fuzzer": self._fuzzer.getstate(),
+        }
+        tmpfile = "%s.tmp" % filename
+        with open(tmpfile, "wb") as f:
+            f.write(zlib.compress(pickle.dumps(state), 9))
+        os.replace(tmpfile, filename)
+        logger.info("Saved checkpoint %s (%d tests)" % (filename, self.numTotals()))
+
+    def resume(self, filename=None):
+        """ Continues the campaign from a checkpoint written by checkpoint() """
+        filename = filename or self._fuzzer._config.checkpoint_file
+        with open(filename, "rb") as f:
+            state = pickle.loads(zlib.decompress(f.read()))
+        if state.get("version") != TestExecutor.CHECKPOINT_VERSION:
+            raise ValueError("Unsupported checkpoint version %s in %s" % (state.get("version"), filename))
+
+        stats = dict(state["stats"])
+        self._elapsed = stats.pop("elapsed")
+        self.stats.update(stats)
+        self.stats["num_active_tests"] = 0
+        self.stats["num_active_sockets"] = 0
+        self.failures = state["failures"]
+        self.traceLengths.extend(state["traceLengths"])
+        self.traceDepths.extend(state["traceDepths"])
+        self.traceConstantinopleOps.extend(state["traceConstantinopleOps"])
+        self._fuzzer.setstate(state["fuzzer"])
+        self._requeued.extend(self._fuzzer.restore_tests(state["fuzzer"].get("inflight", [])))
+        logger.info("Resuming from checkpoint %s: %d tests, %d failures, %d tests to run again" % (
+            filename, self.numTotals(), self.numFails(), len(self._requeued)))
+
+    def requeue(self, test):
+        if test.retries >= TestExecutor.MAX_RETRIES:
+            logger.warning("Giving up on test %s after %d attempts", test.id, test.retries + 1)
+            test.removeFiles()
+            self._fuzzer.finished(test)
+            return
+        logger.info("Re-queueing test %s (%s)" % (test.id, ", ".join(
+            "%s: %s" % (c, e) for c, e in test.clientErrors.items()) or "daemon recycled"))
+        test.reset()
+        test.retries = test.retries + 1
+        self.stats["requeue_count"] = self.stats["requeue_count"] + 1
+        self._requeued.append(test)
+
     def postprocess_test(self, test, reporting=False):
         # End previous procs
         if test is None:
             return
         data = self._fuzzer.end_processes(test)
+        # If a client failed, or a daemon was recycled while the test was running, the traces can't be trusted
+        affected = bool(test.clientErrors) or test.generation != self._health.generation
+        self._health.record(test)
+        if affected:
+            self.requeue(test)
+            return
+
         if data is not None:
             (traceLength, stats) = data
             self.traceLengths.append(traceLength)
@@ -333,6 +727,7 @@ class TestExecutor(object):
             self.onPass()
         else:
             self.onFail(failingTestcase)
+        self._fuzzer.finished(test)
 
         if reporting:
             # Do some reporting
@@ -341,10 +736,79 @@ class TestExecutor(object):
                 self._fuzzer._total_trace_len / self._fuzzer._num_traces_processed, self._fuzzer._max_trace_len, self._fuzzer._num_zero_traces/self._fuzzer._num_traces_processed
             ))
 
-    def startFuzzing(self):
+    def _tests(self, ranges=None):
+        """ Yields the re-queued tests first, then freshly generated ones """
+        for test in self._fuzzer.generate_tests(ranges):
+            while self._requeued:
+                yield self._requeued.popleft()
+            yield test
+
+    def _start(self, test, poller, active_sockets):
+        # The poll-mask. We listen to everything, except 'ready to write'
+        mask = select.POLLIN | select.POLLPRI | select.POLLERR | select.POLLHUP | select.POLLNVAL
+
+        #test.writeToFile()
+        # Don't start anything on a daemon which is being recycled
+        self._health.wait()
+        test.generation = self._health.generation
+        test.startTime = time.time()
+        # Start new procs
+        self._fuzzer.start_processes(test)
+        self.stats["num_active_tests"] = self.stats["num_active_tests"] + 1
+        self.stats["num_active_sockets"] = len(active_sockets.keys())
+        # Put the new test to the first position
+        test.numprocs = 0
+        # Register the test IO channel with the poller
+        for (proc_info, client_name) in test.procs:
+            socket = proc_info["output"]
+
+            poller.register(socket, mask)
+            # Make a lookup, socket fd-> (test and socket)
+            # The poller returns only the fd, a number, we need to 
+            # remember the actual socket and the test
+            active_sockets[socket.fileno()] = (test, socket, client_name)
+            # Stash the number of processes somewhere
+            test.numprocs = test.numprocs + 1
+
+    def _poll(self, poller, active_sockets):
+        # Check if anyting happened
+        socketlist = poller.poll()
+        for (socketfd, event) in socketlist:
+            # At least one process for this test is finished
+
+            # Stop listeninng to this socket
+            poller.unregister(socketfd)
+            # Find the test
+            (test, socket, client_name) = active_sockets.pop(socketfd)
+            test.latencies[client_name] = time.time() - test.startTime
+            # read it, close it
+            if event & (select.POLLIN| select.POLLPRI):
+                # We don't expect any data here, but we'll take a peek and stash
+                # it just in case
+                data = socket.readall()
+                test.socketData = test.socketData + data
+                if data:
+                    test.clientErrors[client_name] = "docker exec output: %s" % str(data)
+            #Also, we'll save the event, may assist with debugging later
+            test.socketEvent = test.socketEvent + ("[%d]" % event)
+            socket.close()
+            test.numprocs = test.numprocs - 1
+            if test.numprocs == 0:
+                logger.info("All procs finished for test %s" % test.id)
+                self.stats["num_active_tests"] = self.stats["num_active_tests"] - 1
+                self.postprocess_test(test, reporting=self._fuzzer._config.enable_reporting)
+
+    def startFuzzing(self, ranges=None):
+        """ Generates and executes tests. Without ranges, this runs forever. Otherwise only the tests
+        for the given ranges of seeds are executed, see Fuzzer.generate_tests
+        """
         print_stats_every_x_seconds = 90
-        self.stats["start_time"] = time.time()
-        next_stats_print = self.stats["start_time"] + print_stats_every_x_seconds
+        checkpoint_every_x_seconds = self._fuzzer._config.checkpoint_interval
+        self.stats["start_time"] = time.time() - self._elapsed
+        next_stats_print = time.time() + print_stats_every_x_seconds
+        next_checkpoint = time.time() + checkpoint_every_x_seconds
+        # also write a checkpoint when we're being stopped
+        self._fuzzer.checkpointer = self.checkpoint
         # This is the max cap of paralellism, it's just to prevent
         # things going out of hand if tests start piling up
         # We don't expect to actually reach it
@@ -354,59 +818,13 @@ class TestExecutor(object):
         poller = select.poll()
         active_sockets = {}
 
-        # The poll-mask. We listen to everything, except 'ready to write'
-        mask = select.POLLIN | select.POLLPRI | select.POLLERR | select.POLLHUP | select.POLLNVAL
-
-        for test in self._fuzzer.generate_tests():
-            test.socketEvent = ""
-            test.socketData = b''
+        for test in self._tests(ranges):
             if self.stats["num_active_tests"] < MAX_PARALELL:
-                #test.writeToFile()
-                # Start new procs
-                self._fuzzer.start_processes(test)
-                self.stats["num_active_tests"] = self.stats["num_active_tests"] + 1
-                self.stats["num_active_sockets"] = len(active_sockets.keys())
-                # Put the new test to the first position
-                test.numprocs = 0
-                # Register the test IO channel with the poller
-                for (proc_info, client_name) in test.procs:
-                    socket = proc_info["output"]
-
-                    poller.register(socket, mask)
-                    # Make a lookup, socket fd-> (test and socket)
-                    # The poller returns only the fd, a number, we need to 
-                    # remember the actual socket and the test
-                    active_sockets[socket.fileno()] = (test , socket)
-                    # Stash the number of processes somewhere
-                    test.numprocs = test.numprocs + 1
+                self._start(test, poller, active_sockets)
             else:
                 logger.info("Max paralellism hit -- will sleep for a bit")
                 time.sleep(10)
-            # Check if anyting happened
-            socketlist = poller.poll()
-            if len(socketlist) == 0:
-                continue
-            for (socketfd, event) in socketlist:
-                # At least one process for this test is finished
-
-                # Stop listeninng to this socket
-                poller.unregister(socketfd)
-                # Find the test
-                (test, socket) = active_sockets.pop(socketfd)
-                # read it, close it
-                if event & (select.POLLIN| select.POLLPRI):
-                    # We don't expect any data here, but we'll take a peek and stash
-                    # it just in case
-                    data = socket.readall()
-                    test.socketData = test.socketData + data
-                #Also, we'll save the event, may assist with debugging later
-                test.socketEvent = test.socketEvent + ("[%d]" % event)
-                socket.close()
-                test.numprocs = test.numprocs - 1
-                if test.numprocs == 0:
-                    logger.info("All procs finished for test %s" % test.id)
-                    self.stats["num_active_tests"] = self.stats["num_active_tests"] - 1
-                    self.postprocess_test(test, reporting=self._fuzzer._config.enable_reporting)
+            self._poll(poller, active_sockets)
 
             if time.time()> next_stats_print:
                 logger.info("=" * 25)
@@ -415,6 +833,15 @@ class TestExecutor(object):
                 logger.info("=" * 25)
                 next_stats_print = time.time() + print_stats_every_x_seconds
 
+            if checkpoint_every_x_seconds > 0 and time.time() > next_checkpoint:
+                self.checkpoint()
+                next_checkpoint = time.time() + checkpoint_every_x_seconds
+
+        # All tests generated, finish the ones still running (and the ones re-queued meanwhile)
+        while active_sockets or self._requeued:
+            if self._requeued:
+                self._start(self._requeued.popleft(), poller, active_sockets)
+            self._poll(poller, active_sockets)
 
 
     def dry_run(self):
@@ -424,6 +851,7 @@ class TestExecutor(object):
 
         for nr, test in enumerate(self._fuzzer.generate_tests()):
             logger.info("[*] Test #%d: generated statetest: %s"%(nr, test.fullfilename))
+            self._fuzzer.finished(test)
             if nr % stats_after == 0:
                 tdiff = time.time() - tstart
                 tstart = time.time()
@@ -433,6 +861,7 @@ class TestExecutor(object):
     def status(self):
         import collections, statistics
         from datetime import datetime
+        pool = self._fuzzer.statetest_template.prestate_pool
         return {
             "starttime": datetime.utcfromtimestamp(self.stats["start_time"]).strftime('%Y-%m-%d %H:%M:%S'),
             "pass": self.numPass(),
@@ -447,6 +876,9 @@ class TestExecutor(object):
             "numConst": statistics.mean(self.traceConstantinopleOps) if self.traceConstantinopleOps else "NA",
             "activeSockets": self.stats["num_active_sockets"],
             "activeTests": self.stats["num_active_tests"],
+            "requeued": self.stats["requeue_count"],
+            "health": self._health.status(),
+            "prestatePool": pool.status() if pool is not None else None,
         }
 
 
@@ -460,6 +892,15 @@ class Fuzzer(object):
         "hera": VMUtils.HeraVM.canonicalized,
     }
 
+    # splits the output of one execution into subtests, one per fork
+    subtests = {
+        "geth": VMUtils.GethVM.subtests,
+        "cpp": VMUtils.CppVM.subtests,
+        "py": VMUtils.PyVM.subtests,
+        "parity": VMUtils.ParityVM.subtests,
+        "hera": VMUtils.HeraVM.subtests,
+    }
+
     def __init__(self, config=None):
         self._config = config
 
@@ -467,6 +908,14 @@ class Fuzzer(object):
         self._total_trace_len = 0
         self._max_trace_len = 0
         self._num_zero_traces = 0
+        self._test_counter = 0
+        # tests which were generated from the campaign counter, but not executed yet, by counter
+        self._unfinished = collections.OrderedDict()
+
+        # called with no arguments to write a checkpoint on SIGINT, set by the executor
+        self.checkpointer = None
+        # held while the template is filled, so that checkpoints get a consistent template state
+        self._template_lock = threading.RLock()
 
         self._dockerclient = docker.from_env()
 
@@ -490,6 +939,9 @@ class Fuzzer(object):
         self.statetest_template.info.fuzzer = "evmlab tin"
         self.statetest_template.add_precomipled_prestates()
 
+        # tests are read from the corpus instead of being generated, if one is configured
+        self.corpus = Corpus(config.corpus) if config.corpus else None
+
     def docker_remove_image(self, image, force=True):
         self._dockerclient.images.remove(image=image, force=force)
 
@@ -552,40 +1004,124 @@ class Fuzzer(object):
     #   VMUtils.finishProc(VMUtils.startProc(["docker", "kill",clientname]))
 
 
-    def generate_tests(self):
+    def finished(self, test):
+        """ Called by the executor once a test has been executed, or given up on """
+        with self._template_lock:
+            self._unfinished.pop(test.counter, None)
+        worker = self._config.worker
+        if worker is not None:
+            worker.finished(test.counter)
+
+    def generate_tests(self, ranges=None):
         """This method produces json-files, each containing one statetest, with _one_ poststate.
         It stores each test with a filename that is unique per user and per process, so that two
         paralell executions should not interfere with eachother.
 
+        If ranges, an iterable of (start, end) seed ranges, is given, one test is produced per seed,
+        with the RNG seeded at the start of every range. Otherwise tests are produced forever.
+
+        With a corpus configured, the tests are read from the corpus instead, the seeds being the corpus indexes.
+        Without ranges, the tests of the configured corpus_range are produced, and then it stops.
+
         returns (filename, object)
         """
 
         # We'll offload test generation to another thread
         q = queue.Queue(maxsize = 20)
-        def createATest():
-            counter = 0
-            while True:
-                # prestates are reused and regenerated according to the settings in prestate.txto.*, prestate.other.*
-                test_obj = self.statetest_template.fill()
-                s = StateTest(test_obj, counter, config=self._config)
-                ## testing
-                # print(test_obj.keys())
-                # tname = list(test_obj.keys())[0]
-                # for acc in test_obj[tname]["pre"].keys():
-                #     print("account", acc)
-                #     print("account", test_obj[tname]["pre"][acc])
-                # end
 
+        def seeds():
+            if ranges is None:
+                while True:
+                    with self._template_lock:
+                        counter = self._test_counter
+                        self._test_counter = counter + 1
+                    yield counter
+            for (start, end) in ranges:
+                with self._template_lock:
+                    self.statetest_template.source.seed(start)
+                yield from range(start, end)
+
+        def corpusTests():
+            (first, last) = self._config.corpus_range
+            for (start, end) in ranges or [(max(first, self._test_counter), last)]:
+                for (counter, data) in self.corpus.read(start, end):
+                    # the record is written as it is, only its name and post section are replaced
+                    s = RecordTest(data, counter, config=self._config)
+                    s._filename = fPool.get()
+                    s.writeToFile()
+                    if ranges is None:
+                        with self._template_lock:
+                            self._test_counter = counter + 1
+                            self._unfinished[counter] = s
+                    q.put(s, block=True)
+            q.put(None)
+
+        def createATest():
+            for counter in seeds():
+                s = StateTest(None, counter, config=self._config)
                 s._filename = fPool.get()
-                s.writeToFile()
-                counter = counter + 1
+                with self._template_lock:
+                    # prestates are reused and regenerated according to the settings in prestate.txto.*, prestate.other.*
+                    s.fill(self.statetest_template)
+                    if ranges is None:
+                        self._unfinished[counter] = s
                 q.put(s, block=True)
+            q.put(None)
 
-        t = threading.Thread(target=createATest)
+        t = threading.Thread(target=createATest if self.corpus is None else corpusTests)
         t.start()
         # And here, just pop off the queue and yield
         while True:
-            yield q.get()
+            s = q.get()
+            if s is None:
+                return
+            yield s
+
+    def getstate(self):
+        """ Returns the campaign state of the fuzzer: trace statistics, RNG position, template prestates,
+        and the tests which were generated but not executed yet, as (counter, test json)
+        """
+        with self._template_lock:
+            inflight = []
+            for (counter, test) in self._unfinished.items():
+                try:
+                    with open(test.fullfilename, "rb") as f:
+                        inflight.append((counter, f.read()))
+                except FileNotFoundError:
+                    # removed once executed, the test is just being finished
+                    pass
+            return {
+                "num_traces_processed": self._num_traces_processed,
+                "total_trace_len": self._total_trace_len,
+                "max_trace_len": self._max_trace_len,
+                "num_zero_traces": self._num_zero_traces,
+                "test_counter": self._test_counter,
+                "random": statetest.rndval.RandomSeed.get_compressed_random_state(),
+                "template": self.statetest_template.getstate(),
+                "inflight": inflight,
+            }
+
+    def setstate(self, state):
+        with self._template_lock:
+            self._num_traces_processed = state["num_traces_processed"]
+            self._total_trace_len = state["total_trace_len"]
+            self._max_trace_len = state["max_trace_len"]
+            self._num_zero_traces = state["num_zero_traces"]
+            self._test_counter = state["test_counter"]
+            statetest.rndval.RandomSeed.set_compressed_random_state(state["random"])
+            self.statetest_template.setstate(state["template"])
+
+    def restore_tests(self, inflight):
+        """ Returns the tests of the (counter, test json) pairs saved by getstate(), written to test files again """
+        tests = []
+        for (counter, data) in inflight:
+            s = RecordTest(data, counter, config=self._config)
+            s._filename = fPool.get()
+            s.writeToFile()
+            with self._template_lock:
+                self._unfinished[counter] = s
+            tests.append(s)
+        return tests
 
     def benchmark(self, method=None, duration=None):
         counter = 0
@@ -624,14 +1160,15 @@ class Fuzzer(object):
 
         # Process previous traces
 
-        (equivalent, trace_output) = VMUtils.compare_traces(test.canon_traces, self._config.clientNames)
+        (equivalent, trace_output, failing_forks) = self.compare(test)
 
         if equivalent and not forceSave:
             test.removeFiles()
             return None
 
         if not equivalent:
-            logger.warning("CONSENSUS BUG!!!")
+            test.signature = Fuzzer.divergenceSignature(trace_output, failing_forks)
+            logger.warning("CONSENSUS BUG!!! (forks: %s, signature: %s)" % (",".join(failing_forks), test.signature))
 
         trace_summary = self.get_summary(trace_output)
         # save the state-test
@@ -642,6 +1179,46 @@ class Fuzzer(object):
 
         return test
 
+    def compare(self, test):
+        """ Compares the canonical traces of all clients, one subtest (fork) at a time. The subtests of
+        the clients are paired by the fork they name, clients execute the forks in different orders.
+        returns (equivalent, trace_output, failing_forks)
+        """
+        subtests = VMUtils.subtests_by_fork(test.canon_traces, test.forks)
+        equivalent = True
+        trace_output = []
+        failing_forks = []
+        for (fork, traces) in subtests:
+            (fork_equivalent, fork_output) = VMUtils.compare_traces(traces, self._config.clientNames)
+            if len(subtests) > 1:
+                trace_output.append("[--] fork: %s" % fork)
+            trace_output.extend(fork_output)
+            if not fork_equivalent:
+                equivalent = False
+                failing_forks.append(fork)
+
+        return (equivalent, trace_output, failing_forks)
+
+    @staticmethod
+    def divergenceSignature(trace_output, failing_forks):
+        """ Returns a short signature of the first divergence, so that failures with the same root
+        cause can be grouped: the failing forks, and for each diverging client the opcode (or the kind
+        of record, e.g. 'stateRoot') it was at
+        """
+        parts = []
+        for line in trace_output:
+            if not line.startswith("[!!]"):
+                if parts:
+                    break
+                continue
+            (_, client, step) = (line.split(None, 2) + ["", ""])[:3]
+            if step.startswith("pc "):
+                step = step.split()[3].split("(")[0]
+            else:
+                step = step.split(" ")[0] or "END"
+            parts.append("%s:%s" % (client, step))
+        return "%s|%s" % (",".join(failing_forks), ",".join(parts))
+
     def get_summary(self, combined_trace, n=20):
         """Returns (up to) n (default 20) preceding steps before the first diff, and the diff-section
         """
@@ -680,9 +1257,25 @@ class Fuzzer(object):
             else:
                 logger.warning("Undefined client %s", client_name)
 
+    def wait_processes(self, test):
+        """ Blocks until all processes for the given test have exited. Any output written to the
+        process sockets is stashed in test.socketData, same as the poller in TestExecutor does.
+        """
+        test.socketEvent = ""
+        test.socketData = b''
+        for (proc_info, client_name) in test.procs:
+            socket = proc_info["output"]
+            data = socket.readall()
+            test.socketData = test.socketData + data
+            if data:
+                test.clientErrors[client_name] = "docker exec output: %s" % str(data)
+            socket.close()
+
     def end_processes(self, test):
         """ End processes for the given test, slurp up the output and compare the traces
         returns the length of the canon-trace emitted (or -1)
+
+        Each client's canon trace is a list of traces, one for every subtest (fork) executed
         """
         # Handle the old processes
         if test is None:
@@ -705,21 +1298,28 @@ class Fuzzer(object):
             test.storeTrace(client_name, proc_info['cmd'])
             canonicalizer = self.canonicalizers[client_name]
             canon_steps = []
+            canon_trace = []
             filename = test.tempTraceLocation(client_name)
             try:
                 with open(filename) as output:
-                    canon_step_generator = canonicalizer(output)
-                    stat_generator = stats.traceStats(canon_step_generator)
-                    canon_trace = [VMUtils.toText(step) for step in stat_generator]
+                    for (fork, subtest) in self.subtests[client_name](output):
+                        canon_step_generator = canonicalizer(subtest)
+                        stat_generator = stats.traceStats(canon_step_generator)
+                        canon_trace.append((fork, [VMUtils.toText(step) for step in stat_generator]))
             except FileNotFoundError:
                 # We hit these sometimes, maybe twice every million execs or so
                 logger.warning("The file %s could not be found!" % filename)
                 logger.warning("Socket event %s" % test.socketEvent)
                 logger.warning("Socket data %s" %  str(test.socketData))
+                test.clientErrors[client_name] = "trace file missing"
                 #TODO, try to find out what happened -- if there's any output from the process
+            except VMUtils.UnknownForkError as e:
+                # pairing the subtests by position would report false divergences
+                logger.warning("Subtests of %s on test %s: %s" % (client_name, test.id, e))
+                test.clientErrors[client_name] = str(e)
             stats.stop()
             test.canon_traces.append(canon_trace)
-            tracelen = len(canon_trace)
+            tracelen = sum(len(t) for (_, t) in canon_trace)
             self._num_traces_processed += 1
             self._total_trace_len += tracelen
             self._max_trace_len = max(self._max_trace_len, tracelen)
@@ -833,6 +1433,9 @@ def event_str(event):
 
 
 def configFuzzer():
+    """ Parses the commandline and returns the Fuzzer, or the distributed.Coordinator when
+    running as coordinator
+    """
     ### setup logging
     logger.setLevel(logging.DEBUG)
 
@@ -868,6 +1471,29 @@ def configFuzzer():
                                help="Remove specified docker images before starting the fuzzer to force docker to download new versions of the image (default: [])")
     grp_docker = parser.add_argument_group('Docker Settings')
 
+    grp_checkpoint = parser.add_argument_group('Checkpoint and Resume')
+    grp_checkpoint.add_argument("--checkpoint", default=None,
+                                help="Campaign checkpoint file (default: <artefacts>/campaign.checkpoint)")
+    grp_checkpoint.add_argument("--checkpoint-interval", default=None, type=int,
+                                help="Seconds between checkpoints, 0 only writes one on SIGINT (default: 300)")
+    grp_checkpoint.add_argument("--resume", default=None, action="store_true",
+                                help="Continue the campaign from the checkpoint file (default: False)")
+
+    grp_distributed = parser.add_argument_group('Distributed Fuzzing')
+    grp_distributed.add_argument("--coordinator", default=None, metavar="HOST:PORT",
+                                 help="Coordinate a campaign run by workers, listening on HOST:PORT (default: off)")
+    grp_distributed.add_argument("--worker", default=None, metavar="URL",
+                                 help="Run as worker for the coordinator at URL, e.g. http://localhost:8081 (default: off)")
+    grp_distributed.add_argument("--seed-range", default=None, type=int,
+                                 help="Coordinator: number of seeds (tests) per lease (default: 100)")
+    grp_distributed.add_argument("--max-tests", default=None, type=int,
+                                 help="Coordinator: number of tests in the campaign (default: unlimited)")
+
+    grp_corpus = parser.add_argument_group('Pre-generated Tests')
+    grp_corpus.add_argument("--corpus", default=None,
+                            help="Execute the tests of a corpus file (statetests.py -f corpus) instead of generating them (default: off)")
+    grp_corpus.add_argument("--corpus-range", default=None, metavar="START:END",
+                            help="Only execute the corpus tests START..END-1, to shard a corpus across hosts (default: all)")
 
     ### parse args
     args = parser.parse_args()
@@ -879,9 +1505,30 @@ def configFuzzer():
     else:
         parser.error("invalid verbosity selected. please check --help")
 
+    config = Config(args)
+
+    if config.coordinator:
+        # The coordinator doesn't execute tests itself, so there's no Fuzzer (and no docker) needed
+        host, port = config.coordinator.rsplit(":", 1)
+        corpus_size = None
+        if config.corpus:
+            # the seeds handed out are the indexes of the corpus, which the workers have a copy of
+            with Corpus(config.corpus) as corpus:
+                corpus_size = len(corpus)
+        return distributed.Coordinator(campaign=config.campaign(),
+                                       range_size=config.default.getint("seed_range", 100),
+                                       max_tests=config.default.getint("max_tests", None) or corpus_size,
+                                       info=config.info,
+                                       address=(host, int(port)))
+
+    if args.worker:
+        # Workers use the fork config, statetest and codegen settings of the coordinator
+        config.worker = distributed.Worker(args.worker, config.host_id)
+        config.applyCampaign(config.worker.register())
+
     ### create fuzzer instance, pass settings and begin executing tests.
 
-    fuzzer = Fuzzer(config=Config(args))
+    fuzzer = Fuzzer(config=config)
 
     if args.benchmark:
         duration = 10
@@ -911,6 +1558,8 @@ def configFuzzer():
     ### setup signal handler (catches ctrl+c SIGINT)
     def signal_handler(*args, **kwargs):
         logger.warning("SIGINT - Aborting execution. please stand by until the docker instances are shut down.")
+        if fuzzer.checkpointer is not None:
+            fuzzer.checkpointer()
         fuzzer.stop_daemons()
         logger.info("BYE BYE.")
         sys.exit(1)
@@ -924,13 +1573,29 @@ def main():
     # Start all docker daemons that we'll use during the execution
     fuzzer = configFuzzer()
 
+    if isinstance(fuzzer, distributed.Coordinator):
+        fuzzer.serve()
+        return
+
     if fuzzer._config.default.getboolean("dry_run", False):
         logger.warning("--DRY RUN mode-- Tests are just being generated and not being executed!")
         TestExecutor(fuzzer=fuzzer).dry_run()
         return
 
+    executor = TestExecutor(fuzzer=fuzzer)
+    if fuzzer._config.default.getboolean("resume", False):
+        executor.resume()
+
     fuzzer.start_daemons()
-    TestExecutor(fuzzer=fuzzer).startFuzzing()
+    worker = fuzzer._config.worker
+    if worker is None:
+        executor.startFuzzing()
+        return
+
+    executor.startFuzzing(ranges=worker.ranges(executor.status))
+    worker.report(executor.status())
+    logger.info("Campaign done")
+    fuzzer.stop_daemons()
 
 
 if __name__ == '__main__':
@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 # -*- coding: UTF-8 -*-
 
-import fuzzer, sys, os, threading
+import fuzzer, distributed, sys, os, threading
 import logging
 logger = logging.getLogger()
 
@@ -16,11 +16,13 @@ except ImportError:
 
 
 f = fuzzer.configFuzzer()
-executor = fuzzer.TestExecutor(fuzzer=f)
+# As coordinator, the page shows the aggregated status of all workers
+coordinating = isinstance(f, distributed.Coordinator)
+executor = f if coordinating else fuzzer.TestExecutor(fuzzer=f)
  
 @app.route("/")
 def index():
-    return flask.render_template("index.html", status = executor.status(), config = f._config.info)
+    return flask.render_template("index.html", status = executor.status(), config = f.info if coordinating else f._config.info)
 
 @app.route("/download/")
 @app.route("/download/<artefact>")
@@ -51,9 +53,24 @@ def main():
     thread = threading.Thread(target=flaskRunner, args = (host, port))
     thread.start()
 
+    if coordinating:
+        f.serve()
+        return
+
+    if f._config.default.getboolean("resume", False):
+        executor.resume()
+
     # Start all docker daemons that we'll use during the execution
     f.start_daemons()
-    executor.startFuzzing()
+    worker = f._config.worker
+    if worker is None:
+        executor.startFuzzing()
+        return
+
+    executor.startFuzzing(ranges=worker.ranges(executor.status))
+    worker.report(executor.status())
+    logger.info("Campaign done")
+    f.stop_daemons()
 
 
 if __name__ == '__main__':
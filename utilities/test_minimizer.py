@@ -1,126 +1,173 @@
 #!/usr/bin/env python3
 # -*- coding: UTF-8 -*-
 """
-Executes state tests on multiple clients, checking for EVM trace equivalence
+Minimizes a state test which triggers a consensus issue, using delta debugging (ddmin).
+
+All candidate reductions of a ddmin round are executed in parallel on the client daemons, and
+verdicts are cached by test-content hash, so the same candidate is never executed twice.
 
 """
-import json, sys, re, os, subprocess, io, itertools, traceback, time, collections, shutil
+import json, sys, os, copy, hashlib, argparse, itertools
 from evmlab import vm as VMUtils
-from fuzzer import startDaemons, StateTest, start_processes, end_processes, processTraces
-import copy
+from evmlab.reducer import CodeReducer
+from fuzzer import Fuzzer, RawStateTest, Config
 
 import logging
 logger = logging.getLogger()
 logger.setLevel(logging.DEBUG)
 
-def capcode(code):
-    if len(code) > 20000:
-        return code[:-5000]
-    if len(code) > 10000:
-        return code[:-2000]
-    if len(code) > 1000:
-        return code[:-200]
-    if len(code) > 100:
-        return code[:-10]
-    if len(code) > 10:
-        return code[:-4]
-
-    return code[:-2]
-
-
-def mutate(test_obj, counter ):
-    counter = 0
-    original = copy.deepcopy(test_obj)
-    print(test_obj["randomStatetest"]["pre"].keys())
-    accounts = test_obj["randomStatetest"]["pre"]
-    prestate_account_list = list(accounts.keys())
-    print("presetate accounts" , prestate_account_list)
-    print("yielding original")
-    yield(test_obj)
-    for a in prestate_account_list:
-        deleted = accounts.pop(a)
-        print("deleted account ", a)
-        rollback = yield copy.deepcopy(test_obj)
-        if rollback:
-            print("undeleted account ", a)
-            accounts[a] = deleted
-
-    # Done miminizing accounts, let's remove code
-    prestate_account_list = list(accounts.keys())
-    for add, data in accounts.items():
-        code = data["code"]
-        data["code"] = ""
-        print("deleted code for ",add)
-        rollback = yield copy.deepcopy(test_obj)
-        if rollback:
-            print("undeleted code for ", a)
-            data["code"] = code
-
-    # Done miminizing accounts, let's minimize input
-    tx = test_obj["randomStatetest"]["transaction"]
-    if len(tx["data"][0]) > 0:
-        tx["data"][0] = ""
-        rollback = yield copy.deepcopy(test_obj)
-        if rollback:
-            tx["data"][0] = data
-
-    # Done miminizing accounts, let's cap code
-    prestate_account_list = list(accounts.keys())
-    for add, data in accounts.items():
-        if "code" in data.keys():
-            code = data["code"]
-            while True:
-                newcode = capcode(code)
-                if newcode == "":
-                    break
-                data["code"] = newcode
-                print("shortened code for ",add, len(data["code"]))
-                rollback = yield copy.deepcopy(test_obj)
-                if rollback:
-                    print("unshortened code for ",add)
-                    data["code"] = code
-                    break
-                else:
-                    code = newcode
-                    continue
-
-    yield(test_obj)
-        #done
-
-def forkify(test_obj):
-    original = copy.deepcopy(test_obj)
-    postState = test_obj["randomStatetest"]["post"]
-    current_fork = list(postState.keys())[0]
-    triggered_forks = []
-
-    for forkname in ["Frontier", "Homestead", "EIP150","EIP158", "Byzantium", "Constantinople"]:
-        postState[forkname] = postState.pop(current_fork)
-        current_fork = forkname
-        consensus = yield copy.deepcopy(test_obj)
-        if consensus:
-            print("Test did not trigger on", forkname)
-        else:
-            print("Test triggered on", forkname)
-            triggered_forks.append(forkname)
+FORKS = ["Frontier", "Homestead", "EIP150", "EIP158", "Byzantium", "Constantinople"]
+
+
+def split(elements, n):
+    """Splits elements into n chunks of (almost) equal size"""
+    k, m = divmod(len(elements), n)
+    return [elements[i * k + min(i, m):(i + 1) * k + min(i + 1, m)] for i in range(n)]
+
+
+def ddmin(elements, fails, n=2):
+    """Delta debugging: returns a 1-minimal subset of elements for which the test still fails.
+
+    fails(subsets) is handed all candidate subsets of a round at once and returns a list of
+    booleans, so that the caller can execute the candidates in parallel. Out of all failing
+    candidates of a round, the smallest one is picked to continue from.
+    """
+    elements = list(elements)
+    if not elements or fails([[]])[0]:
+        return []
+
+    while len(elements) >= 2:
+        n = min(n, len(elements))
+        chunks = split(elements, n)
+        # with n == 2, the complements are the same as the chunks
+        complements = [[e for c in chunks[:i] + chunks[i + 1:] for e in c] for i in range(n)] if n > 2 else []
+        candidates = chunks + complements
+        failing = [i for i, failed in enumerate(fails(candidates)) if failed]
+
+        if failing:
+            best = min(failing, key=lambda i: len(candidates[i]))
+            # reduced to a chunk -> restart with 2 chunks, reduced to a complement -> one chunk less
+            n = 2 if best < len(chunks) else max(n - 1, 2)
+            elements = candidates[best]
+            continue
+
+        if n >= len(elements):
+            # granularity can't be increased any more, we're done
+            break
+        n = min(len(elements), 2 * n)
+
+    return elements
+
 
+class Minimizer(object):
 
+    # how many times a test on which a client failed is executed again
+    MAX_RETRIES = 3
 
-class Mimizer():
-    def __init__(self):
+    def __init__(self, fuzzer, parallel=8):
+        self._fuzzer = fuzzer
+        self._config = fuzzer._config
+        self.parallel = max(1, parallel)
         self.counter = 0
+        # content hash -> failing forks
+        self.verdicts = {}
+        self.stats = {"executed": 0, "cached": 0}
+
+    @staticmethod
+    def content_hash(test_obj):
+        return hashlib.sha1(json.dumps(test_obj, sort_keys=True).encode("utf-8")).hexdigest()
 
     def isConsensus(self, test_obj):
         """ Returns true if the clients are in consensus over the testcase """
-        self.counter = self.counter +1 
-        test = StateTest(copy.deepcopy(test_obj), self.counter, overwriteFork=False)
-        test.writeToFile()
-        start_processes(test)
-        data = end_processes(test)
-        failingTestcase = processTraces(test, forceSave = False)
-        if failingTestcase is not None:
-            return False
-        return True
+        return self.evaluate([test_obj])[0]
+
+    def failingForks(self, test_obj):
+        """ Returns the forks (of the test's post-section) on which the clients disagree """
+        return self.verdicts[Minimizer.content_hash(test_obj)] if not self.isConsensus(test_obj) else []
+
+    def evaluate(self, test_objs):
+        """ Returns the consensus verdict for each of the given testcases. Testcases which have been
+        seen before are answered from the cache, all others are executed in batches of self.parallel.
+        Testcases on which a client failed are executed again, their verdict is not cached
+        """
+        hashes = [Minimizer.content_hash(t) for t in test_objs]
+        pending = {}
+        for h, test_obj in zip(hashes, test_objs):
+            if h in self.verdicts or h in pending:
+                self.stats["cached"] += 1
+                continue
+            pending[h] = test_obj
+
+        todo = list(pending.items())
+        for _ in range(Minimizer.MAX_RETRIES + 1):
+            errored = []
+            for i in range(0, len(todo), self.parallel):
+                batch = todo[i:i + self.parallel]
+                for (h, test_obj), verdict in zip(batch, self._execute([t for (_, t) in batch])):
+                    if verdict is None:
+                        errored.append((h, test_obj))
+                    else:
+                        self.verdicts[h] = verdict
+            todo = errored
+            if not todo:
+                break
+            logger.info("Executing %d tests again, clients failed on them" % len(todo))
+        if todo:
+            raise RuntimeError("Clients failed on %d tests after %d attempts" % (len(todo), Minimizer.MAX_RETRIES + 1))
+
+        # the cache holds the list of failing forks, consensus means none failed
+        return [not self.verdicts[h] for h in hashes]
+
+    def _execute(self, test_objs):
+        """ Starts the processes for all tests at once, then collects the traces. Returns the failing forks
+        of each test, None for tests on which a client failed
+        """
+        tests = []
+        for test_obj in test_objs:
+            self.counter = self.counter + 1
+            identifier = "%s-min-%d" % (self._config.host_id, self.counter)
+            test = RawStateTest(test_obj, identifier, "%s-test.json" % identifier, self._config)
+            test.writeToFile()
+            self._fuzzer.start_processes(test)
+            tests.append(test)
+
+        verdicts = []
+        for test in tests:
+            self._fuzzer.wait_processes(test)
+            self._fuzzer.end_processes(test)
+            self.stats["executed"] = self.stats["executed"] + 1
+            if test.clientErrors:
+                # missing or incomplete traces, which can't be compared
+                logger.warning("Clients failed on test %s: %s" % (test.id, ", ".join(
+                    "%s: %s" % (c, e) for c, e in test.clientErrors.items())))
+                verdicts.append(None)
+            else:
+                (equivalent, trace_output, failing_forks) = self._fuzzer.compare(test)
+                verdicts.append(failing_forks if not equivalent else [])
+            Minimizer._cleanup(test)
 
+        logger.info("Executed %d tests (total executed: %d, cached: %d)" % (
+            len(tests), self.stats["executed"], self.stats["cached"]))
+        return verdicts
+
+    @staticmethod
+    def _cleanup(test):
+        for f in [test.fullfilename] + test.traceFiles:
+            try:
+                os.remove(f)
+            except FileNotFoundError:
+                pass
+
+    def reduce(self, test_obj, elements, apply):
+        """ Runs ddmin over elements. apply(test_obj, subset) must return a copy of test_obj
+        which only retains the given subset of elements
+        """
+        def fails(subsets):
+            return [not consensus for consensus in self.evaluate([apply(test_obj, s) for s in subsets])]
+
+        keep = ddmin(elements, fails)
+        logger.info("Reduced %d elements to %d" % (len(elements), len(keep)))
+        return apply(test_obj, keep)
 
     def reportResult(self, testcase, typ, path):
         minified = "./%s.%s" % (typ, os.path.basename(path))
@@ -128,64 +175,139 @@ class Mimizer():
             json.dump(testcase, f)
         print("Stored %s" % minified)
 
+    def reduceCode(self, test_obj, address):
+        """ Returns the test with the best code reduction for the given account which still fails,
+        or None if none of the candidate reductions fail
+        """
+        name = list(test_obj.keys())[0]
+        code = test_obj[name]["pre"][address].get("code", "")
+        if code in ("", "0x"):
+            return None
+
+        candidates = CodeReducer(code).candidates()
+        while True:
+            batch = []
+            for (description, newcode) in itertools.islice(candidates, self.parallel):
+                t = copy.deepcopy(test_obj)
+                t[name]["pre"][address]["code"] = newcode
+                batch.append(t)
+            if not batch:
+                return None
+            failing = [t for t, consensus in zip(batch, self.evaluate(batch)) if not consensus]
+            if failing:
+                return min(failing, key=lambda t: len(t[name]["pre"][address]["code"]))
+
+    def minimize(self, test_obj):
+        name = list(test_obj.keys())[0]
+
+        def body(t):
+            return t[name]
+
+        # drop prestate accounts
+        def keep_accounts(t, subset):
+            t = copy.deepcopy(t)
+            pre = body(t)["pre"]
+            body(t)["pre"] = {a: pre[a] for a in pre.keys() if a in subset}
+            return t
+
+        test_obj = self.reduce(test_obj, list(body(test_obj)["pre"].keys()), keep_accounts)
+
+        # drop code
+        def keep_code(t, subset):
+            t = copy.deepcopy(t)
+            for address, account in body(t)["pre"].items():
+                if address not in subset:
+                    account["code"] = ""
+            return t
+
+        with_code = [a for a, acc in body(test_obj)["pre"].items() if acc.get("code", "") not in ("", "0x")]
+        test_obj = self.reduce(test_obj, with_code, keep_code)
+
+        # drop storage slots
+        def keep_storage(t, subset):
+            t = copy.deepcopy(t)
+            for address, account in body(t)["pre"].items():
+                account["storage"] = {k: v for k, v in account.get("storage", {}).items() if (address, k) in subset}
+            return t
+
+        slots = [(a, k) for a, acc in body(test_obj)["pre"].items() for k in acc.get("storage", {}).keys()]
+        test_obj = self.reduce(test_obj, slots, keep_storage)
+
+        # drop tx input
+        def keep_data(t, subset):
+            t = copy.deepcopy(t)
+            data = body(t)["transaction"]["data"]
+            body(t)["transaction"]["data"] = [d if i in subset else "" for i, d in enumerate(data)]
+            return t
+
+        test_obj = self.reduce(test_obj, [i for i, d in enumerate(body(test_obj)["transaction"]["data"]) if d], keep_data)
+
+        # reduce code instruction-wise. Candidates are evaluated in batches of self.parallel, most
+        # promising first; as soon as a batch has a failing candidate, continue from the shortest one
+        for address in list(body(test_obj)["pre"].keys()):
+            while True:
+                reduced = self.reduceCode(test_obj, address)
+                if reduced is None:
+                    break
+                test_obj = reduced
+                logger.info("shortened code for %s to %d" % (address, len(body(test_obj)["pre"][address]["code"])))
+
+        return test_obj
+
+    def forks(self, test_obj):
+        """ Returns the forks on which the test triggers. All forks go into the post-section of a
+        single test, so this is one execution per client
+        """
+        name = list(test_obj.keys())[0]
+        matrix = copy.deepcopy(test_obj)
+        post = matrix[name]["post"]
+        postState = post[list(post.keys())[0]]
+        matrix[name]["post"] = {forkname: postState for forkname in FORKS}
+
+        triggered = []
+        for forkname in self.failingForks(matrix):
+            t = copy.deepcopy(test_obj)
+            t[name]["post"] = {forkname: postState}
+            triggered.append((forkname, t))
+        return triggered
+
     def startMutation(self, test_original, path):
-        counter = 1
-        name =  list(test_original.keys())[0]
-        print("pre", test_original.keys())
-        testcase = {"randomStatetest" : test_original[name]}
-        print("pos", testcase.keys())
-        consensus = self.isConsensus(testcase)
-        if consensus:
+        if self.isConsensus(test_original):
             print("No consensus error triggered!")
             return
-        mutator = mutate(testcase, 0)
-        next(mutator)
-        # First minimize
-        while True:
-            # Roll back incase of consensus
-            try:
-                testcase = mutator.send(consensus)
-                consensus = self.isConsensus(testcase)
-                print("Consensus" , consensus, "count", counter) 
-                counter = counter + 1
-            except StopIteration as e:
-                break
 
+        # First minimize
+        testcase = self.minimize(test_original)
         self.reportResult(testcase, "minified", path)
-        
-        # Then maximise: try different forks
-        forker = forkify(testcase)
-        testcase = next(forker)
-        while True:
-            # Roll back incase of consensus
-            try:
-                testcase = forker.send(consensus)
-                consensus = self.isConsensus(testcase)
-                if not consensus:
-                    # Find out forkname
-                    current_fork = list(testcase["randomStatetest"]["post"].keys())[0]
-                    self.reportResult(testcase, "%s.minified" % current_fork , path)
-                counter = counter + 1
-            except StopIteration as e:
-                break
+        logger.info("Minimized with %d executions (%d cache hits)" % (self.stats["executed"], self.stats["cached"]))
 
-        
+        # Then maximise: try different forks
+        for forkname, t in self.forks(testcase):
+            print("Test triggered on", forkname)
+            self.reportResult(t, "%s.minified" % forkname, path)
 
 
-def main(args):
-    if len(args) < 1:
-        logger.warning("please provide a filename")
-        return
+def main():
+    parser = argparse.ArgumentParser(description='Minimize a statetest which triggers a consensus issue')
+    parser.add_argument("-c", "--configfile", default="statetests.ini",
+                        help="path to configuration file (default: statetests.ini)")
+    parser.add_argument("-s", "--set-config", default=[], nargs='*', help="override settings in ini as <section>.<value>=<value>")
+    parser.add_argument("-j", "--parallel", default=8, type=int,
+                        help="number of candidate tests to execute in parallel (default: 8)")
+    parser.add_argument("testfile", help="statetest (json) to minimize")
+    args = parser.parse_args()
 
-    path = args[0] 
-    testcase = None
-    # Can we read the testfile? 
+    path = args.testfile
+    # Can we read the testfile?
     with open(path, "r") as f:
         testcase = json.load(f)
+
+    fuzzer = Fuzzer(config=Config(args))
     # Start all docker daemons that we'll use during the execution
-    startDaemons()
-    
-    Mimizer().startMutation(testcase, path)
+    fuzzer.start_daemons()
+
+    Minimizer(fuzzer, parallel=args.parallel).startMutation(testcase, path)
+
 
 if __name__ == '__main__':
-    main(sys.argv[1:])
+    main()
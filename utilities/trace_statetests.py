@@ -12,7 +12,6 @@ from ethereum.utils import decode_hex, parse_int_or_hex, sha3, to_string, \
 
 from evmlab import genesis as gen
 from evmlab import vm as VMUtils
-from evmlab import opcodes
 
 import logging
 logger = logging.getLogger()
@@ -89,19 +88,6 @@ def getBaseCmd(bin_or_docker):
 parse_config()
 
 
-# used to check for unknown opcode names in traces
-OPCODES = {}
-op_keys = opcodes.opcodes.keys()
-for op_key in op_keys:
-    if op_key in opcodes.opcodesMetropolis and cfg['FORK_CONFIG'] != 'Byzantium':
-        continue
-    name = opcodes.opcodes[op_key][0]
-    # allow opcode lookups by either name or number assignment
-    OPCODES[name] = op_key
-    OPCODES[op_key] = name
-
-
-
 def iterate_tests(path = '/GeneralStateTests/', ignore = []):
     logging.info (cfg['TESTS_PATH'] + path)
     for subdir, dirs, files in sorted(os.walk(cfg['TESTS_PATH'] + path)):